@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of chunk graph creation (create_relation_between_chunks) on a local Neo4j.
+
+    python chunk_graph_benchmark.py --uri bolt://localhost:7687 --password password --chunks 10000 --batch-sizes 250,1000,5000
+
+Each run creates a Document with synthetic chunks under its own file name, reports
+chunks per second and deletes the nodes afterwards. Do not point it at a database
+holding real data.
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_neo4j import Neo4jGraph
+
+from src.make_relationships import create_relation_between_chunks
+
+
+def make_chunks(file_name, count, chunk_chars):
+    filler = "lorem ipsum dolor sit amet " * (chunk_chars // 27 + 1)
+    return [Document(page_content=f"{file_name} {i} {filler}"[:chunk_chars], metadata={"page_number": i // 10 + 1}) for i in range(count)]
+
+
+def run(graph, chunks_count, chunk_chars, batch_size, repeat):
+    rates = []
+    for _ in range(repeat):
+        file_name = f"benchmark-{uuid.uuid4()}"
+        chunks = make_chunks(file_name, chunks_count, chunk_chars)
+        graph.query("MERGE (:Document {fileName: $f_name})", {"f_name": file_name})
+        try:
+            start = time.perf_counter()
+            create_relation_between_chunks(graph, file_name, chunks, batch_size=batch_size)
+            rates.append(chunks_count / (time.perf_counter() - start))
+        finally:
+            graph.query("""
+                MATCH (d:Document {fileName: $f_name})
+                OPTIONAL MATCH (d)<-[:PART_OF]-(c:Chunk)
+                DETACH DELETE c, d
+            """, {"f_name": file_name})
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--chunks", type=int, default=10000)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--batch-sizes", default="250,1000,5000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    graph = Neo4jGraph(url=args.uri, username=args.user, password=args.password, database=args.database, refresh_schema=False)
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        rates = run(graph, args.chunks, args.chunk_chars, batch_size, args.repeat)
+        print(f"batch size {batch_size:6d}: median {statistics.median(rates):8.0f} chunks/s  min {min(rates):8.0f}  max {max(rates):8.0f}  ({args.repeat} runs of {args.chunks} chunks)")
+
+
+if __name__ == "__main__":
+    main()
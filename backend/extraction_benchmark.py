@@ -0,0 +1,292 @@
+"""
+End-to-end extraction benchmark: runs processing_source on synthetic documents of
+increasing size against a local Neo4j, with the fake LLM and embedding providers, and
+reports chunks per second, per-stage latency and peak RSS.
+
+    python extraction_benchmark.py --uri bolt://localhost:7687 --password password --sizes 1,100,1000,10000
+    python extraction_benchmark.py --password password --output current.json --compare extraction_baseline.json
+
+Each size runs in its own process so peak RSS is per size. Stages:
+
+    chunking             splitting the fixture into chunks
+    relationship_merge   merging the Chunk nodes and their PART_OF / FIRST_CHUNK / NEXT_CHUNK relationships
+    embedding            chunk embeddings, computed and written
+    llm                  entity extraction through the fake model
+    graph_write          entities, their relationships and HAS_ENTITY links, written in one transaction
+    counting             Document node and relationship counters
+
+Embedding and LLM run concurrently, so stage times can add up to more than the wall
+time. Results are written to --output as JSON; --compare prints the change against a
+previous result file and exits with 1 when chunks per second dropped by more than
+--tolerance percent for any size.
+
+Every run writes under its own file name and deletes its chunks, Document and orphaned
+entities afterwards. Do not point it at a database holding real data.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+FAKE_MODEL = "fake_benchmark"
+FIRST_NAMES = ["Alice", "Bruno", "Chen", "Dana", "Emeka", "Farah", "Goran", "Hana", "Ivan", "Julia", "Kofi", "Lena"]
+LAST_NAMES = ["Moreau", "Tanaka", "Okafor", "Silva", "Novak", "Haddad", "Larsen", "Kim", "Rossi", "Mensah"]
+ORGANIZATIONS = ["Acme Robotics", "Blue Harbor Bank", "Northwind Labs", "Orion Health", "Vega Energy", "Summit Foods"]
+PLACES = ["Lisbon", "Osaka", "Nairobi", "Toronto", "Krakow", "Santiago", "Melbourne", "Oslo"]
+TEMPLATES = [
+    "{person} joined {organization} in {place} as head of research.",
+    "{person} met {other} at the {organization} office in {place}.",
+    "{organization} opened a new site in {place} led by {person}.",
+    "{person} and {other} published a report on supply chains for {organization}.",
+    "In {place}, {person} presented the quarterly results of {organization}.",
+]
+STAGES = ("chunking", "relationship_merge", "embedding", "llm", "graph_write", "counting")
+# stage_seconds keys of the processing_source response for each stage
+RESPONSE_STAGES = {"embedding": "embedding", "embedding_write": "embedding", "llm_extraction": "llm", "graph_write": "graph_write", "counting": "counting"}
+
+
+def make_pages(chunks, token_chunk_size, seed):
+    """One page per chunk, each kept under token_chunk_size tokens so every page becomes exactly one chunk."""
+    from langchain_core.documents import Document
+    from src.create_chunks import count_tokens
+
+    rng = random.Random(seed)
+    people = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    pages = []
+    for page in range(chunks):
+        sentences = []
+        while True:
+            sentence = rng.choice(TEMPLATES).format(
+                person=rng.choice(people), other=rng.choice(people),
+                organization=rng.choice(ORGANIZATIONS), place=rng.choice(PLACES),
+            )
+            if count_tokens(" ".join(sentences + [sentence])) > token_chunk_size * 0.9:
+                break
+            sentences.append(sentence)
+        # the page number keeps chunks of repeated sentences distinct
+        pages.append(Document(page_content=f"Page {page + 1}. " + " ".join(sentences), metadata={"page": page}))
+    return pages
+
+
+def cleanup(graph, file_name):
+    graph.query("""
+        MATCH (d:Document {fileName: $file_name})
+        OPTIONAL MATCH (d)<-[:PART_OF]-(c:Chunk)
+        OPTIONAL MATCH (c)-[:HAS_ENTITY]->(e:__Entity__)
+        WITH d, collect(DISTINCT c) AS chunks, collect(DISTINCT e) AS entities
+        FOREACH (chunk IN chunks | DETACH DELETE chunk)
+        DETACH DELETE d
+        WITH entities
+        UNWIND entities AS entity
+        WITH entity WHERE NOT (entity)<-[:HAS_ENTITY]-()
+        DETACH DELETE entity
+    """, {"file_name": file_name})
+
+
+def run_size(args, chunks, seed):
+    """Process one synthetic document of `chunks` chunks in this process and return its measurements."""
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    import src.main as main_module
+    from src.create_chunks import CreateChunksofDocument
+    from src.entities.source_extract_params import SourceScanExtractParams
+    from src.entities.source_node import sourceNode
+    from src.entities.user_credential import Neo4jCredentials
+    from src.graphDB_dataAccess import graphDBdataAccess
+    from src.shared.common_fn import create_graph_database_connection
+
+    timings = {"chunking": 0.0, "chunk_graph": 0.0}
+    iter_chunks = CreateChunksofDocument.iter_chunks
+    create_relation_between_chunks = main_module.create_relation_between_chunks
+
+    def timed_iter_chunks(self, *call_args, **call_kwargs):
+        chunks = iter_chunks(self, *call_args, **call_kwargs)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            timings["chunking"] += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+
+    def timed_create_relation_between_chunks(*call_args, **call_kwargs):
+        start = time.perf_counter()
+        try:
+            return create_relation_between_chunks(*call_args, **call_kwargs)
+        finally:
+            timings["chunk_graph"] += time.perf_counter() - start
+
+    CreateChunksofDocument.iter_chunks = timed_iter_chunks
+    main_module.create_relation_between_chunks = timed_create_relation_between_chunks
+
+    pages = make_pages(chunks, args.token_chunk_size, seed)
+    file_name = f"benchmark-{uuid.uuid4()}.pdf"
+    credentials = Neo4jCredentials(uri=args.uri, userName=args.user, password=args.password, database=args.database, email=None)
+    params = SourceScanExtractParams(
+        model=FAKE_MODEL, file_name=file_name, source_type="local file",
+        token_chunk_size=args.token_chunk_size, chunk_overlap=args.chunk_overlap, chunks_to_combine=args.chunks_to_combine,
+        allowedNodes="", allowedRelationship="", additional_instructions="",
+        embedding_provider="fake", embedding_model=args.embedding_model,
+    )
+    graph = create_graph_database_connection(credentials)
+    source_node = sourceNode()
+    source_node.file_name = file_name
+    source_node.file_type = "pdf"
+    source_node.file_source = "local file"
+    source_node.model = FAKE_MODEL
+    source_node.created_at = datetime.now()
+    graphDBdataAccess(graph).create_source_node(source_node)
+    try:
+        start = time.perf_counter()
+        response = asyncio.run(main_module.processing_source(credentials, params, iter(pages)))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        cleanup(graph, file_name)
+        graph._driver.close()
+
+    stages = dict.fromkeys(STAGES, 0.0)
+    stages["chunking"] = timings["chunking"]
+    # iter_chunks is lazy, so the splitting happens inside create_relation_between_chunks
+    stages["relationship_merge"] = max(timings["chunk_graph"] - timings["chunking"], 0.0)
+    for stage, elapsed in response.get("stage_seconds", {}).items():
+        if stage in RESPONSE_STAGES:
+            stages[RESPONSE_STAGES[stage]] += elapsed
+    total_chunks = response.get("total_chunks") or chunks
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    return {
+        "chunks": total_chunks,
+        "status": response.get("status"),
+        "wall_seconds": round(wall_seconds, 3),
+        "chunks_per_second": round(total_chunks / wall_seconds, 2) if wall_seconds else None,
+        "stages": {stage: round(elapsed, 3) for stage, elapsed in stages.items()},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "node_count": response.get("nodeCount"),
+        "relationship_count": response.get("relationshipCount"),
+        "token_usage": response.get("token_usage"),
+    }
+
+
+def summarize(runs):
+    """Median of each measurement over the repeated runs of one size."""
+    return {
+        "chunks": runs[0]["chunks"],
+        "runs": len(runs),
+        "status": [run["status"] for run in runs],
+        "wall_seconds": round(statistics.median(run["wall_seconds"] for run in runs), 3),
+        "chunks_per_second": round(statistics.median(run["chunks_per_second"] for run in runs), 2),
+        "stages": {stage: round(statistics.median(run["stages"][stage] for run in runs), 3) for stage in STAGES},
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "node_count": runs[0]["node_count"],
+        "relationship_count": runs[0]["relationship_count"],
+        "token_usage": runs[0]["token_usage"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of each size against a baseline result file; return False on a throughput regression."""
+    baseline_by_size = {result["chunks"]: result for result in baseline["results"]}
+    ok = True
+    print(f"\nAgainst {baseline.get('commit', 'baseline')}:")
+    for result in results:
+        previous = baseline_by_size.get(result["chunks"])
+        if previous is None:
+            continue
+        change = (result["chunks_per_second"] - previous["chunks_per_second"]) / previous["chunks_per_second"] * 100
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        stage_changes = "  ".join(
+            f"{stage} {result['stages'][stage] - previous['stages'].get(stage, 0):+.2f}s" for stage in STAGES
+        )
+        print(f"{result['chunks']:6d} chunks: {change:+6.1f}% chunks/s  rss {result['peak_rss_mb'] - previous['peak_rss_mb']:+.1f} MB  {stage_changes}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--sizes", default="1,100,1000,10000", help="Chunk counts of the fixture documents")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--token-chunk-size", type=int, default=200)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--chunks-to-combine", type=int, default=1)
+    parser.add_argument("--fake-model", default="fake,median_ms=200,p99_ms=1000,error_rate=0,output_tokens=200,seed=7",
+                        help="LLM_MODEL_CONFIG_FAKE_* value of the model used for extraction")
+    parser.add_argument("--embedding-model", default="fake-384", choices=["fake-384", "fake-768", "fake-1536"])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="extraction_benchmark.json")
+    parser.add_argument("--compare", help="Result file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed drop of chunks per second in percent")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # inherited by the spawned processes; caches would make repeated runs skip the work being measured
+    os.environ[f"LLM_MODEL_CONFIG_{FAKE_MODEL.upper()}"] = args.fake_model
+    os.environ["MAX_TOKEN_CHUNK_SIZE"] = str(max(sizes) * args.token_chunk_size)
+    os.environ["ENABLE_STREAMING_CHUNKING"] = "False"
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "False"
+    os.environ["EXTRACTION_CACHE_ENABLED"] = "False"
+    os.environ["ENABLE_CHUNK_DEDUP"] = "False"
+    os.environ["TRACK_USER_USAGE"] = "False"
+
+    results = []
+    for chunks in sizes:
+        runs = []
+        for repeat in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                runs.append(executor.submit(run_size, args, chunks, args.seed + repeat).result())
+        result = summarize(runs)
+        results.append(result)
+        stage_times = "  ".join(f"{stage} {result['stages'][stage]:.2f}s" for stage in STAGES)
+        print(f"{result['chunks']:6d} chunks: {result['chunks_per_second']:8.2f} chunks/s  wall {result['wall_seconds']:8.2f}s  peak rss {result['peak_rss_mb']:7.1f} MB  {stage_times}")
+
+    report = {
+        "commit": get_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "token_chunk_size": args.token_chunk_size,
+            "chunk_overlap": args.chunk_overlap,
+            "chunks_to_combine": args.chunks_to_combine,
+            "fake_model": args.fake_model,
+            "embedding_model": args.embedding_model,
+            "pipelined_extraction": os.getenv("ENABLE_PIPELINED_EXTRACTION", "False"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
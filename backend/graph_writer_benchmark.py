@@ -0,0 +1,121 @@
+"""
+Benchmark of the bulk graph writer against the previous write path
+(add_graph_documents followed by a per row apoc.merge.node for the HAS_ENTITY links)
+on a local Neo4j with APOC.
+
+    python graph_writer_benchmark.py --uri bolt://localhost:7687 --password password --chunks 200
+
+Each run writes synthetic chunks and graph documents under its own file name and
+deletes them afterwards. Do not point it at a database holding real data.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_neo4j import Neo4jGraph
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+from src.graph_writer import write_graph_documents
+from src.shared.common_fn import get_chunk_and_graphDocument
+
+LABELS = ["Person", "Organization", "Location", "Product", "Event", "Concept"]
+REL_TYPES = ["WORKS_FOR", "LOCATED_IN", "PART_OF", "RELATED_TO", "PRODUCES", "ATTENDED"]
+# the benchmark writes through a single connection, so any fixed key identifies its database
+BENCHMARK_DATABASE_KEY = ("benchmark", "", "")
+
+PREVIOUS_HAS_ENTITY_QUERY = """
+UNWIND $batch_data AS data
+MATCH (c:Chunk {id: data.chunk_id})
+CALL apoc.merge.node([data.node_type], {id: data.node_id}) YIELD node AS n
+MERGE (c)-[:HAS_ENTITY]->(n)
+"""
+
+
+def make_batch(file_name, chunks, nodes_per_chunk, rels_per_chunk, vocabulary):
+    chunk_ids = [f"{file_name}-chunk-{i}" for i in range(chunks)]
+    graph_documents = []
+    for chunk_id in chunk_ids:
+        node_ids = random.sample(vocabulary, nodes_per_chunk)
+        nodes = [Node(id=node_id, type=LABELS[hash(node_id) % len(LABELS)], properties={"description": f"{node_id} seen in {chunk_id}"}) for node_id in node_ids]
+        relationships = []
+        for _ in range(rels_per_chunk):
+            source, target = random.sample(nodes, 2)
+            relationships.append(Relationship(source=source, target=target, type=random.choice(REL_TYPES)))
+        source = Document(page_content="", metadata={"combined_chunk_ids": [chunk_id]})
+        graph_documents.append(GraphDocument(nodes=nodes, relationships=relationships, source=source))
+    chunkId_chunkDoc_list = [{"chunk_id": chunk_id} for chunk_id in chunk_ids]
+    return chunk_ids, graph_documents, chunkId_chunkDoc_list
+
+
+def setup(graph, file_name, chunk_ids):
+    graph.query("CREATE CONSTRAINT IF NOT EXISTS FOR (b:__Entity__) REQUIRE b.id IS UNIQUE")
+    graph.query("""
+        MERGE (d:Document {fileName: $file_name})
+        WITH d UNWIND $chunk_ids AS chunk_id
+        MERGE (c:Chunk {id: chunk_id})
+        MERGE (c)-[:PART_OF]->(d)
+    """, {"file_name": file_name, "chunk_ids": chunk_ids})
+
+
+def cleanup(graph, file_name):
+    graph.query("""
+        MATCH (d:Document {fileName: $file_name})<-[:PART_OF]-(c:Chunk)
+        OPTIONAL MATCH (c)-[:HAS_ENTITY]->(e:__Entity__)
+        DETACH DELETE c, e, d
+    """, {"file_name": file_name})
+
+
+def previous_path(graph, graph_documents, chunkId_chunkDoc_list):
+    graph.add_graph_documents(graph_documents, baseEntityLabel=True)
+    batch_data = [
+        {"chunk_id": item["chunk_id"], "node_type": node.type, "node_id": node.id}
+        for item in get_chunk_and_graphDocument(graph_documents, chunkId_chunkDoc_list)
+        for node in item["graph_doc"].nodes
+    ]
+    graph.query(PREVIOUS_HAS_ENTITY_QUERY, {"batch_data": batch_data})
+
+
+def bulk_path(graph, graph_documents, chunkId_chunkDoc_list):
+    write_graph_documents(graph, BENCHMARK_DATABASE_KEY, graph_documents, get_chunk_and_graphDocument(graph_documents, chunkId_chunkDoc_list))
+
+
+def run(graph, writer, args):
+    timings = []
+    for _ in range(args.repeat):
+        file_name = f"benchmark-{uuid.uuid4()}"
+        # entity ids shared across chunks of a run, as in real documents
+        vocabulary = [f"{file_name}-entity-{i}" for i in range(args.chunks * args.nodes_per_chunk // 3)]
+        chunk_ids, graph_documents, chunkId_chunkDoc_list = make_batch(file_name, args.chunks, args.nodes_per_chunk, args.rels_per_chunk, vocabulary)
+        setup(graph, file_name, chunk_ids)
+        try:
+            start = time.perf_counter()
+            writer(graph, graph_documents, chunkId_chunkDoc_list)
+            timings.append(time.perf_counter() - start)
+        finally:
+            cleanup(graph, file_name)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="bolt://localhost:7687")
+    parser.add_argument("--user", default="neo4j")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--database", default="neo4j")
+    parser.add_argument("--chunks", type=int, default=50, help="chunks per batch")
+    parser.add_argument("--nodes-per-chunk", type=int, default=15)
+    parser.add_argument("--rels-per-chunk", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    graph = Neo4jGraph(url=args.uri, username=args.user, password=args.password, database=args.database, refresh_schema=False)
+    for name, writer in [("add_graph_documents + HAS_ENTITY", previous_path), ("bulk writer", bulk_path)]:
+        timings = run(graph, writer, args)
+        print(f"{name:35s} median {statistics.median(timings):.3f}s  min {min(timings):.3f}s  max {max(timings):.3f}s  ({args.repeat} runs of {args.chunks} chunks)")
+
+
+if __name__ == "__main__":
+    main()
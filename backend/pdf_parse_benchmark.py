@@ -0,0 +1,74 @@
+"""
+Benchmark of in-process PDF parsing (PyMuPDFLoader) against the process pool page range
+parser used for large PDFs.
+
+    python pdf_parse_benchmark.py --pdf /path/to/large.pdf --workers 2,4,8
+    python pdf_parse_benchmark.py --pages 500
+
+Without --pdf a synthetic PDF with --pages text pages is generated in a temporary directory.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import pymupdf
+from langchain_community.document_loaders import PyMuPDFLoader
+
+import src.document_sources.pdf_parallel as pdf_parallel
+
+PARAGRAPH = ("Neo4j is a graph database management system. Knowledge graphs connect entities "
+             "extracted from unstructured text with the chunks they were found in. ") * 6
+
+
+def make_pdf(path, pages):
+    with pymupdf.open() as doc:
+        for page_number in range(pages):
+            page = doc.new_page()
+            page.insert_textbox(pymupdf.Rect(50, 50, 550, 800), f"Page {page_number + 1}\n" + PARAGRAPH * 4, fontsize=9)
+        doc.save(path)
+
+
+def time_in_process(path):
+    start = time.perf_counter()
+    pages = sum(1 for _ in PyMuPDFLoader(path).lazy_load())
+    return time.perf_counter() - start, pages
+
+
+def time_parallel(path):
+    start = time.perf_counter()
+    pages = sum(1 for _ in pdf_parallel.iter_pdf_pages_parallel(path))
+    return time.perf_counter() - start, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF to parse; a synthetic one is generated when omitted")
+    parser.add_argument("--pages", type=int, default=400, help="pages of the synthetic PDF")
+    parser.add_argument("--workers", default="2,4", help="comma separated worker counts to compare")
+    parser.add_argument("--pages-per-task", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(temp_dir, "benchmark.pdf")
+            make_pdf(path, args.pages)
+        timings = [time_in_process(path) for _ in range(args.repeat)]
+        print(f"in-process PyMuPDFLoader  : median {statistics.median(t for t, _ in timings):.2f}s for {timings[0][1]} pages")
+
+        os.environ["PDF_PARSE_PAGES_PER_TASK"] = str(args.pages_per_task)
+        for workers in [int(count) for count in args.workers.split(",")]:
+            os.environ["PDF_PARSE_WORKERS"] = str(workers)
+            pdf_parallel._pool = None
+            # the first run pays for spawning the workers, as the first large PDF of a process does
+            warmup, _ = time_parallel(path)
+            timings = [time_parallel(path) for _ in range(args.repeat)]
+            print(f"process pool, {workers:2d} workers: median {statistics.median(t for t, _ in timings):.2f}s for {timings[0][1]} pages (first run {warmup:.2f}s)")
+            pdf_parallel._get_pool().shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,13 @@ import logging
 import os
 import re
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from typing import List
 
 import uvicorn
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, File, Form, Request, UploadFile
+from fastapi import Depends, FastAPI, File, Form, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi_health import health
@@ -30,6 +31,9 @@ from src.entities.source_extract_params import SourceScanExtractParams, get_sour
 from src.entities.user_credential import Neo4jCredentials, get_neo4j_credentials, get_neo4j_credentials_from_session
 from src.graphDB_dataAccess import graphDBdataAccess
 from src.graph_query import get_chunktext_results, get_graph_results, visualize_schema
+from src.graph_writer import shutdown_graph_writers
+from src.job_queue import JOB_STATUS_QUEUED, JobWorkerPool, get_job_queue
+from src.job_scheduler import estimate_job_size
 from src.logger import CustomLogger
 from src.main import (
     connection_check_and_get_vector_dimensions, create_source_node_graph_url_gcs, create_source_node_graph_url_s3,
@@ -45,6 +49,7 @@ from src.post_processing import create_entity_embedding, create_vector_fulltext_
 from src.ragas_eval import get_additional_metrics, get_ragas_metrics
 from src.shared.common_fn import formatted_time, get_value_from_env, get_remaining_token_limits, get_user_embedding_model, change_user_embedding_model
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
+from src.shared.metrics import render_metrics
 from Secweb.XContentTypeOptions import XContentTypeOptions
 from Secweb.XFrameOptions import XFrame
 
@@ -121,7 +126,25 @@ class CustomGZipMiddleware:
         await gzip_middleware(scope, receive, send)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker_pool = None
+    job_queue = get_job_queue()
+    if job_queue is not None:
+        worker_pool = JobWorkerPool(
+            job_queue,
+            run_queued_extraction,
+            concurrency=get_value_from_env("JOB_WORKER_CONCURRENCY", 2, int),
+            lease_seconds=get_value_from_env("JOB_LEASE_SECONDS", 120, int),
+        )
+        worker_pool.start()
+    yield
+    if worker_pool is not None:
+        await worker_pool.stop()
+    await asyncio.to_thread(shutdown_graph_writers)
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(XContentTypeOptions)
 app.add_middleware(XFrame, Option={'X-Frame-Options': 'DENY'})
 app.add_middleware(
@@ -227,7 +250,80 @@ async def extract_knowledge_graph_from_file(
     credentials: Neo4jCredentials = Depends(get_neo4j_credentials),
     params: SourceScanExtractParams = Depends(get_source_scan_extract_params)
 ):
-    """Extract a knowledge graph from a file or URL source."""
+    """Extract a knowledge graph from a file or URL source, or queue the extraction when ENABLE_JOB_QUEUE is set."""
+    job_queue = get_job_queue()
+    if job_queue is None:
+        return await run_extraction(credentials, params)
+    try:
+        if params.source_type == 'local file':
+            params.file_name = sanitize_filename(params.file_name)
+            validate_file_path(MERGED_DIR, params.file_name)
+        auth_required = get_value_from_env("AUTHENTICATION_REQUIRED", False, bool)
+        if auth_required:
+            if not getattr(credentials, "email", None) or not getattr(credentials, "uri", None):
+                error_message = "Authentication required: Your session is missing required credentials. Please log in again to continue."
+                raise LLMGraphBuilderException(error_message)
+        payload = {'credentials': credentials.model_dump(), 'params': params.model_dump()}
+        graph = await asyncio.to_thread(create_graph_database_connection, credentials)
+        document_node = await asyncio.to_thread(graphDBdataAccess(graph).get_current_status_document_node, params.file_name)
+        size_hint = estimate_job_size(document_node[0] if document_node else None)
+        job_id = await asyncio.to_thread(job_queue.enqueue, payload, params.file_name, credentials.email or credentials.uri, credentials.uri, size_hint)
+        json_obj = {'api_name':'extract','message':'Extraction job queued','job_id':job_id,'filename':params.file_name,'db_url':credentials.uri,
+                    'userName':credentials.userName,'database':credentials.database,'model':params.model,'source_type':params.source_type,
+                    'logging_time': formatted_time(datetime.now(timezone.utc)),'email':credentials.email}
+        logger.log_struct(json_obj, "INFO")
+        return create_api_response('Success', data={'job_id': job_id, 'fileName': params.file_name, 'status': JOB_STATUS_QUEUED},
+                                   message='Extraction job queued', file_source=params.source_type)
+    except LLMGraphBuilderException as e:
+        logging.exception(f'Unable to queue extraction: {e}')
+        return create_api_response('Failed', message=str(e), error="Internal server error", file_name=params.file_name)
+    except Exception as e:
+        message = f"Unable to queue extraction for file:{params.file_name}"
+        logging.exception(f'{message}: {e}')
+        return create_api_response('Failed', message=message, error="Internal server error", file_name=params.file_name)
+
+@app.get("/job_status/{job_id}")
+async def job_status(job_id: str):
+    """Return the status and result of a queued extraction job."""
+    job_queue = get_job_queue()
+    if job_queue is None:
+        return create_api_response('Failed', message='Job queue is not enabled')
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return create_api_response('Failed', message=f'Job {job_id} not found')
+    return create_api_response('Success', data=job)
+
+@app.get("/job_queue_stats")
+async def job_queue_stats(window_seconds: int = 3600):
+    """Return queue wait times per scheduling lane and job counts per status."""
+    job_queue = get_job_queue()
+    if job_queue is None:
+        return create_api_response('Failed', message='Job queue is not enabled')
+    stats = await asyncio.to_thread(job_queue.wait_time_stats, window_seconds)
+    stats['counts'] = await asyncio.to_thread(job_queue.counts)
+    return create_api_response('Success', data=stats)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the pipeline, LLM, Neo4j, queue and cache metrics of this process."""
+    if not get_value_from_env("ENABLE_METRICS_ENDPOINT", "False", bool):
+        return Response(status_code=404)
+    # collectors read SQLite backed stats, so rendering runs off the event loop
+    body = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def run_queued_extraction(payload, attempt=1):
+    """Job queue handler: rebuild the request objects of a queued /extract call and run it."""
+    credentials = Neo4jCredentials(**payload['credentials'])
+    params = SourceScanExtractParams(**payload['params'])
+    if attempt > 1:
+        # the worker of the previous attempt died or lost its lease and left the Document in Processing
+        graph = await asyncio.to_thread(create_graph_database_connection, credentials)
+        await asyncio.to_thread(graphDBdataAccess(graph).update_exception_db, params.file_name, f"Extraction interrupted, retrying as attempt {attempt}")
+    return await run_extraction(credentials, params)
+
+async def run_extraction(credentials: Neo4jCredentials, params: SourceScanExtractParams):
+    """Run the extraction of a file or URL source and build the /extract response."""
     try:
         start_time = time.time()
         graph = create_graph_database_connection(credentials)
@@ -245,28 +341,29 @@ async def extract_knowledge_graph_from_file(
                 raise LLMGraphBuilderException(error_message)
             
         if params.source_type == 'local file':
-            uri_latency, result = await extract_graph_from_file_local_file(credentials, params, merged_file_path)
+            result = await extract_graph_from_file_local_file(credentials, params, merged_file_path)
         elif params.source_type == 's3 bucket' and params.source_url:
-            uri_latency, result = await extract_graph_from_file_s3(credentials, params)
+            result = await extract_graph_from_file_s3(credentials, params)
         elif params.source_type == 'web-url':
-            uri_latency, result = await extract_graph_from_web_page(credentials, params)
+            result = await extract_graph_from_web_page(credentials, params)
         elif params.source_type == 'youtube' and params.source_url:
-            uri_latency, result = await extract_graph_from_file_youtube(credentials, params)
+            result = await extract_graph_from_file_youtube(credentials, params)
         elif params.source_type == 'Wikipedia' and params.wiki_query:
-            uri_latency, result = await extract_graph_from_file_Wikipedia(credentials, params)
+            result = await extract_graph_from_file_Wikipedia(credentials, params)
         elif params.source_type == 'gcs bucket' and params.gcs_bucket_name:
-            uri_latency, result = await extract_graph_from_file_gcs(credentials, params)
+            result = await extract_graph_from_file_gcs(credentials, params)
         else:
             return create_api_response('Failed', message='source_type is other than accepted source')
         extract_api_time = time.time() - start_time
         json_obj = result.copy()
         if result is not None:
-            logging.info("Going for counting nodes and relationships in extract")
+            logging.info("Reading node and relationship counts of the document in extract")
             count_node_time = time.time()
             graph = create_graph_database_connection(credentials)   
             graphDb_data_Access = graphDBdataAccess(graph)
-            count_response = graphDb_data_Access.update_node_relationship_count(params.file_name)
-            logging.info("Nodes and Relationship Counts updated")
+            # processing_source keeps the counters current, so reading them is enough
+            count_response = graphDb_data_Access.get_node_relationship_count(params.file_name)
+            logging.info("Nodes and Relationship Counts read")
             if count_response :
                 result['chunkNodeCount'] = count_response[params.file_name].get('chunkNodeCount',"0")
                 result['chunkRelCount'] =  count_response[params.file_name].get('chunkRelCount',"0")
@@ -290,7 +387,6 @@ async def extract_knowledge_graph_from_file(
             json_obj['email'] = credentials.email
             json_obj['model'] = params.model
         logger.log_struct(json_obj, "INFO")
-        result.update(uri_latency)
         logging.info(f"extraction completed in {extract_api_time:.2f} seconds for file name {params.file_name}")
         return create_api_response('Success', data=result, file_source= params.source_type)
     except LLMGraphBuilderException as e:
@@ -785,7 +881,7 @@ async def cancelled_job(
     try:
         start = time.time()
         graph = create_graph_database_connection(credentials)
-        result = manually_cancelled_job(graph, filenames, source_types, MERGED_DIR, credentials.uri)
+        result = manually_cancelled_job(graph, filenames, source_types, MERGED_DIR, credentials.uri, credentials.database)
         end = time.time()
         elapsed_time = end - start
         json_obj = {'api_name':'cancelled_job','db_url':credentials.uri, 'userName':credentials.userName, 'database':credentials.database, 'filenames':filenames,
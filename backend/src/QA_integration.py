@@ -28,7 +28,10 @@ from langchain_aws import ChatBedrock
 from langchain_ollama import ChatOllama
 
 # Local imports
+from src.create_chunks import count_tokens
 from src.llm import get_llm
+from src.shared.fake_providers import FakeChatModel
+from src.shared.llm_hedging import hedged_invoke
 from src.shared.common_fn import load_embedding_model, get_value_from_env
 from src.shared.constants import (
     CHAT_SYSTEM_TEMPLATE, CHAT_TOKEN_CUT_OFF, CHAT_ENTITY_VECTOR_MODE,
@@ -49,7 +52,7 @@ class CustomCallback(BaseCallbackHandler):
 
 def get_total_tokens(ai_response, llm):
     try:
-        if isinstance(llm, (ChatOpenAI, AzureChatOpenAI, ChatFireworks, ChatGroq)):
+        if isinstance(llm, (ChatOpenAI, AzureChatOpenAI, ChatFireworks, ChatGroq, FakeChatModel)):
             total_tokens = ai_response.response_metadata.get('token_usage', {}).get('total_tokens', 0)
         
         elif isinstance(llm, ChatGoogleGenerativeAI):
@@ -242,11 +245,19 @@ def process_documents(docs, question, messages, llm, model,chat_mode_settings):
         
         rag_chain = get_rag_chain(llm=llm)
         
-        ai_response = rag_chain.invoke({
-            "messages": messages[:-1],
-            "context": formatted_docs,
-            "input": question
-        })
+        # with ENABLE_LLM_HEDGING a slow answer gets a duplicate request, charged by its estimated prompt size;
+        # chat latencies are tracked apart from the extraction calls of the same model
+        hedge_costs = []
+        ai_response = hedged_invoke(
+            lambda: rag_chain.invoke({
+                "messages": messages[:-1],
+                "context": formatted_docs,
+                "input": question
+            }),
+            f"{model}_chat",
+            count_tokens(f"{formatted_docs} {question}"),
+            hedge_costs.append,
+        )
 
         result = {'sources': list(), 'nodedetails': dict(), 'entities': dict()}
         node_details = {"chunkdetails":list(),"entitydetails":list(),"communitydetails":list()}
@@ -267,7 +278,7 @@ def process_documents(docs, question, messages, llm, model,chat_mode_settings):
         result["entities"] = entities
 
         content = get_clean_text(ai_response)
-        total_tokens = get_total_tokens(ai_response, llm)
+        total_tokens = get_total_tokens(ai_response, llm) + sum(hedge_costs)
         
         predict_time = time.time() - start_time
         logging.info(f"Final response predicted in {predict_time:.2f} seconds")
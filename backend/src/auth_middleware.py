@@ -17,6 +17,9 @@ load_dotenv()
 
 AUTH0_DOMAIN = os.getenv("AUTH0_DOMAIN", "").strip()
 AUTH_EXEMPT_PATHS = {"/health", "/docs", "/redoc", "/openapi.json", "/backend_connection_configuration"}
+# scrapers that cannot send a bearer token need the operator to opt /metrics out of auth
+if get_value_from_env("METRICS_AUTH_EXEMPT", "False", bool):
+    AUTH_EXEMPT_PATHS.add("/metrics")
 # EventSource cannot send custom headers, so these endpoints may pass the token as a query param
 SSE_TOKEN_PATHS = ("/update_extract_status/", "/document_status/")
 
@@ -6,6 +6,7 @@ from langchain_core.output_parsers import StrOutputParser
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.shared.common_fn import get_value_from_env
 from src.shared.common_fn import load_embedding_model,track_token_usage
+from src.shared.embedding_cache import embed_texts_with_cache
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
 
 COMMUNITY_PROJECTION_NAME = "communities"
@@ -384,12 +385,18 @@ def create_community_embeddings(gds, embedding_provider, embedding_model):
         batch_size = 100
         for i in range(0, len(rows), batch_size):
             batch_rows = rows[i:i+batch_size]            
-            for row in batch_rows:
-                try:
-                    row['embedding'] = embeddings.embed_query(row['text'])
-                except Exception as e:
-                    logging.error(f"Failed to embed text for community ID {row['communityId']}: {e}")
-                    row['embedding'] = None
+            try:
+                embeddings_list = embed_texts_with_cache(embeddings, [row['text'] for row in batch_rows], embedding_provider, embedding_model)
+                for row, embedding in zip(batch_rows, embeddings_list):
+                    row['embedding'] = embedding
+            except Exception as e:
+                logging.error(f"Failed to embed batch of communities, embedding one by one: {e}")
+                for row in batch_rows:
+                    try:
+                        row['embedding'] = embeddings.embed_query(row['text'])
+                    except Exception as e:
+                        logging.error(f"Failed to embed text for community ID {row['communityId']}: {e}")
+                        row['embedding'] = None
             
             try:
                 logging.info("Writing embeddings to the database.")
@@ -1,14 +1,60 @@
+import asyncio
+import copy
+import functools
+import itertools
 import logging
 import re
+import threading
+import tiktoken
 from langchain_core.documents import Document
 from langchain_neo4j import Neo4jGraph
-from langchain_text_splitters import TokenTextSplitter
+from langchain_text_splitters import TokenTextSplitter, Tokenizer, split_text_on_tokens
 
 from src.document_sources.youtube import get_calculated_timestamps, get_chunks_with_timestamps
 from src.shared.common_fn import get_value_from_env
 
 logging.basicConfig(format="%(asctime)s - %(message)s", level="INFO")
 
+@functools.lru_cache(maxsize=None)
+def _token_encoding():
+    # TokenTextSplitter's default encoding, so counts match the chunk sizes
+    return tiktoken.get_encoding("gpt2")
+
+
+def count_tokens(text):
+    return len(_token_encoding().encode(text, disallowed_special=()))
+
+
+class _TokenCountingTextSplitter(TokenTextSplitter):
+    """
+    TokenTextSplitter that stores the token count of each chunk in metadata['token_count'],
+    taken from the split itself instead of encoding every chunk again. The count is the
+    one of the token window, before iter_chunks collapses whitespace.
+    """
+
+    def split_text_with_token_counts(self, text):
+        chunks = []
+
+        def decode(token_ids):
+            decoded = self._tokenizer.decode(token_ids)
+            chunks.append((decoded, len(token_ids)))
+            return decoded
+
+        def encode(value):
+            return self._tokenizer.encode(value, allowed_special=self._allowed_special, disallowed_special=self._disallowed_special)
+
+        split_text_on_tokens(text=text, tokenizer=Tokenizer(chunk_overlap=self._chunk_overlap, tokens_per_chunk=self._chunk_size, decode=decode, encode=encode))
+        # split_text_on_tokens drops chunks that decode to nothing
+        return [(chunk, token_count) for chunk, token_count in chunks if chunk]
+
+    def create_documents(self, texts, metadatas=None):
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            for chunk, token_count in self.split_text_with_token_counts(text):
+                documents.append(Document(page_content=chunk, metadata={**copy.deepcopy(metadata), 'token_count': token_count}))
+        return documents
+
 
 class CreateChunksofDocument:
     """
@@ -20,7 +66,8 @@ class CreateChunksofDocument:
         Initialize the chunk creator.
 
         Args:
-            pages (list[Document]): List of langchain Document objects representing pages.
+            pages (list[Document]): List of langchain Document objects representing pages, or any
+                iterable of them when consumed through iter_chunks.
             graph (Neo4jGraph): Neo4j graph connection object.
         """
         self.pages = pages
@@ -38,45 +85,141 @@ class CreateChunksofDocument:
         Returns:
             list[Document]: List of langchain Document chunks.
         """
+        return list(self.iter_chunks(token_chunk_size, chunk_overlap, email))
+
+    def iter_chunks(self, token_chunk_size: int, chunk_overlap: int, email: str, clean_page=None):
+        """
+        Yield the chunks of the pages in order, page by page, so a caller can start on the
+        first chunks while later pages are still being loaded and chunked. self.pages may
+        be any iterable of Documents, e.g. a lazy loader. YouTube transcripts need the full
+        transcript to compute timestamps and are chunked as a whole.
+
+        Args:
+            token_chunk_size (int): Number of tokens per chunk.
+            chunk_overlap (int): Number of tokens to overlap between chunks.
+            email (str): User email for chunk limiting logic.
+            clean_page (callable): Optional function applied to each page's text before splitting.
+
+        Yields:
+            Document: Chunks with normalised whitespace, their token count in metadata['token_count'].
+        """
         logging.info("Split file into smaller chunks")
-        text_splitter = TokenTextSplitter(chunk_size=token_chunk_size, chunk_overlap=chunk_overlap)
+        text_splitter = _TokenCountingTextSplitter(chunk_size=token_chunk_size, chunk_overlap=chunk_overlap)
         max_token_chunk_size = get_value_from_env("MAX_TOKEN_CHUNK_SIZE", 10000, "int")
         chunk_to_be_created = int(max_token_chunk_size / token_chunk_size)
         normalized_email = (email or "").strip().lower() or None
         is_neo4j_user = bool(normalized_email and normalized_email.endswith("@neo4j.com"))
+        chunk_limit = None if is_neo4j_user else chunk_to_be_created
 
-        chunks = []
-        first_metadata = self.pages[0].metadata
+        pages = iter(self.pages)
+        first_page = next(pages, None)
+        if first_page is None:
+            return
+        pages = itertools.chain([first_page], pages)
+        if clean_page is not None:
+            pages = (Document(page_content=clean_page(page.page_content), metadata=page.metadata) for page in pages)
+        first_metadata = first_page.metadata
 
         if 'page' in first_metadata:
             # PDF or paginated document
-            for i, document in enumerate(self.pages):
-                page_number = i + 1
-                for chunk in text_splitter.split_documents([document]):
-                    chunks.append(Document(page_content=chunk.page_content, metadata={'page_number': page_number}))
+            chunks = (
+                Document(page_content=chunk.page_content, metadata={'page_number': page_number, 'token_count': chunk.metadata['token_count']})
+                for page_number, document in enumerate(pages, start=1)
+                for chunk in text_splitter.split_documents([document])
+            )
         elif 'length' in first_metadata:
             # YouTube transcript or similar
-            if len(self.pages) == 1 or (len(self.pages) > 1 and self.pages[1].page_content.strip() == ''):
-                match = re.search(r'(?:v=)([0-9A-Za-z_-]{11})\s*', self.pages[0].metadata.get('source', ''))
+            pages = list(pages)
+            if len(pages) == 1 or (len(pages) > 1 and pages[1].page_content.strip() == ''):
+                match = re.search(r'(?:v=)([0-9A-Za-z_-]{11})\s*', pages[0].metadata.get('source', ''))
                 youtube_id = match.group(1) if match else None
-                chunks_without_time_range = text_splitter.split_documents([self.pages[0]])
+                chunks_without_time_range = text_splitter.split_documents([pages[0]])
                 if youtube_id:
                     chunks = get_calculated_timestamps(chunks_without_time_range, youtube_id)
                 else:
                     chunks = chunks_without_time_range
             else:
-                chunks_without_time_range = text_splitter.split_documents(self.pages)
+                chunks_without_time_range = text_splitter.split_documents(pages)
                 chunks = get_chunks_with_timestamps(chunks_without_time_range)
         else:
             logging.info("No metadata found for pages, proceeding with normal chunking")
-            chunks = text_splitter.split_documents(self.pages)
+            chunks = (chunk for document in pages for chunk in text_splitter.split_documents([document]))
 
+        created = 0
         for chunk in chunks:
+            if chunk_limit is not None and created >= chunk_limit:
+                logging.info('Non Neo4j user - limiting chunks to %d', chunk_limit)
+                break
             chunk.page_content = re.sub(r'\s+', ' ', chunk.page_content).strip()
+            created += 1
+            yield chunk
+        logging.info('Total chunks created: %d', created)
 
-        logging.info('Total chunks created: %d', len(chunks))
-        if not is_neo4j_user and len(chunks) > chunk_to_be_created:
-            chunks = chunks[:chunk_to_be_created]
-            logging.info('Non Neo4j user - limiting chunks to %d from %d', chunk_to_be_created, len(chunks))
 
-        return chunks
\ No newline at end of file
+class ChunkBatches:
+    """
+    The {'chunk_id', 'chunk_doc'} dicts of a file, handed out in processing batches.
+
+    Backed either by a list or, in streaming mode, by the lazy batches of
+    make_relationships.iter_chunk_graph, which loads, chunks and writes the chunk graph
+    only as far as extraction has asked for.
+    """
+
+    def __init__(self, chunks, on_created=None, is_cancelled=None):
+        """
+        Args:
+            chunks (list | iterator): List of chunk dicts, or an iterator of lists of them.
+            on_created (callable): Called with each list of newly created chunk dicts while streaming.
+            is_cancelled (callable): Returns True once the extraction is cancelled, which stops
+                loading and chunking the rest of a streamed file.
+        """
+        self.streaming = not isinstance(chunks, list)
+        self.chunks = chunks
+        self.on_created = on_created
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.created = 0 if self.streaming else len(chunks)
+        self.exhausted = not self.streaming
+        self._lock = threading.Lock()
+
+    def _create_next(self):
+        # runs in a worker thread; state is updated here so a pull whose awaiting task was
+        # cancelled is still accounted for, and the lock keeps the generator single threaded
+        with self._lock:
+            if self.exhausted or self.is_cancelled():
+                return None
+            created_batch = next(self.chunks, None)
+            if created_batch is None:
+                self.exhausted = True
+                return None
+            self.created += len(created_batch)
+            if self.on_created is not None:
+                self.on_created(created_batch)
+            return created_batch
+
+    async def batches(self, batch_size):
+        """Yield (start, end, chunk dicts) for consecutive batches of batch_size chunks."""
+        if not self.streaming:
+            for i in range(0, len(self.chunks), batch_size):
+                select_chunks_upto = min(i + batch_size, len(self.chunks))
+                yield i, select_chunks_upto, self.chunks[i:select_chunks_upto]
+            return
+        buffered = []
+        start = 0
+        while not self.exhausted and not self.is_cancelled():
+            created_batch = await asyncio.to_thread(self._create_next)
+            if created_batch:
+                buffered.extend(created_batch)
+            while len(buffered) >= batch_size or (self.exhausted and buffered):
+                selected, buffered = buffered[:batch_size], buffered[batch_size:]
+                yield start, start + len(selected), selected
+                start += len(selected)
+
+    async def finish(self):
+        """
+        Create the chunks extraction did not get to, so the file's chunk graph is complete.
+        A cancelled file keeps the chunks created so far; reprocessing it resumes the chunk
+        graph from the last chunk written.
+        """
+        while not self.exhausted and not self.is_cancelled():
+            await asyncio.to_thread(self._create_next)
+        return self.created
@@ -1,15 +1,15 @@
 import os
 import logging
 import io
+import tempfile
 import time
 from google.cloud import storage
-from langchain_community.document_loaders import GCSFileLoader
 from langchain_core.documents import Document
 from PyPDF2 import PdfReader
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
 from google.oauth2.credentials import Credentials
 import nltk
-from .local_file import load_document_content
+from .local_file import iter_documents_from_file, peek_pages
 
 logger = logging.getLogger(__name__)
 
@@ -93,18 +93,17 @@ def get_gcs_bucket_files_info(gcs_project_id, gcs_bucket_name, gcs_bucket_folder
         logger.exception('Exception Stack trace: %s', error_message)
         raise LLMGraphBuilderException(error_message) from exc
 
-def gcs_loader_func(file_path):
+def iter_gcs_blob_pages(blob, gcs_bucket_name, blob_name):
     """
-    Loader function for GCS files using local_file utilities.
-
-    Args:
-        file_path (str): Path to the file.
-
-    Returns:
-        loader: Document loader instance.
+    Downloads a GCS blob to a temporary directory and lazily yields its pages with a
+    gs:// source, like GCSFileLoader; the download lives until the pages are consumed.
     """
-    loader, _ = load_document_content(file_path)
-    return loader
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, os.path.basename(blob_name))
+        blob.download_to_filename(file_path)
+        for page in iter_documents_from_file(file_path):
+            page.metadata["source"] = f"gs://{gcs_bucket_name}/{blob_name}"
+            yield page
 
 def get_documents_from_gcs(gcs_project_id, gcs_bucket_name, gcs_bucket_folder, gcs_blob_filename, access_token=None):
     """
@@ -118,7 +117,7 @@ def get_documents_from_gcs(gcs_project_id, gcs_bucket_name, gcs_bucket_folder, g
         access_token (str, optional): OAuth2 access token.
 
     Returns:
-        tuple: (gcs_blob_filename, list of Document objects)
+        tuple: (gcs_blob_filename, iterator of Document objects, or None when the file has no content)
 
     Raises:
         LLMGraphBuilderException: If file does not exist or loading fails.
@@ -138,13 +137,7 @@ def get_documents_from_gcs(gcs_project_id, gcs_bucket_name, gcs_bucket_folder, g
             bucket = storage_client.bucket(gcs_bucket_name)
             blob = bucket.blob(blob_name)
             if blob.exists():
-                loader = GCSFileLoader(
-                    project_name=gcs_project_id,
-                    bucket=gcs_bucket_name,
-                    blob=blob_name,
-                    loader_func=gcs_loader_func
-                )
-                pages = loader.load()
+                pages = peek_pages(iter_gcs_blob_pages(blob, gcs_bucket_name, blob_name))
             else:
                 raise LLMGraphBuilderException('File does not exist, Please re-upload the file and try again.')
         else:
@@ -159,7 +152,7 @@ def get_documents_from_gcs(gcs_project_id, gcs_bucket_name, gcs_bucket_folder, g
                 text = ""
                 for page in pdf_reader.pages:
                     text += page.extract_text() or ""
-                pages = [Document(page_content=text)]
+                pages = peek_pages([Document(page_content=text)])
             else:
                 raise LLMGraphBuilderException(f'File Not Found in GCS bucket - {gcs_bucket_name}')
         return gcs_blob_filename, pages
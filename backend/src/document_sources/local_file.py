@@ -1,9 +1,11 @@
+import itertools
 import logging
 from pathlib import Path
 import chardet
 from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredFileLoader
 from langchain_core.documents import Document
 from langchain_core.document_loaders import BaseLoader
+from src.document_sources.pdf_parallel import iter_pdf_pages_parallel, should_parse_in_parallel
 
 class ListLoader(BaseLoader):
     """
@@ -18,6 +20,12 @@ class ListLoader(BaseLoader):
         """
         return self.documents
 
+    def lazy_load(self):
+        """
+        Yields the documents.
+        """
+        yield from self.documents
+
 def detect_encoding(file_path):
     """
     Detects the file encoding to avoid UnicodeDecodeError.
@@ -64,6 +72,43 @@ def load_document_content(file_path):
     loader = UnstructuredFileLoader(file_path, mode="elements", autodetect_encoding=True)
     return loader, encoding_flag
 
+def iter_documents_from_file(file_path):
+    """
+    Lazily yields the page Documents of a file, reading it through the loaders' lazy_load
+    so pages are produced one at a time instead of being materialised up front.
+
+    Args:
+        file_path (str or Path): Path to the file.
+
+    Yields:
+        Document: Pages of PDFs and non UTF-8 text files as loaded, or Unstructured
+        elements grouped into pages. PDFs of PDF_PARALLEL_MIN_PAGES pages or more are
+        parsed in page ranges on a process pool.
+    """
+    file_extension = Path(file_path).suffix.lower()
+    if file_extension == ".pdf" and should_parse_in_parallel(file_path):
+        yield from iter_pdf_pages_parallel(file_path)
+        return
+    loader, encoding_flag = load_document_content(file_path)
+    if file_extension == ".pdf" or (file_extension == ".txt" and encoding_flag):
+        yield from loader.lazy_load()
+    else:
+        yield from iter_pages_with_page_numbers(loader.lazy_load())
+
+def peek_pages(pages):
+    """
+    Reads the first page of a lazy page iterator, so missing content and read errors
+    surface before processing starts.
+
+    Returns:
+        Iterator of the pages including the first one, or None when there are no pages.
+    """
+    pages = iter(pages)
+    first_page = next(pages, None)
+    if first_page is None:
+        return None
+    return itertools.chain([first_page], pages)
+
 def get_documents_from_file_by_path(file_path, file_name):
     """
     Loads documents from a file by its path and returns file name, pages, and extension.
@@ -73,7 +118,8 @@ def get_documents_from_file_by_path(file_path, file_name):
         file_name (str): Name of the file.
 
     Returns:
-        tuple: (file_name, pages, file_extension)
+        tuple: (file_name, pages, file_extension), pages being a lazy iterator of
+        Document objects or None when the file has no content.
 
     Raises:
         Exception: If file does not exist or reading fails.
@@ -83,18 +129,59 @@ def get_documents_from_file_by_path(file_path, file_name):
         logging.info('File %s does not exist', file_name)
         raise Exception(f'File {file_name} does not exist')
     logging.info('file %s processing', file_name)
+    file_extension = file_path.suffix.lower()
     try:
-        loader, encoding_flag = load_document_content(file_path)
-        file_extension = file_path.suffix.lower()
-        if file_extension == ".pdf" or (file_extension == ".txt" and encoding_flag):
-            pages = loader.load()
-        else:
-            unstructured_pages = loader.load()
-            pages = get_pages_with_page_numbers(unstructured_pages)
+        pages = peek_pages(iter_documents_from_file(file_path))
     except Exception as exc:
         raise Exception(f'Error while reading the file content or metadata, {exc}')
     return file_name, pages, file_extension
 
+def _element_metadata(element, page_number):
+    return {
+        'source': element.metadata.get('source'),
+        'page_number': page_number,
+        'filename': element.metadata.get('filename'),
+        'filetype': element.metadata.get('filetype')
+    }
+
+def iter_pages_with_page_numbers(unstructured_pages):
+    """
+    Groups a stream of Unstructured elements into logical pages with page numbers and metadata.
+
+    Elements carrying a page_number are grouped by it; other elements are grouped
+    between PageBreak elements and numbered by their position. Only the page being
+    built is held in memory.
+
+    Args:
+        unstructured_pages (iterable): Document elements in reading order.
+
+    Yields:
+        Document: One Document per page.
+    """
+    page_contents = []
+    metadata = {}
+    current_page_number = None
+    page_index = 1
+    for element in unstructured_pages:
+        element_page_number = element.metadata.get('page_number')
+        if element_page_number is not None:
+            if page_contents and element_page_number != current_page_number:
+                yield Document(page_content=''.join(page_contents), metadata=metadata)
+                page_contents = []
+            current_page_number = element_page_number
+            page_contents.append(element.page_content)
+            metadata = _element_metadata(element, element_page_number)
+        elif element.metadata.get('category') == 'PageBreak':
+            if page_contents:
+                yield Document(page_content=''.join(page_contents), metadata=metadata)
+                page_contents = []
+                page_index += 1
+        else:
+            page_contents.append(element.page_content)
+            metadata = _element_metadata(element, page_index)
+    if page_contents:
+        yield Document(page_content=''.join(page_contents), metadata=metadata)
+
 def get_pages_with_page_numbers(unstructured_pages):
     """
     Groups unstructured pages into logical pages with page numbers and metadata.
@@ -105,39 +192,4 @@ def get_pages_with_page_numbers(unstructured_pages):
     Returns:
         list: List of Document objects with page numbers and metadata.
     """
-    pages = []
-    page_number = 1
-    page_content = ''
-    metadata = {}
-    for idx, page in enumerate(unstructured_pages):
-        if 'page_number' in page.metadata:
-            if page.metadata['page_number'] == page_number:
-                page_content += page.page_content
-                metadata = {
-                    'source': page.metadata['source'],
-                    'page_number': page_number,
-                    'filename': page.metadata['filename'],
-                    'filetype': page.metadata['filetype']
-                }
-            if page.metadata['page_number'] > page_number:
-                page_number += 1
-                pages.append(Document(page_content=page_content))
-                page_content = ''
-            if page == unstructured_pages[-1]:
-                pages.append(Document(page_content=page_content))
-        elif page.metadata.get('category') == 'PageBreak' and page != unstructured_pages[0]:
-            page_number += 1
-            pages.append(Document(page_content=page_content, metadata=metadata))
-            page_content = ''
-            metadata = {}
-        else:
-            page_content += page.page_content
-            metadata_with_custom_page_number = {
-                'source': page.metadata['source'],
-                'page_number': 1,
-                'filename': page.metadata['filename'],
-                'filetype': page.metadata['filetype']
-            }
-            if page == unstructured_pages[-1]:
-                pages.append(Document(page_content=page_content, metadata=metadata_with_custom_page_number))
-    return pages
+    return list(iter_pages_with_page_numbers(unstructured_pages))
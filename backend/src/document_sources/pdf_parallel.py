@@ -0,0 +1,89 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf
+from langchain_core.documents import Document
+
+from src.shared.common_fn import get_value_from_env
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pdf_parse_workers():
+    return get_value_from_env("PDF_PARSE_WORKERS", min(4, os.cpu_count() or 1), "int")
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, since forking the multi-threaded API process can deadlock the children
+            _pool = ProcessPoolExecutor(max_workers=get_pdf_parse_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def pdf_page_count(file_path):
+    with pymupdf.open(file_path) as doc:
+        return doc.page_count
+
+
+def should_parse_in_parallel(file_path):
+    """True when a PDF has at least PDF_PARALLEL_MIN_PAGES pages and more than one worker is configured."""
+    if get_pdf_parse_workers() <= 1:
+        return False
+    min_pages = get_value_from_env("PDF_PARALLEL_MIN_PAGES", 100, "int")
+    return pdf_page_count(file_path) >= min_pages
+
+
+def parse_pdf_page_range(file_path, start, end):
+    """
+    Extract the text of pages [start, end) of a PDF, with the metadata PyMuPDFLoader gives
+    its page Documents. Runs in the worker processes.
+
+    Returns:
+        list: (page_content, metadata) tuples in page order.
+    """
+    file_path = str(file_path)
+    with pymupdf.open(file_path) as doc:
+        doc_metadata = {key.lower(): value for key, value in (doc.metadata or {}).items() if isinstance(value, (str, int))}
+        doc_metadata.update({"source": file_path, "file_path": file_path, "total_pages": doc.page_count})
+        pages = []
+        for page_index in range(start, min(end, doc.page_count)):
+            page = doc[page_index]
+            pages.append((page.get_text(), {**doc_metadata, "page": page_index}))
+        return pages
+
+
+def iter_pdf_pages_parallel(file_path):
+    """
+    Lazily yield the pages of a PDF parsed in page ranges of PDF_PARSE_PAGES_PER_TASK on
+    the process pool. At most two ranges per worker are in flight, and ranges are
+    yielded in page order, so memory stays bounded and page metadata is unchanged.
+    """
+    page_count = pdf_page_count(file_path)
+    pages_per_task = max(1, get_value_from_env("PDF_PARSE_PAGES_PER_TASK", 25, "int"))
+    pool = _get_pool()
+    max_in_flight = 2 * get_pdf_parse_workers()
+    logging.info(f"Parsing {page_count} PDF pages of {file_path} on {get_pdf_parse_workers()} processes, {pages_per_task} pages per task")
+    ranges = iter(range(0, page_count, pages_per_task))
+    in_flight = deque()
+    try:
+        for start in ranges:
+            in_flight.append(pool.submit(parse_pdf_page_range, str(file_path), start, start + pages_per_task))
+            if len(in_flight) >= max_in_flight:
+                break
+        while in_flight:
+            pages = in_flight.popleft().result()
+            start = next(ranges, None)
+            if start is not None:
+                in_flight.append(pool.submit(parse_pdf_page_range, str(file_path), start, start + pages_per_task))
+            for page_content, metadata in pages:
+                yield Document(page_content=page_content, metadata=metadata)
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -7,7 +7,7 @@ import boto3
 from langchain_community.document_loaders import S3DirectoryLoader
 
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
-from .local_file import load_document_content
+from .local_file import iter_documents_from_file, peek_pages
 
 logger = logging.getLogger(__name__)
 
@@ -109,6 +109,16 @@ def download_s3_file(s3_client, bucket, file_key, local_path):
     s3_client.download_file(bucket, file_key, local_path)
 
 
+def iter_s3_file_pages(s3_client, bucket, file_key, suffix):
+    """
+    Downloads an S3 file to a temporary file and lazily yields its pages; the temporary
+    file lives until the pages are consumed or the iterator is closed.
+    """
+    with tempfile.NamedTemporaryFile(delete=True, suffix=suffix) as tmp_file:
+        download_s3_file(s3_client, bucket, file_key, tmp_file.name)
+        yield from iter_documents_from_file(tmp_file.name)
+
+
 def get_documents_from_s3(s3_url, aws_access_key_id, aws_secret_access_key):
     """
     Downloads a file from S3, loads its content, and returns the file name and pages.
@@ -119,7 +129,7 @@ def get_documents_from_s3(s3_url, aws_access_key_id, aws_secret_access_key):
         aws_secret_access_key (str): AWS secret access key.
 
     Returns:
-        tuple: (file_name, list of Document objects)
+        tuple: (file_name, lazy iterator of Document objects, or None when the file has no content)
 
     Raises:
         LLMGraphBuilderException: If reading content from S3 fails.
@@ -142,10 +152,7 @@ def get_documents_from_s3(s3_url, aws_access_key_id, aws_secret_access_key):
             bucket, file_name, file_key, file_size
         )
 
-        with tempfile.NamedTemporaryFile(delete=True, suffix=os.path.splitext(file_name)[1]) as tmp_file:
-            download_s3_file(s3, bucket, file_key, tmp_file.name)
-            loader, _ = load_document_content(tmp_file.name)
-            pages = loader.load()
+        pages = peek_pages(iter_s3_file_pages(s3, bucket, file_key, os.path.splitext(file_name)[1]))
 
         return file_name, pages
     except Exception as exc:
@@ -1,3 +1,4 @@
+import bisect
 import logging
 import re
 from datetime import timedelta
@@ -117,10 +118,116 @@ def get_documents_from_youtube(url):
         raise LLMGraphBuilderException(error_message) from exc
 
 
+def _normalize_transcript_text(text):
+    # the same cleaning chunks get: quotes dropped, newlines and whitespace runs collapsed
+    return re.sub(r'\s+', ' ', text.replace('"', '').replace("'", '')).strip()
+
+
+class TranscriptAlignmentIndex:
+    """
+    Cumulative character offsets of the transcript segments in the normalised combined
+    transcript the chunks were split from, so the segments a chunk spans are found by
+    locating the chunk in the text and binary searching the offsets.
+    """
+
+    def __init__(self, transcript):
+        self.segments = []
+        self.offsets = []
+        texts = []
+        offset = 0
+        for segment in transcript:
+            text = _normalize_transcript_text(segment['text'])
+            if not text:
+                continue
+            self.segments.append(segment)
+            self.offsets.append(offset)
+            texts.append(text)
+            offset += len(text) + 1
+        self.text = ' '.join(texts)
+
+    def locate(self, chunk_text, search_from=0):
+        """
+        Returns:
+            tuple: (start, end) character span of the chunk in the combined text, or None.
+        """
+        content = _normalize_transcript_text(chunk_text)
+        if not content:
+            return None
+        # chunks are located in order, never before the previous one; chunks that cannot
+        # be found after it are left to the fuzzy fallback
+        position = self.text.find(content, search_from)
+        if position >= 0:
+            return position, position + len(content)
+        # token splitting can cut multi-byte characters at the chunk edges
+        core = content[8:-8]
+        if len(core) >= 32:
+            position = self.text.find(core, search_from)
+            if position >= 0:
+                return max(search_from, position - 8), min(len(self.text), position + len(core) + 8)
+        return None
+
+    def segment_at(self, char_offset):
+        return self.segments[max(0, bisect.bisect_right(self.offsets, char_offset) - 1)]
+
+
+def _fuzzy_chunk_times(chunk, transcript):
+    # fallback for chunks that cannot be located: best fuzzy match of their first and last 40 characters
+    max_start_similarity = 0
+    max_end_similarity = 0
+    start_time = 0
+    end_time = 0
+    start_content = chunk.page_content[:40].strip().replace('\n', ' ')
+    end_content = chunk.page_content[-40:].strip().replace('\n', ' ')
+    for segment in transcript:
+        segment_text = segment['text'].replace('\n', ' ')
+        start_similarity = SequenceMatcher(None, start_content, segment_text).ratio()
+        end_similarity = SequenceMatcher(None, end_content, segment_text).ratio()
+        if start_similarity > max_start_similarity:
+            max_start_similarity = start_similarity
+            start_time = segment['start']
+        if end_similarity > max_end_similarity:
+            max_end_similarity = end_similarity
+            end_time = segment['start'] + segment['duration']
+    return start_time, end_time
+
+
+def align_chunks_to_transcript(chunks, transcript):
+    """
+    Sets start_timestamp and end_timestamp of chunks split from the combined transcript.
+
+    Args:
+        chunks (list): Document chunks in transcript order.
+        transcript (list): Transcript segments with text, start and duration.
+
+    Returns:
+        list: The chunks with timestamps.
+    """
+    index = TranscriptAlignmentIndex(transcript)
+    search_from = 0
+    fuzzy_matched = 0
+    for chunk in chunks:
+        span = index.locate(chunk.page_content, search_from)
+        if span is not None:
+            start_segment = index.segment_at(span[0])
+            end_segment = index.segment_at(span[1] - 1)
+            start_time = start_segment['start']
+            end_time = end_segment['start'] + end_segment['duration']
+            # chunks overlap, so the next one starts after this one's start
+            search_from = span[0] + 1
+        else:
+            start_time, end_time = _fuzzy_chunk_times(chunk, transcript)
+            fuzzy_matched += 1
+        chunk.metadata['start_timestamp'] = str(timedelta(seconds=start_time)).split('.')[0]
+        chunk.metadata['end_timestamp'] = str(timedelta(seconds=end_time)).split('.')[0]
+    if fuzzy_matched:
+        logger.info('Timestamps of %d of %d chunks found by fuzzy matching', fuzzy_matched, len(chunks))
+    return chunks
+
+
 def get_calculated_timestamps(chunks, youtube_id):
     """
     Calculates and updates start and end timestamps for each chunk
-    by matching chunk content to transcript segments.
+    by locating chunk content in the transcript segments.
 
     Args:
         chunks (list): List of Document chunks.
@@ -131,26 +238,7 @@ def get_calculated_timestamps(chunks, youtube_id):
     """
     logger.info('Calculating timestamps for chunks')
     transcript = get_youtube_transcript(youtube_id)
-    for chunk in chunks:
-        max_start_similarity = 0
-        max_end_similarity = 0
-        start_time = 0
-        end_time = 0
-        start_content = chunk.page_content[:40].strip().replace('\n', ' ')
-        end_content = chunk.page_content[-40:].strip().replace('\n', ' ')
-        for segment in transcript:
-            segment_text = segment['text'].replace('\n', ' ')
-            start_similarity = SequenceMatcher(None, start_content, segment_text).ratio()
-            end_similarity = SequenceMatcher(None, end_content, segment_text).ratio()
-            if start_similarity > max_start_similarity:
-                max_start_similarity = start_similarity
-                start_time = segment['start']
-            if end_similarity > max_end_similarity:
-                max_end_similarity = end_similarity
-                end_time = segment['start'] + segment['duration']
-        chunk.metadata['start_timestamp'] = str(timedelta(seconds=start_time)).split('.')[0]
-        chunk.metadata['end_timestamp'] = str(timedelta(seconds=end_time)).split('.')[0]
-    return chunks
+    return align_chunks_to_transcript(chunks, transcript)
 
 
 def get_chunks_with_timestamps(chunks):
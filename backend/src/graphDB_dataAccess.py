@@ -6,6 +6,7 @@ from langchain_neo4j import Neo4jGraph
 from src.shared.common_fn import create_gcs_bucket_folder_name_hashed, delete_uploaded_local_file, load_embedding_model, get_value_from_env, get_user_embedding_model
 from src.document_sources.gcs_bucket import delete_file_from_gcs
 from src.shared.constants import NODEREL_COUNT_QUERY_WITH_COMMUNITY, NODEREL_COUNT_QUERY_WITHOUT_COMMUNITY
+from src.shared.metrics import NEO4J_QUERY_SECONDS
 from src.entities.source_node import sourceNode
 from src.communities import MAX_COMMUNITY_LEVELS
 import json
@@ -118,12 +119,17 @@ class graphDBdataAccess:
 
             if obj_source_node.embedding_model is not None:
                 params['embedding_model'] = obj_source_node.embedding_model
+
+            if obj_source_node.error_message is not None:
+                params['errorMessage'] = obj_source_node.error_message
             param= {"props":params}
             
             logging.info(f'Base Param value 1 : {param}')
             query = "MERGE(d:Document {fileName :$props.fileName}) SET d += $props"
             logging.info("Update source node properties")
+            start = time.perf_counter()
             self.graph.query(query,param,session_params={"database":self.graph._database})
+            NEO4J_QUERY_SECONDS.labels("update_source_node").observe(time.perf_counter() - start)
         except Exception as e:
             error_message = str(e)
             self.update_exception_db(obj_source_node.file_name,error_message)
@@ -297,20 +303,25 @@ class graphDBdataAccess:
                 else:
                     return {'message':"Connection Successful","gds_status": gds_status,"write_access":write_access}
 
-    def execute_query(self, query, param=None,max_retries=3, delay=2):
+    def execute_query(self, query, param=None,max_retries=3, delay=2, query_name=None):
         retries = 0
-        while retries < max_retries:
-            try:
-                return self.graph.query(query, param,session_params={"database":self.graph._database})
-            except TransientError as e:
-                if "DeadlockDetected" in str(e):
-                    retries += 1
-                    logging.info(f"Deadlock detected. Retrying {retries}/{max_retries} in {delay} seconds...")
-                    time.sleep(delay)  # Wait before retrying
-                else:
-                    raise 
-        logging.error("Failed to execute query after maximum retries due to persistent deadlocks.")
-        raise RuntimeError("Query execution failed after multiple retries due to deadlock.")
+        start = time.perf_counter()
+        try:
+            while retries < max_retries:
+                try:
+                    return self.graph.query(query, param,session_params={"database":self.graph._database})
+                except TransientError as e:
+                    if "DeadlockDetected" in str(e):
+                        retries += 1
+                        logging.info(f"Deadlock detected. Retrying {retries}/{max_retries} in {delay} seconds...")
+                        time.sleep(delay)  # Wait before retrying
+                    else:
+                        raise 
+            logging.error("Failed to execute query after maximum retries due to persistent deadlocks.")
+            raise RuntimeError("Query execution failed after multiple retries due to deadlock.")
+        finally:
+            if query_name is not None:
+                NEO4J_QUERY_SECONDS.labels(query_name).observe(time.perf_counter() - start)
 
     def get_current_status_document_node(self, file_name):
         query = """
@@ -329,7 +340,7 @@ class graphDBdataAccess:
                 coalesce(d.embedding_model, "") AS embedding_model
                 """
         param = {"file_name" : file_name}
-        return self.execute_query(query, param)
+        return self.execute_query(query, param, query_name="get_document_status")
 
     def claim_document_for_processing(self, file_name):
         """
@@ -584,6 +595,38 @@ class graphDBdataAccess:
         return "Drop and Re-Create vector index succesfully"
 
 
+    def increment_node_relationship_count(self, document_name, deltas):
+        """
+        Add counter deltas to a Document node and recompute its nodeCount and relationshipCount,
+        without recounting the graph. Returns the same shape as update_node_relationship_count.
+        """
+        query = """
+                MATCH (d:Document {fileName: $filename})
+                SET d.chunkNodeCount = coalesce(d.chunkNodeCount, 0) + $chunkNodeCount,
+                    d.chunkRelCount = coalesce(d.chunkRelCount, 0) + $chunkRelCount,
+                    d.entityNodeCount = coalesce(d.entityNodeCount, 0) + $entityNodeCount,
+                    d.entityEntityRelCount = coalesce(d.entityEntityRelCount, 0) + $entityEntityRelCount
+                SET d.nodeCount = d.chunkNodeCount + d.entityNodeCount + coalesce(d.communityNodeCount, 0),
+                    d.relationshipCount = d.chunkRelCount + d.entityEntityRelCount + coalesce(d.communityRelCount, 0)
+                RETURN d.chunkNodeCount AS chunkNodeCount, d.chunkRelCount AS chunkRelCount,
+                    d.entityNodeCount AS entityNodeCount, d.entityEntityRelCount AS entityEntityRelCount,
+                    coalesce(d.communityNodeCount, 0) AS communityNodeCount, coalesce(d.communityRelCount, 0) AS communityRelCount,
+                    d.nodeCount AS nodeCount, d.relationshipCount AS relationshipCount
+                """
+        params = {"filename": document_name}
+        for key in ["chunkNodeCount", "chunkRelCount", "entityNodeCount", "entityEntityRelCount"]:
+            params[key] = int(deltas.get(key, 0))
+        result = self.execute_query(query, params, query_name="increment_document_counts")
+        return {document_name: result[0]} if result else {}
+
+    def get_node_relationship_count(self, document_name):
+        """Read the counters stored on a Document node, in the shape returned by update_node_relationship_count."""
+        result = self.get_current_status_document_node(document_name)
+        if not result:
+            return {}
+        keys = ["chunkNodeCount", "chunkRelCount", "entityNodeCount", "entityEntityRelCount", "communityNodeCount", "communityRelCount", "nodeCount", "relationshipCount"]
+        return {document_name: {key: result[0].get(key) or 0 for key in keys}}
+
     def update_node_relationship_count(self,document_name):
         logging.info("updating node and relationship count")
         label_query = """CALL db.labels"""
@@ -594,7 +637,7 @@ class graphDBdataAccess:
              return []
         else:
             param = {"document_name": document_name}
-            result = self.execute_query(NODEREL_COUNT_QUERY_WITHOUT_COMMUNITY, param)
+            result = self.execute_query(NODEREL_COUNT_QUERY_WITHOUT_COMMUNITY, param, query_name="recount_document")
         response = {}
         if result:
             for record in result:
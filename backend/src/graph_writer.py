@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from langchain_neo4j import Neo4jGraph
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.document_counters import normalize_relationship_type
+from src.shared.metrics import NEO4J_QUERY_SECONDS
+
+BASE_ENTITY_LABEL = "__Entity__"
+# rough transaction state kept by Neo4j per merged node or relationship, on top of its properties
+TX_BYTES_PER_ROW = 1024
+WRITE_TRANSACTION_SECONDS = NEO4J_QUERY_SECONDS.labels("write_graph_documents")
+
+_constrained_databases = set()
+_constraint_lock = threading.Lock()
+_coordinators = {}
+_coordinators_lock = threading.Lock()
+_executor = None
+
+
+def _quote(name):
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def _node_query(label):
+    return f"""
+    UNWIND $rows AS row
+    MERGE (n:{BASE_ENTITY_LABEL} {{id: row.id}})
+    SET n:{_quote(label)}
+    SET n += row.properties
+    """
+
+
+def _relationship_query(rel_type):
+    return f"""
+    UNWIND $rows AS row
+    MATCH (source:{BASE_ENTITY_LABEL} {{id: row.source}})
+    MATCH (target:{BASE_ENTITY_LABEL} {{id: row.target}})
+    MERGE (source)-[r:{_quote(rel_type)}]->(target)
+    SET r += row.properties
+    """
+
+
+HAS_ENTITY_QUERY = f"""
+UNWIND $rows AS row
+MATCH (c:Chunk {{id: row.chunk_id}})
+MATCH (n:{BASE_ENTITY_LABEL} {{id: row.node_id}})
+MERGE (c)-[:HAS_ENTITY]->(n)
+"""
+
+
+def _estimate_row_bytes(row):
+    return TX_BYTES_PER_ROW + len(json.dumps(row, default=str))
+
+
+def database_key(credentials):
+    """Key of the database a request writes to; connections are created per request, so it is built from the credentials rather than the driver."""
+    return (credentials.uri or "", credentials.database or "", credentials.userName or "")
+
+
+def ensure_entity_constraint(graph: Neo4jGraph, key):
+    """Create the __Entity__ id uniqueness constraint the MERGE statements rely on, once per database."""
+    with _constraint_lock:
+        if key in _constrained_databases:
+            return
+        graph.query(f"CREATE CONSTRAINT IF NOT EXISTS FOR (b:{BASE_ENTITY_LABEL}) REQUIRE b.id IS UNIQUE", session_params={"database": graph._database})
+        _constrained_databases.add(key)
+
+
+def build_write_statements(graph_document_list, chunks_and_graphDocuments_list):
+    """
+    Group the nodes of a batch by label and its relationships by type into static
+    label UNWIND statements, followed by the HAS_ENTITY links of the chunks.
+
+    Returns:
+        list: (query, rows) tuples, in the order they must run.
+    """
+    nodes_by_label = {}
+    relationships_by_type = {}
+    for graph_document in graph_document_list:
+        for node in graph_document.nodes:
+            rows = nodes_by_label.setdefault(node.type, {})
+            row = rows.setdefault(node.id, {"id": node.id, "properties": {}})
+            row["properties"].update(node.properties or {})
+        for rel in graph_document.relationships:
+            # relationship endpoints are merged as nodes too, like add_graph_documents does
+            for endpoint in (rel.source, rel.target):
+                nodes_by_label.setdefault(endpoint.type, {}).setdefault(endpoint.id, {"id": endpoint.id, "properties": {}})
+            rel_type = normalize_relationship_type(rel.type)
+            rows = relationships_by_type.setdefault(rel_type, {})
+            row = rows.setdefault((rel.source.id, rel.target.id), {"source": rel.source.id, "target": rel.target.id, "properties": {}})
+            row["properties"].update(rel.properties or {})
+
+    has_entity_rows = {}
+    for item in chunks_and_graphDocuments_list:
+        for node in item['graph_doc'].nodes:
+            has_entity_rows[(item['chunk_id'], node.id)] = {"chunk_id": item['chunk_id'], "node_id": node.id}
+
+    statements = [(_node_query(label), list(rows.values())) for label, rows in nodes_by_label.items()]
+    statements += [(_relationship_query(rel_type), list(rows.values())) for rel_type, rows in relationships_by_type.items()]
+    if has_entity_rows:
+        statements.append((HAS_ENTITY_QUERY, list(has_entity_rows.values())))
+    return statements
+
+
+def plan_transactions(statements, max_rows_per_statement, max_tx_bytes):
+    """
+    Split statements into UNWIND calls of at most max_rows_per_statement rows and pack
+    them, in order, into transactions whose estimated state stays under max_tx_bytes.
+    A normal batch fits one transaction; only oversized batches are split.
+    """
+    transactions = []
+    current = []
+    current_bytes = 0
+    for query, rows in statements:
+        for start in range(0, len(rows), max_rows_per_statement):
+            chunk = rows[start:start + max_rows_per_statement]
+            chunk_bytes = sum(_estimate_row_bytes(row) for row in chunk)
+            if current and current_bytes + chunk_bytes > max_tx_bytes:
+                transactions.append(current)
+                current, current_bytes = [], 0
+            current.append((query, chunk))
+            current_bytes += chunk_bytes
+    if current:
+        transactions.append(current)
+    return transactions
+
+
+def entity_partition(entity_id, partitions):
+    """Stable partition of an entity id; every MERGE keyed on that id lands in the same partition."""
+    return zlib.crc32(str(entity_id).encode("utf-8")) % partitions
+
+
+def _row_entity_ids(row):
+    if "node_id" in row:
+        return (row["node_id"],)
+    if "source" in row:
+        return (row["source"], row["target"])
+    return (row["id"],)
+
+
+def _row_sort_key(row):
+    # a consistent lock order across concurrent transactions: entities first, then the chunk of a HAS_ENTITY row
+    return tuple(sorted(str(entity_id) for entity_id in _row_entity_ids(row))) + (row.get("chunk_id", ""),)
+
+
+def partition_statements(statements, partitions):
+    """
+    Split the rows of each statement by the partitions of the entities they lock.
+
+    Returns:
+        tuple: (per partition statement lists, {(partition, partition): statements} of relationships
+            spanning two partitions). Rows are sorted so transactions touching the same nodes take
+            their locks in the same order.
+    """
+    partitioned = [[] for _ in range(partitions)]
+    crossing = {}
+    for query, rows in statements:
+        rows_by_owners = {}
+        for row in rows:
+            owners = tuple(sorted({entity_partition(entity_id, partitions) for entity_id in _row_entity_ids(row)}))
+            rows_by_owners.setdefault(owners, []).append(row)
+        for owners, owner_rows in rows_by_owners.items():
+            target = partitioned[owners[0]] if len(owners) == 1 else crossing.setdefault(owners, [])
+            target.append((query, sorted(owner_rows, key=_row_sort_key)))
+    return partitioned, crossing
+
+
+class GraphWriteCoordinator:
+    """
+    Serialises conflicting entity writes of one database inside the process while
+    letting non-conflicting ones run concurrently.
+
+    Node MERGEs and relationships between entities of the same partition are partitioned
+    on a stable hash of the entity id (the MERGE key, so labels of the same id always
+    share a partition). Each partition has a lock held by at most one transaction, so
+    concurrent batches of several documents never wait on each other's entity locks and
+    run on the writer threads in parallel. Relationships spanning two partitions are
+    written afterwards while holding the locks of both, taken in partition order.
+
+    HAS_ENTITY links are written last, from the calling thread. Every link of a chunk
+    locks that Chunk node, so splitting them over the entity partitions only made the
+    partition transactions of one batch queue behind each other. The Chunk nodes of a
+    batch belong to it alone, so the links need no partition lock. Transactions of other
+    processes are still retried by execute_write.
+    """
+
+    def __init__(self, partitions, executor):
+        self.partitions = partitions
+        self.partition_locks = [threading.Lock() for _ in range(partitions)]
+        self.executor = executor
+
+    def write(self, graph: Neo4jGraph, statements, max_rows_per_statement, max_tx_bytes):
+        entity_statements = [(query, rows) for query, rows in statements if query is not HAS_ENTITY_QUERY]
+        link_rows = [row for query, rows in statements if query is HAS_ENTITY_QUERY for row in rows]
+        partitioned, crossing = partition_statements(entity_statements, self.partitions)
+        futures = [
+            self.executor.submit(self._write_locked, (partition,), graph, partition_statement_list, max_rows_per_statement, max_tx_bytes)
+            for partition, partition_statement_list in enumerate(partitioned) if partition_statement_list
+        ]
+        transactions = _wait_all(futures)
+        # relationships between partitions need their endpoints, written by the partitions above
+        futures = [
+            self.executor.submit(self._write_locked, owners, graph, crossing_statement_list, max_rows_per_statement, max_tx_bytes)
+            for owners, crossing_statement_list in crossing.items()
+        ]
+        transactions += _wait_all(futures)
+        if link_rows:
+            link_statements = [(HAS_ENTITY_QUERY, sorted(link_rows, key=_row_sort_key))]
+            transactions += _run_transactions(graph, plan_transactions(link_statements, max_rows_per_statement, max_tx_bytes))
+        return transactions
+
+    def _write_locked(self, partitions, graph, statements, max_rows_per_statement, max_tx_bytes):
+        # partitions are sorted, so threads holding several locks never wait on each other in a cycle
+        locks = [self.partition_locks[partition] for partition in partitions]
+        for lock in locks:
+            lock.acquire()
+        try:
+            return _run_transactions(graph, plan_transactions(statements, max_rows_per_statement, max_tx_bytes))
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+def _wait_all(futures):
+    # wait for every partition before raising, so no write of the batch is still running when it is retried
+    wait(futures)
+    return sum(future.result() for future in futures)
+
+
+def get_write_coordinator(key):
+    """Process-wide coordinator of the writes to the database of key; None when GRAPH_WRITE_PARTITIONS is 1."""
+    global _executor
+    partitions = get_value_from_env("GRAPH_WRITE_PARTITIONS", 1, "int")
+    if partitions <= 1:
+        return None
+    with _coordinators_lock:
+        coordinator = _coordinators.get(key)
+        if coordinator is None:
+            if _executor is None:
+                # one pool for all databases, so the thread count does not grow with the databases written to
+                threads = get_value_from_env("GRAPH_WRITE_THREADS", 4, "int")
+                _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="graph-writer")
+            coordinator = GraphWriteCoordinator(partitions, _executor)
+            _coordinators[key] = coordinator
+        return coordinator
+
+
+def shutdown_graph_writers():
+    """Stop the writer threads once the in-flight writes are done; called when the app shuts down."""
+    global _executor
+    with _coordinators_lock:
+        executor, _executor = _executor, None
+        _coordinators.clear()
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _run_transactions(graph: Neo4jGraph, transactions):
+    def run_transaction(tx, calls):
+        for query, rows in calls:
+            tx.run(query, rows=rows).consume()
+
+    # execute_write retries transient errors such as deadlocks with the whole transaction
+    with graph._driver.session(database=graph._database) as session:
+        for calls in transactions:
+            start = time.perf_counter()
+            session.execute_write(run_transaction, calls)
+            WRITE_TRANSACTION_SECONDS.observe(time.perf_counter() - start)
+    return len(transactions)
+
+
+def write_graph_documents(graph: Neo4jGraph, key, graph_document_list, chunks_and_graphDocuments_list):
+    """
+    Write the entities, entity-entity relationships and HAS_ENTITY links of a batch,
+    with static-label UNWIND statements instead of add_graph_documents and a per row
+    apoc.merge.node for the HAS_ENTITY links. With GRAPH_WRITE_PARTITIONS at its
+    default of 1 the batch is written in a single transaction, unless it exceeds
+    GRAPH_WRITE_TX_MEMORY_MB. Above 1 it goes through the database's
+    GraphWriteCoordinator: one transaction per entity partition followed by the
+    HAS_ENTITY links, so a failure midway leaves the batch partly written. Every
+    statement is a MERGE, so writing the batch again completes it; the caller stores
+    the chunk embeddings, which mark the chunks as processed, only after this returns.
+
+    Args:
+        graph (Neo4jGraph): Connection to write with.
+        key (tuple): database_key of the credentials the connection was made with.
+        graph_document_list (list): Cleaned GraphDocuments of the batch.
+        chunks_and_graphDocuments_list (list): {'chunk_id', 'graph_doc'} dicts from get_chunk_and_graphDocument.
+
+    Returns:
+        dict: Number of statements, transactions and rows written.
+    """
+    statements = build_write_statements(graph_document_list, chunks_and_graphDocuments_list)
+    if not statements:
+        return {"statements": 0, "transactions": 0, "rows": 0}
+    ensure_entity_constraint(graph, key)
+    max_rows = get_value_from_env("GRAPH_WRITE_BATCH_ROWS", 1000, "int")
+    max_tx_bytes = get_value_from_env("GRAPH_WRITE_TX_MEMORY_MB", 64, "int") * 1024 * 1024
+    coordinator = get_write_coordinator(key)
+    if coordinator is not None:
+        transactions = coordinator.write(graph, statements, max_rows, max_tx_bytes)
+    else:
+        transactions = _run_transactions(graph, plan_transactions(statements, max_rows, max_tx_bytes))
+    summary = {
+        "statements": len(statements),
+        "transactions": transactions,
+        "rows": sum(len(rows) for _, rows in statements),
+    }
+    logging.info(f"Bulk graph write: {summary}")
+    return summary
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from src.job_scheduler import FairShareScheduler
+from src.shared.common_fn import get_value_from_env
+from src.shared.metrics import register_collector
+
+JOB_STATUS_QUEUED = "Queued"
+JOB_STATUS_RUNNING = "Running"
+JOB_STATUS_COMPLETED = "Completed"
+JOB_STATUS_FAILED = "Failed"
+# seconds stop() waits for running jobs to unwind before leaving their leases to expire
+STOP_TIMEOUT_SECONDS = 30
+
+
+class SqliteJobQueue:
+    """
+    Durable job queue in a local SQLite file.
+
+    A worker claims a job with a lease and keeps it alive with heartbeats. Jobs whose
+    lease expires (the worker died or stalled) are put back in the queue by the reaper,
+    up to max_attempts claims. The scheduler decides which queued job is claimed next.
+
+    The queue is single node: only processes sharing the file (the replicas of one host
+    or pod with a persistent volume) see its jobs, and jobs of a lost node come back
+    only once the same file is mounted again. SQLite must not be put on a network file
+    system to share it between nodes.
+
+    Payloads hold database and source credentials and are encrypted with Fernet using
+    encryption_key; without one, a key of the process is generated and jobs left queued
+    by a previous process fail when claimed.
+    """
+
+    def __init__(self, path, max_attempts=3, scheduler=None, encryption_key=None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.scheduler = scheduler or FairShareScheduler()
+        if not encryption_key:
+            logging.warning("JOB_QUEUE_ENCRYPTION_KEY is not set, jobs queued by this process cannot be recovered after a restart")
+            encryption_key = Fernet.generate_key()
+        self._fernet = Fernet(encryption_key)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        os.chmod(path, 0o600)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                file_name TEXT,
+                user_key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL NOT NULL,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        for column, column_type in [("db_uri", "TEXT"), ("size_hint", "INTEGER"), ("lane", "TEXT"), ("wait_seconds", "REAL")]:
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_started ON jobs(started_at)")
+
+    def _write(self, query, params=()):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(query, params)
+                self._conn.execute("COMMIT")
+                return cursor.rowcount
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _encrypt_payload(self, payload):
+        return self._fernet.encrypt(json.dumps(payload).encode()).decode()
+
+    def _decrypt_payload(self, stored):
+        if stored.startswith("{"):
+            # queued before payloads were encrypted
+            return json.loads(stored)
+        return json.loads(self._fernet.decrypt(stored.encode()))
+
+    def enqueue(self, payload, file_name=None, user_key=None, db_uri=None, size_hint=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        lane = self.scheduler.lane(size_hint)
+        self._write(
+            "INSERT INTO jobs (id, file_name, user_key, db_uri, size_hint, lane, payload, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, file_name, user_key, db_uri, size_hint, lane, self._encrypt_payload(payload), JOB_STATUS_QUEUED, now, now),
+        )
+        logging.info(f"Queued job {job_id} for file {file_name} in {lane} lane with estimated size {size_hint}")
+        return job_id
+
+    def claim(self, worker_id, lease_seconds):
+        """Lease the queued job chosen by the scheduler to worker_id; returns (job_id, payload, attempt) or None."""
+        now = time.time()
+        while True:
+            claimed = self._claim_next(worker_id, lease_seconds, now)
+            if claimed is None:
+                return None
+            job_id, stored, attempt = claimed
+            try:
+                return job_id, self._decrypt_payload(stored), attempt
+            except (InvalidToken, ValueError) as e:
+                logging.error(f"Failing job {job_id}, its payload cannot be decrypted: {type(e).__name__}")
+                self.finish(job_id, worker_id, JOB_STATUS_FAILED, error="Job payload cannot be decrypted, set the same JOB_QUEUE_ENCRYPTION_KEY on every process")
+
+    def _claim_next(self, worker_id, lease_seconds, now):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                candidates = [
+                    {"id": row[0], "user_key": row[1], "db_uri": row[2], "size_hint": row[3], "created_at": row[4]}
+                    for row in self._conn.execute(
+                        "SELECT id, user_key, db_uri, size_hint, created_at FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1000",
+                        (JOB_STATUS_QUEUED,),
+                    )
+                ]
+                served = [
+                    {"user_key": row[0], "db_uri": row[1], "size_hint": row[2], "running": row[3] == JOB_STATUS_RUNNING, "started_at": row[4]}
+                    for row in self._conn.execute(
+                        "SELECT user_key, db_uri, size_hint, status, started_at FROM jobs WHERE status = ? OR started_at >= ?",
+                        (JOB_STATUS_RUNNING, now - self.scheduler.fairness_window_seconds),
+                    )
+                ]
+                chosen = self.scheduler.pick(candidates, served) if candidates else None
+                if chosen is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                    "started_at = COALESCE(started_at, ?), wait_seconds = COALESCE(wait_seconds, ? - created_at), updated_at = ? WHERE id = ?",
+                    (JOB_STATUS_RUNNING, worker_id, now + lease_seconds, now, now, now, chosen["id"]),
+                )
+                stored, attempt = self._conn.execute("SELECT payload, attempts FROM jobs WHERE id = ?", (chosen["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logging.info(f"Job {chosen['id']} claimed by {worker_id} after waiting {now - chosen['created_at']:.2f} seconds")
+        return chosen["id"], stored, attempt
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """Extend the lease; returns False when the job is no longer leased to worker_id."""
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = ?",
+            (now + lease_seconds, now, job_id, worker_id, JOB_STATUS_RUNNING),
+        ) == 1
+
+    def finish(self, job_id, worker_id, status, result=None, error=None):
+        self._write(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id, worker_id),
+        )
+
+    def requeue_expired(self):
+        """Return jobs with expired leases to the queue, or fail them after max_attempts claims."""
+        now = time.time()
+        failed = self._write(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+            (JOB_STATUS_FAILED, "Worker lease expired too many times", now, JOB_STATUS_RUNNING, now, self.max_attempts),
+        )
+        requeued = self._write(
+            "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires_at < ?",
+            (JOB_STATUS_QUEUED, now, JOB_STATUS_RUNNING, now),
+        )
+        if failed or requeued:
+            logging.warning(f"Job reaper requeued {requeued} and failed {failed} jobs with expired leases")
+        return requeued
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, file_name, status, attempts, created_at, started_at, updated_at, result, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["job_id", "file_name", "status", "attempts", "created_at", "started_at", "updated_at", "result", "error"]
+        job = dict(zip(keys, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def wait_time_stats(self, window_seconds=3600):
+        """Queue wait times of jobs started within the window, per lane, plus the age of the oldest queued job."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lane, wait_seconds FROM jobs WHERE started_at >= ? AND wait_seconds IS NOT NULL", (now - window_seconds,)
+            ).fetchall()
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (JOB_STATUS_QUEUED,)).fetchone()[0]
+        waits_by_lane = {}
+        for lane, wait in rows:
+            waits_by_lane.setdefault(lane or "unknown", []).append(wait)
+        stats = {"window_seconds": window_seconds, "queued": self.counts().get(JOB_STATUS_QUEUED, 0),
+                 "oldest_queued_seconds": round(now - oldest, 2) if oldest else 0, "lanes": {}}
+        for lane, waits in waits_by_lane.items():
+            waits.sort()
+            stats["lanes"][lane] = {
+                "started": len(waits),
+                "avg_wait_seconds": round(sum(waits) / len(waits), 2),
+                "p50_wait_seconds": round(waits[len(waits) // 2], 2),
+                "p95_wait_seconds": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2),
+                "max_wait_seconds": round(waits[-1], 2),
+            }
+        return stats
+
+
+class JobWorkerPool:
+    """
+    Runs queued jobs, concurrency jobs at a time, on an event loop of its own in a
+    worker thread, so the synchronous Neo4j and LLM client code of jobs never blocks
+    the API event loop.
+
+    Leases are renewed, and expired leases reaped, by a separate heartbeat thread that a
+    busy worker loop cannot starve. A job whose lease is lost anyway is cancelled at
+    once, since the reaper may already have handed it to another worker.
+
+    handler is an async callable taking the job payload and the attempt number and
+    returning the API response dict; a response with status "Failed" marks the job failed.
+    """
+
+    def __init__(self, queue, handler, concurrency=2, lease_seconds=120, poll_seconds=2):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stopping = threading.Event()
+        self._threads = []
+        # job_id -> (worker_id, event loop, task) of the running jobs
+        self._leases = {}
+        self._lost_leases = set()
+        self._leases_lock = threading.Lock()
+
+    def start(self):
+        self.queue.requeue_expired()
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=asyncio.run, args=(self._serve(),), name="job-workers", daemon=True),
+            threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Started {self.concurrency} job workers with lease {self.lease_seconds} seconds")
+
+    async def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            await asyncio.to_thread(thread.join, STOP_TIMEOUT_SECONDS)
+        self._threads = []
+
+    async def _serve(self):
+        tasks = [asyncio.create_task(self._worker(f"{self.worker_prefix}-{i}")) for i in range(self.concurrency)]
+        try:
+            await asyncio.to_thread(self._stopping.wait)
+        finally:
+            # running jobs are abandoned; their leases expire and the jobs are picked up again
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            with self._leases_lock:
+                leases = list(self._leases.items())
+            for job_id, (worker_id, loop, task) in leases:
+                try:
+                    leased = self.queue.heartbeat(job_id, worker_id, self.lease_seconds)
+                except Exception as e:
+                    logging.error(f"Heartbeat of job {job_id} failed: {e}")
+                    continue
+                if not leased:
+                    logging.warning(f"Worker {worker_id} lost the lease of job {job_id}, cancelling the job")
+                    with self._leases_lock:
+                        self._lost_leases.add(job_id)
+                    loop.call_soon_threadsafe(task.cancel)
+            try:
+                self.queue.requeue_expired()
+            except Exception as e:
+                logging.error(f"Job reaper failed: {e}")
+
+    async def _worker(self, worker_id):
+        while not self._stopping.is_set():
+            try:
+                claimed = await asyncio.to_thread(self.queue.claim, worker_id, self.lease_seconds)
+            except Exception as e:
+                logging.error(f"Worker {worker_id} failed to claim a job: {e}")
+                claimed = None
+            if claimed is None:
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            job_id, payload, attempt = claimed
+            logging.info(f"Worker {worker_id} started job {job_id}, attempt {attempt}")
+            job = asyncio.create_task(self.handler(payload, attempt))
+            with self._leases_lock:
+                self._leases[job_id] = (worker_id, asyncio.get_running_loop(), job)
+            try:
+                response = await job
+                status = JOB_STATUS_FAILED if response.get("status") == "Failed" else JOB_STATUS_COMPLETED
+                await asyncio.to_thread(self.queue.finish, job_id, worker_id, status, response, response.get("error"))
+                logging.info(f"Worker {worker_id} finished job {job_id} with status {status}")
+            except asyncio.CancelledError:
+                with self._leases_lock:
+                    lost = job_id in self._lost_leases
+                if not lost:
+                    # shutting down: leave the lease to expire so the job is picked up again
+                    raise
+                logging.warning(f"Worker {worker_id} abandoned job {job_id} after losing its lease")
+            except Exception as e:
+                logging.exception(f"Worker {worker_id} failed job {job_id}: {e}")
+                await asyncio.to_thread(self.queue.finish, job_id, worker_id, JOB_STATUS_FAILED, None, str(e))
+            finally:
+                with self._leases_lock:
+                    self._leases.pop(job_id, None)
+                    self._lost_leases.discard(job_id)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, or None unless ENABLE_JOB_QUEUE is true."""
+    global _job_queue
+    if not get_value_from_env("ENABLE_JOB_QUEUE", "False", "bool"):
+        return None
+    with _job_queue_lock:
+        if _job_queue is None:
+            path = get_value_from_env("JOB_QUEUE_PATH", "./cache/jobs.sqlite")
+            _job_queue = SqliteJobQueue(
+                path,
+                max_attempts=get_value_from_env("JOB_MAX_ATTEMPTS", 3, "int"),
+                scheduler=FairShareScheduler.from_env(),
+                encryption_key=get_value_from_env("JOB_QUEUE_ENCRYPTION_KEY", ""),
+            )
+            logging.info(f"Job queue at {path}")
+        return _job_queue
+
+
+@register_collector
+def collect_job_queue_metrics():
+    job_queue = get_job_queue()
+    if job_queue is None:
+        return []
+    samples = [({"status": status}, count) for status, count in job_queue.counts().items()]
+    return [("jobs", "gauge", "Jobs in the job queue by status.", samples)]
@@ -0,0 +1,98 @@
+import logging
+import time
+
+from src.shared.common_fn import get_value_from_env
+
+LANE_SMALL = "small"
+LANE_LARGE = "large"
+# rough bytes of source file per chunk, used until the Document node has total_chunks
+BYTES_PER_CHUNK_ESTIMATE = 1000
+
+
+def estimate_job_size(document_node):
+    """Estimated chunk count of a file from its Document node (total_chunks, else fileSize)."""
+    if not document_node:
+        return None
+    total_chunks = document_node.get("total_chunks")
+    if total_chunks:
+        return int(total_chunks)
+    file_size = document_node.get("fileSize")
+    if file_size:
+        return max(1, int(file_size) // BYTES_PER_CHUNK_ESTIMATE)
+    return None
+
+
+class FairShareScheduler:
+    """
+    Chooses the next queued job for a free worker.
+
+    - Per-user cap: users already running max_per_user jobs are skipped.
+    - Weighted fair sharing: users, then database URIs, with the least weighted
+      service (sizes of their running jobs and of jobs started within the fairness
+      window) go first, so one user's large backlog cannot starve the others.
+    - Shortest-job-first lane: among equally served owners, jobs estimated at or
+      below small_job_chunks go before large ones, then smaller and older jobs first.
+    """
+
+    def __init__(self, max_per_user=2, small_job_chunks=50, fairness_window_seconds=3600, user_weights=None, default_size=100):
+        self.max_per_user = max_per_user
+        self.small_job_chunks = small_job_chunks
+        self.fairness_window_seconds = fairness_window_seconds
+        self.user_weights = user_weights or {}
+        self.default_size = default_size
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_per_user=get_value_from_env("JOB_MAX_CONCURRENT_PER_USER", 2, "int"),
+            small_job_chunks=get_value_from_env("JOB_SMALL_JOB_CHUNKS", 50, "int"),
+            fairness_window_seconds=get_value_from_env("JOB_FAIRNESS_WINDOW_SECONDS", 3600, "int"),
+            user_weights=get_value_from_env("JOB_USER_WEIGHTS", "{}", "dict") or {},
+        )
+
+    def lane(self, size_hint):
+        size = size_hint if size_hint is not None else self.default_size
+        return LANE_SMALL if size <= self.small_job_chunks else LANE_LARGE
+
+    def pick(self, candidates, served):
+        """
+        Args:
+            candidates (list): Queued jobs as dicts with id, user_key, db_uri, size_hint and created_at.
+            served (list): Running and recently started jobs as dicts with user_key, db_uri,
+                size_hint, running and started_at.
+
+        Returns:
+            dict: The chosen candidate, or None when every queued job is capped.
+        """
+        now = time.time()
+        running_by_user = {}
+        service_by_user = {}
+        service_by_uri = {}
+        for job in served:
+            size = job["size_hint"] if job["size_hint"] is not None else self.default_size
+            if job["running"]:
+                running_by_user[job["user_key"]] = running_by_user.get(job["user_key"], 0) + 1
+            elif job["started_at"] is None or now - job["started_at"] > self.fairness_window_seconds:
+                continue
+            service_by_user[job["user_key"]] = service_by_user.get(job["user_key"], 0) + size
+            service_by_uri[job["db_uri"]] = service_by_uri.get(job["db_uri"], 0) + size
+
+        best = None
+        best_key = None
+        for job in candidates:
+            if self.max_per_user and running_by_user.get(job["user_key"], 0) >= self.max_per_user:
+                continue
+            weight = float(self.user_weights.get(job["user_key"], 1) or 1)
+            size = job["size_hint"] if job["size_hint"] is not None else self.default_size
+            key = (
+                service_by_user.get(job["user_key"], 0) / weight,
+                service_by_uri.get(job["db_uri"], 0),
+                0 if self.lane(job["size_hint"]) == LANE_SMALL else 1,
+                size,
+                job["created_at"],
+            )
+            if best_key is None or key < best_key:
+                best, best_key = job, key
+        if best is None and candidates:
+            logging.info(f"All {len(candidates)} queued jobs are waiting on per-user concurrency caps")
+        return best
@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import threading
+import weakref
 from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -14,14 +17,47 @@ from langchain_aws import ChatBedrock
 from langchain_ollama import ChatOllama
 import boto3
 import google.auth
+from src.create_chunks import count_tokens
 from src.shared.constants import ADDITIONAL_INSTRUCTIONS
+from src.shared.fake_providers import FakeChatModel, FakeGraphTransformer, create_fake_chat_model
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
+from src.shared.llm_hedging import hedged_call
+from src.shared.llm_resilience import PartialExtractionError, extract_with_failover, get_failover_model, get_provider
+from src.shared.metrics import LLMMetricsHandler
 import re
 from langchain_core.callbacks.manager import CallbackManager
 from src.shared.common_fn import UniversalTokenUsageHandler,get_value_from_env
+from src.shared.rate_limiter import RateLimitFeedbackHandler, get_rate_limiter, release_abandoned_calls
+from src.shared.extraction_cache import extraction_cache_key, get_cached_graph_documents, save_graph_documents_to_cache
+
+# event loop (None outside of one) -> {(model, config): pooled client}
+_llm_pool = weakref.WeakKeyDictionary()
+_llm_pool_without_loop = {}
+_llm_pool_lock = threading.Lock()
+_structured_output_support = {}
+
+def _loop_pool(loop):
+    # caller holds _llm_pool_lock
+    if loop is None:
+        return _llm_pool_without_loop
+    pool = _llm_pool.get(loop)
+    if pool is None:
+        # pooled clients can reference their loop and keep it alive, so closed loops are dropped explicitly
+        for closed_loop in [pooled_loop for pooled_loop in _llm_pool.keys() if pooled_loop.is_closed()]:
+            del _llm_pool[closed_loop]
+        pool = _llm_pool[loop] = {}
+    return pool
 
 def get_llm(model: str):
-    """Retrieve the specified language model based on the model name."""
+    """
+    Retrieve the specified language model based on the model name.
+
+    Clients are created once per model config and event loop and shared by the whole
+    process, so HTTP connection pools and credentials are reused; async connection pools
+    cannot move between the API event loop and the one of the job workers. Clients of
+    closed or collected event loops are dropped from the pool. Every call
+    returns a shallow copy of the pooled client with its own token usage callback.
+    """
     model = model.upper().replace('.', '_').strip()
     env_key = f"LLM_MODEL_CONFIG_{model}"
     env_value = get_value_from_env(env_key)
@@ -32,10 +68,41 @@ def get_llm(model: str):
         raise Exception(err)
     
     logging.info("Model: {}".format(env_key))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    pool_key = (model, env_value)
+    with _llm_pool_lock:
+        pooled = _loop_pool(loop).get(pool_key)
+    if pooled is None:
+        # clients are built outside the lock, a concurrent build of the same config loses
+        created = create_llm(model, env_value)
+        with _llm_pool_lock:
+            pooled = _loop_pool(loop).setdefault(pool_key, created)
+        if pooled is created:
+            logging.info(f"Model created - Model Version: {model}")
+    pooled_llm, model_name, rate_limiter = pooled
+
+    if isinstance(pooled_llm, DiffbotGraphTransformer):
+        return pooled_llm, model_name, None
+
     callback_handler = UniversalTokenUsageHandler()
-    callback_manager = CallbackManager([callback_handler])
+    callback_handlers = [callback_handler, LLMMetricsHandler(get_provider(model), model)]
+    if rate_limiter is not None:
+        callback_handlers.append(RateLimitFeedbackHandler(rate_limiter))
+    llm = pooled_llm.model_copy(update={"callbacks": CallbackManager(callback_handlers)})
+    return llm, model_name, callback_handler
+
+def create_llm(model, env_value):
+    """Construct the client for a model config; called once per config by get_llm."""
+    rate_limiter = get_rate_limiter(model)
     try:
-        if "GEMINI" in model:
+        if "FAKE" in model:
+            # synthetic provider for load tests, see fake_providers.create_fake_chat_model
+            llm, model_name = create_fake_chat_model(env_value)
+
+        elif "GEMINI" in model:
             model_name = env_value
             credentials, project_id = google.auth.default()
             llm = ChatGoogleGenerativeAI(
@@ -44,7 +111,6 @@ def get_llm(model: str):
                 credentials=credentials,
                 project=project_id,
                 temperature=0,
-                callbacks=callback_manager,
                 safety_settings={
                     "HARM_CATEGORY_UNSPECIFIED": "BLOCK_NONE",
                     "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
@@ -60,14 +126,12 @@ def get_llm(model: str):
                 llm= ChatOpenAI(
                 api_key=api_key,
                 model=model_name,
-                callbacks=callback_manager,
                 )
             else:
                 llm = ChatOpenAI(
                 api_key=api_key,
                 model=model_name,
                 temperature=0,
-                callbacks=callback_manager,
                 )
 
         elif "AZURE" in model:
@@ -80,7 +144,6 @@ def get_llm(model: str):
                 temperature=0,
                 max_tokens=None,
                 timeout=None,
-                callbacks=callback_manager,
             )
 
         elif "ANTHROPIC" in model:
@@ -89,7 +152,6 @@ def get_llm(model: str):
                 "api_key": api_key,
                 "model": model_name,
                 "timeout": None,
-                "callbacks": callback_manager,
             }
             if not model_name.startswith("claude-opus-4-7"):
                 anthropic_kwargs["temperature"] = 0
@@ -97,11 +159,11 @@ def get_llm(model: str):
 
         elif "FIREWORKS" in model:
             model_name, api_key = env_value.split(",")
-            llm = ChatFireworks(api_key=api_key, model=model_name,callbacks=callback_manager)
+            llm = ChatFireworks(api_key=api_key, model=model_name)
 
         elif "GROQ" in model:
             model_name, base_url, api_key = env_value.split(",")
-            llm = ChatGroq(api_key=api_key, model_name=model_name, temperature=0,callbacks=callback_manager)
+            llm = ChatGroq(api_key=api_key, model_name=model_name, temperature=0)
 
         elif "BEDROCK" in model:
             model_name, aws_access_key, aws_secret_key, region_name = env_value.split(",")
@@ -113,12 +175,12 @@ def get_llm(model: str):
             )
 
             llm = ChatBedrock(
-                client=bedrock_client,region_name=region_name, model_id=model_name, model_kwargs=dict(temperature=0),callbacks=callback_manager, 
+                client=bedrock_client,region_name=region_name, model_id=model_name, model_kwargs=dict(temperature=0), 
             )
 
         elif "OLLAMA" in model:
             model_name, base_url = env_value.split(",")
-            llm = ChatOllama(base_url=base_url, model=model_name,callbacks=callback_manager)
+            llm = ChatOllama(base_url=base_url, model=model_name)
 
         elif "DIFFBOT" in model:
             #model_name = "diffbot"
@@ -127,7 +189,6 @@ def get_llm(model: str):
                 diffbot_api_key=api_key,
                 extract_types=["entities", "facts"],
             )
-            callback_handler = None
         
         else: 
             model_name, api_endpoint, api_key = env_value.split(",")
@@ -136,15 +197,17 @@ def get_llm(model: str):
                 base_url=api_endpoint,
                 model=model_name,
                 temperature=0,
-                callbacks=callback_manager,
             )
     except Exception as e:
         err = f"Error while creating LLM '{model}': {str(e)}"
         logging.error(err)
         raise Exception(err)
- 
-    logging.info(f"Model created - Model Version: {model}")
-    return llm, model_name, callback_handler
+
+    if isinstance(llm, DiffbotGraphTransformer):
+        rate_limiter = None
+    elif rate_limiter is not None:
+        llm.rate_limiter = rate_limiter
+    return llm, model_name, rate_limiter
 
 def get_llm_model_name(llm):
     """Extract name of llm model from llm object"""
@@ -181,6 +244,47 @@ def get_combined_chunks(chunkId_chunkDoc_list, chunks_to_combine):
         )
     return combined_chunk_document_list
 
+def get_chunk_token_budget(model):
+    """
+    Token budget of the chunk text packed into one LLM call for a model, or None when
+    ENABLE_CHUNK_TOKEN_PACKING is off. CHUNK_PACKING_TOKEN_BUDGET_<MODEL>, with the model
+    named as in LLM_MODEL_CONFIG_<MODEL>, overrides CHUNK_PACKING_TOKEN_BUDGET.
+    """
+    if not get_value_from_env("ENABLE_CHUNK_TOKEN_PACKING", "False", "bool"):
+        return None
+    model_key = model.upper().replace('.', '_').strip()
+    default_budget = get_value_from_env("CHUNK_PACKING_TOKEN_BUDGET", 2000, "int")
+    return get_value_from_env(f"CHUNK_PACKING_TOKEN_BUDGET_{model_key}", default_budget, "int")
+
+def get_packed_chunks(chunkId_chunkDoc_list, token_budget):
+    """
+    Pack consecutive chunks into combined documents of at most token_budget tokens, so
+    each LLM call gets a similar amount of text whatever the chunk lengths. A chunk
+    larger than the budget gets a document of its own.
+
+    Token counts come from chunking (metadata['token_count']); chunks reloaded from the
+    graph on retry are counted here.
+
+    Returns:
+        list: Documents with the chunk ids of each pack in metadata['combined_chunk_ids'].
+    """
+    combined_chunk_document_list = []
+    pack_contents, pack_ids, pack_tokens = [], [], 0
+    for document in chunkId_chunkDoc_list:
+        chunk_doc = document["chunk_doc"]
+        token_count = chunk_doc.metadata.get("token_count")
+        if token_count is None:
+            token_count = count_tokens(chunk_doc.page_content)
+        if pack_ids and pack_tokens + token_count > token_budget:
+            combined_chunk_document_list.append(Document(page_content="".join(pack_contents), metadata={"combined_chunk_ids": pack_ids}))
+            pack_contents, pack_ids, pack_tokens = [], [], 0
+        pack_contents.append(chunk_doc.page_content)
+        pack_ids.append(document["chunk_id"])
+        pack_tokens += token_count
+    if pack_ids:
+        combined_chunk_document_list.append(Document(page_content="".join(pack_contents), metadata={"combined_chunk_ids": pack_ids}))
+    return combined_chunk_document_list
+
 def get_chunk_id_as_doc_metadata(chunkId_chunkDoc_list):
     combined_chunk_document_list = [
        Document(
@@ -192,67 +296,143 @@ def get_chunk_id_as_doc_metadata(chunkId_chunkDoc_list):
     return combined_chunk_document_list
       
 
+def get_graph_transformer(llm, allowedNodes, allowedRelationship, additional_instructions=None):
+    """Return the graph transformer of an LLM: Diffbot itself, or an LLMGraphTransformer set up for its structured output support."""
+    if "diffbot_api_key" in dir(llm):
+        return llm
+    if isinstance(llm, FakeChatModel):
+        return FakeGraphTransformer(llm, allowedNodes, allowedRelationship)
+    probe_key = (type(llm).__name__, get_llm_model_name(llm))
+    supports_structured_output = _structured_output_support.get(probe_key)
+    if supports_structured_output is None:
+        try:
+            llm.with_structured_output(_Graph)
+            supports_structured_output = True
+        except Exception:
+            supports_structured_output = False
+        _structured_output_support[probe_key] = supports_structured_output
+    if supports_structured_output and not isinstance(llm, ChatGroq):
+        logging.info("LLM supports structured output; including descriptions in graph")
+        node_properties = ["description"]
+        relationship_properties = ["description"]
+        ignore_tool_usage = False
+    else:
+        logging.info("LLM does not support structured output; excluding descriptions in graph") 
+        node_properties = False
+        relationship_properties = False
+        ignore_tool_usage = True
+
+    return LLMGraphTransformer(
+        llm=llm,
+        node_properties=node_properties,
+        relationship_properties=relationship_properties,
+        allowed_nodes=allowedNodes,
+        allowed_relationships=allowedRelationship,
+        ignore_tool_usage=ignore_tool_usage,
+        additional_instructions=ADDITIONAL_INSTRUCTIONS+ (additional_instructions if additional_instructions else "")
+    )
+
 async def get_graph_document_list(
-    llm, combined_chunk_document_list, allowedNodes, allowedRelationship,callback_handler, additional_instructions=None
+    llm, combined_chunk_document_list, allowedNodes, allowedRelationship,callback_handler, additional_instructions=None, model=None
 ):
+    """
+    Extract graph documents from combined chunk documents.
+
+    With model given, each combined chunk is extracted on its own with retries, the
+    provider circuit breaker and failover to LLM_FAILOVER_MODEL(_<MODEL>) when configured
+    (see llm_resilience.extract_with_failover), and slow calls are hedged when
+    ENABLE_LLM_HEDGING is set. The estimated cost of hedges is added to the token usage.
+
+    Raises:
+        PartialExtractionError: If some combined chunks failed, carrying the successful ones
+            and the token usage of the batch.
+        LLMGraphBuilderException: If the extraction failed otherwise.
+    """
     if additional_instructions:
         additional_instructions = sanitize_additional_instruction(additional_instructions)
     graph_document_list = []
     token_usage = 0
+    failover_handlers = []
+    failover_llms = []
+    hedge_costs = []
+    partial_error = None
+
+    def hedged(extract, hedge_model):
+        async def extract_document(document):
+            return await hedged_call(lambda: extract(document), hedge_model, count_tokens(document.page_content), hedge_costs.append)
+        return extract_document
+
     try:
-        if "diffbot_api_key" in dir(llm):
-            llm_transformer = llm
-        else:
-            try:
-                llm.with_structured_output(_Graph)
-                supports_structured_output = True
-            except Exception:
-                supports_structured_output = False
-            if supports_structured_output and not isinstance(llm, ChatGroq):
-                logging.info("LLM supports structured output; including descriptions in graph")
-                node_properties = ["description"]
-                relationship_properties = ["description"]
-                ignore_tool_usage = False
-            else:
-                logging.info("LLM does not support structured output; excluding descriptions in graph") 
-                node_properties = False
-                relationship_properties = False
-                ignore_tool_usage = True
-            
-            llm_transformer = LLMGraphTransformer(
-                llm=llm,
-                node_properties=node_properties,
-                relationship_properties=relationship_properties,
-                allowed_nodes=allowedNodes,
-                allowed_relationships=allowedRelationship,
-                ignore_tool_usage=ignore_tool_usage,
-                additional_instructions=ADDITIONAL_INSTRUCTIONS+ (additional_instructions if additional_instructions else "")
-            )
-        
+        llm_transformer = get_graph_transformer(llm, allowedNodes, allowedRelationship, additional_instructions)
         if isinstance(llm,DiffbotGraphTransformer):
             graph_document_list = llm_transformer.convert_to_graph_documents(combined_chunk_document_list)
-        else:
+        elif model is None:
             graph_document_list = await llm_transformer.aconvert_to_graph_documents(combined_chunk_document_list)
+        else:
+            failover_model = get_failover_model(model)
+            failover_transformers = []
+
+            async def failover_extract(document):
+                # the failover client is only created once a combined chunk needs it
+                if not failover_transformers:
+                    failover_llm, _, failover_callback_handler = get_llm(failover_model)
+                    failover_llms.append(failover_llm)
+                    failover_handlers.append(failover_callback_handler)
+                    failover_transformers.append(get_graph_transformer(failover_llm, allowedNodes, allowedRelationship, additional_instructions))
+                return await failover_transformers[0].aprocess_response(document)
+
+            graph_document_list = await extract_with_failover(
+                combined_chunk_document_list,
+                hedged(llm_transformer.aprocess_response, model),
+                model,
+                failover_model,
+                hedged(failover_extract, failover_model) if failover_model else None,
+            )
+    except PartialExtractionError as e:
+        logging.error(f"Error in graph transformation: {e}")
+        partial_error = e
+        raise
     except Exception as e:
        logging.error(f"Error in graph transformation: {e}", exc_info=True)
        raise LLMGraphBuilderException(f"Graph transformation failed: {str(e)}")
     finally:
         try:
-            if callback_handler:
-                usage = callback_handler.report()
-                token_usage = usage.get("total_tokens", 0)
+            for handler in [callback_handler, *failover_handlers]:
+                if handler:
+                    usage = handler.report()
+                    token_usage += usage.get("total_tokens", 0)
+            if hedge_costs:
+                logging.info(f"{len(hedge_costs)} hedged LLM calls added an estimated {sum(hedge_costs)} tokens")
+                token_usage += sum(hedge_costs)
         except Exception as usage_err:
             logging.error(f"Error while reporting token usage: {usage_err}")
+        if partial_error is not None:
+            partial_error.token_usage = token_usage
+        for used_llm in [llm, *failover_llms]:
+            release_abandoned_calls(used_llm)
+        rate_limiter = getattr(llm, "rate_limiter", None)
+        if rate_limiter is not None and hasattr(rate_limiter, "snapshot"):
+            logging.info(f"Rate limiter metrics: {rate_limiter.snapshot()}")
 
     return graph_document_list, token_usage
 
 async def get_graph_from_llm(model, chunkId_chunkDoc_list, allowedNodes, allowedRelationship, chunks_to_combine, additional_instructions=None):
+   """
+   Returns:
+       tuple: (graph_documents, token_usage, failed_chunk_ids), failed_chunk_ids holding the
+       chunks of combined chunks that still failed after retries and failover.
+   """
    try:
        llm, model_name,callback_handler = get_llm(model)
        logging.info(f"Using model: {model_name}")
     
-       combined_chunk_document_list = get_combined_chunks(chunkId_chunkDoc_list, chunks_to_combine)
-       logging.info(f"Combined {len(combined_chunk_document_list)} chunks")
+       token_budget = get_chunk_token_budget(model)
+       if token_budget:
+           combined_chunk_document_list = get_packed_chunks(chunkId_chunkDoc_list, token_budget)
+           logging.info(f"Packed {len(chunkId_chunkDoc_list)} chunks into {len(combined_chunk_document_list)} LLM calls of up to {token_budget} tokens")
+       else:
+           combined_chunk_document_list = get_combined_chunks(chunkId_chunkDoc_list, chunks_to_combine)
+           logging.info(f"Combined {len(combined_chunk_document_list)} chunks")
     
        if allowedNodes:
            allowed_nodes = [node.strip() for node in allowedNodes.split(',') if node.strip()]
@@ -277,16 +457,60 @@ async def get_graph_from_llm(model, chunkId_chunkDoc_list, allowedNodes, allowed
        else:
            logging.info("No allowed relationships provided")
 
-       graph_document_list,token_usage = await get_graph_document_list(
-           llm,
-           combined_chunk_document_list,
-           allowed_nodes,
-           allowed_relationships,
-           callback_handler,
-           additional_instructions,
-       )
-       logging.info(f"Generated {len(graph_document_list)} graph documents")
-       return graph_document_list, token_usage
+       cache_keys = [
+           extraction_cache_key(document.page_content, model, model_name, allowed_nodes, allowed_relationships, additional_instructions)
+           for document in combined_chunk_document_list
+       ]
+       cached_graph_documents = get_cached_graph_documents(combined_chunk_document_list, cache_keys)
+       uncached_document_list = [document for i, document in enumerate(combined_chunk_document_list) if i not in cached_graph_documents]
+
+       cache_key_by_chunk_ids = {tuple(document.metadata["combined_chunk_ids"]): key for key, document in zip(cache_keys, combined_chunk_document_list)}
+
+       def cache_extracted(graph_documents):
+           # results of a failover model are not cached under the key of the requested model
+           save_graph_documents_to_cache({
+               cache_key_by_chunk_ids[chunk_ids]: graph_document
+               for graph_document in graph_documents
+               if (chunk_ids := tuple(graph_document.source.metadata.get("combined_chunk_ids", []))) in cache_key_by_chunk_ids
+               and not graph_document.source.metadata.get("failover_model")
+           })
+
+       token_usage = 0
+       extracted_graph_documents = []
+       failed_chunk_ids = []
+       if uncached_document_list:
+           try:
+               extracted_graph_documents,token_usage = await get_graph_document_list(
+                   llm,
+                   uncached_document_list,
+                   allowed_nodes,
+                   allowed_relationships,
+                   callback_handler,
+                   additional_instructions,
+                   model,
+               )
+           except PartialExtractionError as e:
+               if not e.graph_documents and not cached_graph_documents:
+                   raise LLMGraphBuilderException(f"Graph transformation failed: {e}")
+               # the successful combined chunks are written now; the failed ones keep no embedding,
+               # so start_from_last_processed_position only sends them to the LLM again
+               extracted_graph_documents, token_usage = e.graph_documents, e.token_usage
+               failed_chunk_ids = [chunk_id for document in e.failed_documents for chunk_id in document.metadata["combined_chunk_ids"]]
+               logging.warning(f"Continuing without {len(failed_chunk_ids)} chunks whose extraction failed: {e}")
+       if cached_graph_documents:
+           # cache hits cost no tokens; keep the combined chunk order for the graph writes
+           extracted_by_chunk_ids = {tuple(graph_document.source.metadata.get("combined_chunk_ids", [])): graph_document for graph_document in extracted_graph_documents}
+           graph_document_list = []
+           for i, document in enumerate(combined_chunk_document_list):
+               if i in cached_graph_documents:
+                   graph_document_list.append(cached_graph_documents[i])
+               elif tuple(document.metadata["combined_chunk_ids"]) in extracted_by_chunk_ids:
+                   graph_document_list.append(extracted_by_chunk_ids[tuple(document.metadata["combined_chunk_ids"])])
+       else:
+           graph_document_list = extracted_graph_documents
+       cache_extracted(extracted_graph_documents)
+       logging.info(f"Generated {len(graph_document_list)} graph documents, {len(cached_graph_documents)} from extraction cache")
+       return graph_document_list, token_usage, failed_chunk_ids
    except Exception as e:
        logging.error(f"Error in get_graph_from_llm: {e}", exc_info=True)
        raise LLMGraphBuilderException(f"Error in getting graph from llm: {e}")
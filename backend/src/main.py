@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -17,7 +18,7 @@ from langchain_core.documents import Document
 from langchain_neo4j import Neo4jGraph
 
 
-from src.create_chunks import CreateChunksofDocument
+from src.create_chunks import ChunkBatches, CreateChunksofDocument
 from src.document_sources.gcs_bucket import (
     copy_failed_file, delete_file_from_gcs, get_documents_from_gcs,
     get_gcs_bucket_files_info, merge_file_gcs, upload_file_to_gcs
@@ -30,23 +31,28 @@ from src.document_sources.youtube import get_documents_from_youtube, get_youtube
 from src.entities.source_node import sourceNode
 from src.graph_query import get_graphDB_driver
 from src.graphDB_dataAccess import graphDBdataAccess
+from src.graph_writer import database_key, write_graph_documents
 from src.llm import get_graph_from_llm
 from src.make_relationships import (
-    create_chunk_embeddings, create_chunk_vector_index, create_relation_between_chunks,
-    execute_graph_query, merge_relationship_between_chunk_and_entites
+    create_chunk_vector_index, create_relation_between_chunks, execute_graph_query, iter_chunk_graph,
+    get_chunk_embeddings, save_chunk_embeddings
 )
 from src.shared.common_fn import (
     check_url_source, create_gcs_bucket_folder_name_hashed, create_graph_database_connection,
     delete_uploaded_local_file, get_chunk_and_graphDocument, get_value_from_env,
-    handle_backticks_nodes_relationship_id_type, last_url_segment, save_graphDocuments_in_neo4j, track_token_usage
+    handle_backticks_nodes_relationship_id_type, last_url_segment, track_token_usage
 )
+from src.shared.cancellation import register_cancellation, request_cancellation, unregister_cancellation
+from src.shared.chunk_dedup import get_chunk_deduplicator
+from src.shared.document_counters import DocumentCountTracker
 from src.shared.constants import (
     DELETE_ENTITIES_AND_START_FROM_BEGINNING, QUERY_TO_DELETE_EXISTING_ENTITIES,
     QUERY_TO_GET_CHUNKS, QUERY_TO_GET_LAST_PROCESSED_CHUNK_POSITION,
-    QUERY_TO_GET_LAST_PROCESSED_CHUNK_WITHOUT_ENTITY, QUERY_TO_GET_NODES_AND_RELATIONS_OF_A_DOCUMENT,
+    QUERY_TO_GET_LAST_PROCESSED_CHUNK_WITHOUT_ENTITY,
     START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION
 )
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
+from src.shared.metrics import EXTRACTIONS_IN_FLIGHT, QUEUE_DEPTH, StageTimings
 from src.shared.schema_extraction import schema_extraction_from_text
 
 import requests
@@ -62,6 +68,11 @@ if GCS_FILE_CACHE:
     BUCKET_FAILED_FILE = get_value_from_env('BUCKET_FAILED_FILE', default_value=None, data_type=str)
     PROJECT_ID = get_value_from_env('PROJECT_ID', default_value=None, data_type=str)
 
+# metric children are bound once, so updating a gauge costs no label lookup
+EXTRACTION_QUEUE_DEPTH = QUEUE_DEPTH.labels("pipeline_extraction")
+WRITE_QUEUE_DEPTH = QUEUE_DEPTH.labels("pipeline_write")
+IN_FLIGHT_EXTRACTIONS = EXTRACTIONS_IN_FLIGHT.labels()
+
 
 def create_source_node_graph_url_s3(graph, params):
     """
@@ -333,10 +344,11 @@ async def extract_graph_from_file_local_file(credentials, params, merged_file_pa
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     if GCS_FILE_CACHE:
       folder_name = create_gcs_bucket_folder_name_hashed(credentials.uri, params.file_name)
-      file_name, pages = get_documents_from_gcs( PROJECT_ID, BUCKET_UPLOAD_FILE, folder_name, params.file_name)
+      file_name, pages = await asyncio.to_thread(get_documents_from_gcs, PROJECT_ID, BUCKET_UPLOAD_FILE, folder_name, params.file_name)
     else:
-      file_name, pages, file_extension = get_documents_from_file_by_path(merged_file_path, params.file_name)
-    if pages is None or len(pages)==0:
+      file_name, pages, file_extension = await asyncio.to_thread(get_documents_from_file_by_path, merged_file_path, params.file_name)
+    # pages are a lazy iterator, None when the file has no content
+    if pages is None:
       raise LLMGraphBuilderException(f'File content is not available for file : {file_name}')
     return await processing_source(credentials, params, pages, merged_file_path, True)
   else:
@@ -351,15 +363,15 @@ async def extract_graph_from_file_s3(credentials, params):
       params: SourceScanExtractParams object.
 
   Returns:
-      dict: Processing latency and response details.
+      dict: Response details.
   """
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     if params.aws_access_key_id is None or params.aws_secret_access_key is None:
       raise LLMGraphBuilderException('Please provide AWS access and secret keys')
     else:
       logging.info("Insert in S3 Block")
-      file_name, pages = get_documents_from_s3(params.source_url, params.aws_access_key_id, params.aws_secret_access_key)
-    if pages is None or len(pages)==0:
+      file_name, pages = await asyncio.to_thread(get_documents_from_s3, params.source_url, params.aws_access_key_id, params.aws_secret_access_key)
+    if pages is None:
       raise LLMGraphBuilderException(f'File content is not available for file : {file_name}')
     return await processing_source(credentials, params, pages)
   else:
@@ -374,7 +386,7 @@ async def extract_graph_from_web_page(credentials, params):
       params: SourceScanExtractParams object.
 
   Returns:
-      dict: Processing latency and response details.
+      dict: Response details.
   """
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     pages = get_documents_from_web_page(params.source_url)
@@ -393,7 +405,7 @@ async def extract_graph_from_file_youtube(credentials, params):
       params: SourceScanExtractParams object.
 
   Returns:
-      dict: Processing latency and response details.
+      dict: Response details.
   """
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     file_name, pages = get_documents_from_youtube(params.source_url)
@@ -413,7 +425,7 @@ async def extract_graph_from_file_Wikipedia(credentials, params):
       params: SourceScanExtractParams object.
 
   Returns:
-      dict: Processing latency and response details.
+      dict: Response details.
   """
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     file_name, pages = get_documents_from_wikipedia(params.wiki_query, params.language)
@@ -432,11 +444,11 @@ async def extract_graph_from_file_gcs(credentials, params):
       params: SourceScanExtractParams object.
 
   Returns:
-      dict: Processing latency and response details.
+      dict: Response details.
   """
   if params.retry_condition in ["", None] or params.retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
-    file_name, pages = get_documents_from_gcs(params.gcs_project_id, params.gcs_bucket_name, params.gcs_bucket_folder, params.gcs_blob_filename, params.access_token)
-    if pages is None or len(pages)==0:
+    file_name, pages = await asyncio.to_thread(get_documents_from_gcs, params.gcs_project_id, params.gcs_bucket_name, params.gcs_bucket_folder, params.gcs_blob_filename, params.access_token)
+    if pages is None:
       raise LLMGraphBuilderException(f'File content is not available for file : {file_name}')
     return await processing_source(credentials, params, pages)
   else:
@@ -453,34 +465,26 @@ async def processing_source(credentials, params, pages, merged_file_path=None, i
    
    Returns: 
    	 Json response to API with fileName, nodeCount, relationshipCount, processingTime, 
-     status and model as attributes.
+     status, model and stage_seconds (seconds spent per pipeline stage) as attributes.
   """
-  uri_latency = {}
+  timings = StageTimings()
   response = {}  
   start_time = datetime.now()
   processing_source_start_time = time.time()
-  start_create_connection = time.time()
   graph = create_graph_database_connection(credentials)
-  end_create_connection = time.time()
-  elapsed_create_connection = end_create_connection - start_create_connection
-  logging.info(f'Time taken database connection: {elapsed_create_connection:.2f} seconds')
-  uri_latency["create_connection"] = f'{elapsed_create_connection:.2f}'
   graphDb_data_Access = graphDBdataAccess(graph)
   create_chunk_vector_index(graph, params.embedding_provider,params.embedding_model)
   start_get_chunkId_chunkDoc_list = time.time()
-  total_chunks, chunkId_chunkDoc_list = get_chunkId_chunkDoc_list(graph, params.file_name, pages, params.token_chunk_size, params.chunk_overlap, params.retry_condition, credentials.email)
+  # loading and parsing pages happens while chunking, so it runs off the event loop
+  total_chunks, chunkId_chunkDoc_list = await asyncio.to_thread(get_chunkId_chunkDoc_list, graph, params.file_name, pages, params.token_chunk_size, params.chunk_overlap, params.retry_condition, credentials.email)
   end_get_chunkId_chunkDoc_list = time.time()
   elapsed_get_chunkId_chunkDoc_list = end_get_chunkId_chunkDoc_list - start_get_chunkId_chunkDoc_list
   logging.info(f'Time taken to create list chunkids with chunk document: {elapsed_get_chunkId_chunkDoc_list:.2f} seconds')
-  uri_latency["create_list_chunk_and_document"] = f'{elapsed_get_chunkId_chunkDoc_list:.2f}'
-  uri_latency["total_chunks"] = total_chunks
+  if total_chunks is not None:
+    # streamed files are chunked during extraction instead
+    timings.record("chunking", elapsed_get_chunkId_chunkDoc_list)
 
-  start_status_document_node = time.time()
   result = graphDb_data_Access.get_current_status_document_node(params.file_name)
-  end_status_document_node = time.time()
-  elapsed_status_document_node = end_status_document_node - start_status_document_node
-  logging.info(f'Time taken to get the current status of document node: {elapsed_status_document_node:.2f} seconds')
-  uri_latency["get_status_document_node"] = f'{elapsed_status_document_node:.2f}'
 
   select_chunks_with_retry=0
   node_count = 0
@@ -507,13 +511,7 @@ async def processing_source(credentials, params, pages, merged_file_path=None, i
       #pre checking if user is allowed to process the file
       if get_value_from_env("TRACK_USER_USAGE", "false", "bool"):
         track_token_usage(credentials.email, credentials.uri, 0, params.model, operation_type="precheck")
-      start_update_source_node = time.time()
       graphDb_data_Access.update_source_node(obj_source_node)
-      graphDb_data_Access.update_node_relationship_count(params.file_name)
-      end_update_source_node = time.time()
-      elapsed_update_source_node = end_update_source_node - start_update_source_node
-      logging.info(f'Time taken to update the document source node: {elapsed_update_source_node:.2f} seconds')
-      uri_latency["update_source_node"] = f'{elapsed_update_source_node:.2f}'
 
       logging.info('Update the status as Processing')
       update_graph_chunk_processed = get_value_from_env("UPDATE_GRAPH_CHUNKS_PROCESSED",20,"int")
@@ -521,85 +519,83 @@ async def processing_source(credentials, params, pages, merged_file_path=None, i
       is_cancelled_status = False
       job_status = "Completed"
       tokens_per_file = 0
-      for i in range(0, len(chunkId_chunkDoc_list), update_graph_chunk_processed):
-        select_chunks_upto = i+update_graph_chunk_processed
-        logging.info(f'Selected Chunks upto: {select_chunks_upto}')
-        if len(chunkId_chunkDoc_list) <= select_chunks_upto:
-          select_chunks_upto = len(chunkId_chunkDoc_list)
-        selected_chunks = chunkId_chunkDoc_list[i:select_chunks_upto]
-        
-        result = graphDb_data_Access.get_current_status_document_node(params.file_name)
-        is_cancelled_status = result[0]['is_cancelled']
-        logging.info(f"Value of is_cancelled : {result[0]['is_cancelled']}")
-        if bool(is_cancelled_status):
-          job_status = "Cancelled"
-          logging.info('Exit from running loop of processing file')
-          break
+      failed_chunks = 0
+      # the Document counters are maintained from deltas, starting from the stored values
+      count_tracker = DocumentCountTracker(graphDb_data_Access, params.file_name)
+      count_tracker.seed()
+      if total_chunks is not None:
+        # the chunk graph of a non streamed file was written above
+        count_tracker.chunks_created(total_chunks)
+      dedup = get_chunk_deduplicator(graph, credentials, params)
+      cancellation = register_cancellation(credentials, params.file_name)
+      chunk_batches = ChunkBatches(chunkId_chunkDoc_list, on_created=count_tracker.add_chunks, is_cancelled=cancellation.is_cancelled)
+      IN_FLIGHT_EXTRACTIONS.inc()
+      try:
+        if get_value_from_env("ENABLE_PIPELINED_EXTRACTION", "False", "bool"):
+          node_count, rel_count, tokens_per_file, failed_chunks, job_status = await processing_chunks_pipelined(chunk_batches, update_graph_chunk_processed, graph, graphDb_data_Access, credentials, params, start_time, select_chunks_with_retry, node_count, rel_count, timings, cancellation, count_tracker, dedup)
         else:
-          processing_chunks_start_time = time.time()
-          node_count,rel_count,latency_processed_chunk,token_usage = await processing_chunks(selected_chunks,graph,credentials,params.file_name,params.model,params.allowedNodes,params.allowedRelationship,params.chunks_to_combine,node_count, rel_count, params.additional_instructions, params.embedding_provider, params.embedding_model)
-          logging.info("Token used in processing chunks: %s", token_usage)
-          tokens_per_file += token_usage
-          logging.info("Total token used per file: %s", tokens_per_file)
-          start_save_token = time.time()
-          try:
-            if get_value_from_env("TRACK_USER_USAGE", "false", "bool"):
-                    track_token_usage(credentials.email,credentials.uri,token_usage, params.model, operation_type="extraction")
-                    logging.info("Token usage for extraction: %s for user: %s", token_usage, credentials.email)
-          except LLMGraphBuilderException as e:
-            logging.info(f"Error while tracking token usage: {e}")
-            obj_source_node = sourceNode()
-            obj_source_node.file_name = params.file_name
-            obj_source_node.updated_at = datetime.now()
-            obj_source_node.processing_time = datetime.now() - start_time
-            obj_source_node.processed_chunk = select_chunks_upto + select_chunks_with_retry
-            obj_source_node.token_usage = tokens_per_file
-            graphDb_data_Access.update_source_node(obj_source_node)
-            graphDb_data_Access.update_node_relationship_count(params.file_name)
-            raise e
-          end_save_token = time.time()
-          elapsed_save_token = end_save_token - start_save_token
-          logging.info(f'Time taken to save token count: {elapsed_save_token:.2f} seconds')
-
-          processing_chunks_end_time = time.time()
-          processing_chunks_elapsed_end_time = processing_chunks_end_time - processing_chunks_start_time
-          logging.info(f"Time taken {update_graph_chunk_processed} chunks processed upto {select_chunks_upto} completed in {processing_chunks_elapsed_end_time:.2f} seconds for file name {params.file_name}")
-          uri_latency[f'processed_combine_chunk_{i}-{select_chunks_upto}'] = f'{processing_chunks_elapsed_end_time:.2f}'
-          uri_latency[f'processed_chunk_detail_{i}-{select_chunks_upto}'] = latency_processed_chunk
-          end_time = datetime.now()
-          processed_time = end_time - start_time
+          async for i, select_chunks_upto, selected_chunks in chunk_batches.batches(update_graph_chunk_processed):
+            logging.info(f'Selected Chunks upto: {select_chunks_upto}')
           
-          obj_source_node = sourceNode()
-          obj_source_node.file_name = params.file_name
-          obj_source_node.updated_at = end_time
-          obj_source_node.processing_time = processed_time
-          obj_source_node.processed_chunk = select_chunks_upto+select_chunks_with_retry
-          obj_source_node.token_usage = tokens_per_file
-          if params.retry_condition == START_FROM_BEGINNING:
-            result = execute_graph_query(graph,QUERY_TO_GET_NODES_AND_RELATIONS_OF_A_DOCUMENT, params={"filename":params.file_name})
-            obj_source_node.node_count = result[0]['nodes']
-            obj_source_node.relationship_count = result[0]['rels']
-          else:  
-            obj_source_node.node_count = node_count
-            obj_source_node.relationship_count = rel_count
-          graphDb_data_Access.update_source_node(obj_source_node)
-          graphDb_data_Access.update_node_relationship_count(params.file_name)
+            is_cancelled_status = cancellation.is_cancelled()
+            logging.info(f"Value of is_cancelled : {is_cancelled_status}")
+            if bool(is_cancelled_status):
+              job_status = "Cancelled"
+              logging.info('Exit from running loop of processing file')
+              break
+            else:
+              processing_chunks_start_time = time.time()
+              try:
+                node_count,rel_count,token_usage,batch_failed_chunks = await cancellation.run(processing_chunks(selected_chunks,graph,credentials,params.file_name,params.model,params.allowedNodes,params.allowedRelationship,params.chunks_to_combine,node_count, rel_count, params.additional_instructions, params.embedding_provider, params.embedding_model, timings, count_tracker, dedup))
+              except asyncio.CancelledError:
+                if not cancellation.is_cancelled():
+                  raise
+                job_status = "Cancelled"
+                logging.info(f'Aborted in-flight chunks {i}-{select_chunks_upto} of cancelled file {params.file_name}')
+                break
+              logging.info("Token used in processing chunks: %s", token_usage)
+              tokens_per_file += token_usage
+              failed_chunks += batch_failed_chunks
+              logging.info("Total token used per file: %s", tokens_per_file)
+              save_processed_batch_progress(graph, graphDb_data_Access, credentials, params, start_time, select_chunks_upto+select_chunks_with_retry-failed_chunks, token_usage, tokens_per_file, node_count, rel_count, chunk_batches.created if chunk_batches.streaming else None)
+
+              processing_chunks_end_time = time.time()
+              processing_chunks_elapsed_end_time = processing_chunks_end_time - processing_chunks_start_time
+              logging.info(f"Time taken {update_graph_chunk_processed} chunks processed upto {select_chunks_upto} completed in {processing_chunks_elapsed_end_time:.2f} seconds for file name {params.file_name}")
+              timings.record("batch", processing_chunks_elapsed_end_time)
+      finally:
+        IN_FLIGHT_EXTRACTIONS.dec()
+        unregister_cancellation(cancellation)
+      if chunk_batches.streaming:
+        # a streamed file only knows its size once every chunk is created; a cancelled one
+        # stops at the chunks created so far
+        total_chunks = await chunk_batches.finish()
+      if dedup is not None:
+        response["chunk_dedup"] = dedup.summary()
+        logging.info(f'Chunk dedup savings for file name {params.file_name}: {response["chunk_dedup"]}')
       result = graphDb_data_Access.get_current_status_document_node(params.file_name)
-      is_cancelled_status = result[0]['is_cancelled']
+      is_cancelled_status = result[0]['is_cancelled'] or cancellation.is_cancelled()
       if bool(is_cancelled_status):
         logging.info('Is_cancelled True at the end extraction')
         job_status = 'Cancelled'
+      elif failed_chunks:
+        job_status = 'Failed'
       logging.info(f'Job Status at the end : {job_status}')
       end_time = datetime.now()
       processed_time = end_time - start_time
       obj_source_node = sourceNode()
       obj_source_node.file_name = params.file_name.strip() if isinstance(params.file_name, str) else params.file_name
       obj_source_node.status = job_status
+      if job_status == 'Failed':
+        obj_source_node.error_message = f'Extraction failed for {failed_chunks} chunks. Reprocess the file from the last processed position to extract only those chunks.'
+        logging.warning(f'{obj_source_node.error_message} File name: {params.file_name}')
       obj_source_node.processing_time = processed_time
       obj_source_node.token_usage = tokens_per_file
+      obj_source_node.total_chunks = total_chunks
 
       graphDb_data_Access.update_source_node(obj_source_node)
-      graphDb_data_Access.update_node_relationship_count(params.file_name)
+      # chunk dedup links reused entities outside the counted batches
+      count_tracker.reconcile(required=dedup is not None)
       logging.info('Updated the nodeCount and relCount properties in Document node')
       logging.info(f'file:{params.file_name} extraction has been completed')
 
@@ -614,77 +610,295 @@ async def processing_source(credentials, params, pages, merged_file_path=None, i
           delete_uploaded_local_file(merged_file_path, params.file_name)  
       processing_source_func = time.time() - processing_source_start_time
       logging.info(f"Time taken to processing source function completed in {processing_source_func:.2f} seconds for file name {params.file_name}")  
-      uri_latency["Processed_source"] = f'{processing_source_func:.2f}'
-      if node_count == 0:
-        uri_latency["Per_entity_latency"] = 'N/A'
-      else:  
-        uri_latency["Per_entity_latency"] = f'{int(processing_source_func)/node_count}/s'
+      timings.record("source", processing_source_func)
       
       response["fileName"] = params.file_name
       response["nodeCount"] = node_count
       response["relationshipCount"] = rel_count
       response["total_processing_time"] = round(processed_time.total_seconds(),2)
       response["status"] = job_status
+      if failed_chunks:
+        response["failed_chunks"] = failed_chunks
       response["model"] = params.model
       response["success_count"] = 1
       response['token_usage'] = tokens_per_file
+      response["total_chunks"] = total_chunks
+      response["stage_seconds"] = timings.summary()
+      logging.info(f'Stage seconds for file name {params.file_name}: {response["stage_seconds"]}')
       
-      return uri_latency, response
+      return response
     else:      
       logging.info("File does not process because its already in Processing status")
-      return uri_latency,response
+      return response
   else:
     error_message = "Unable to get the status of document node."
     logging.error(error_message)
     raise LLMGraphBuilderException(error_message)
 
-async def processing_chunks(chunkId_chunkDoc_list,graph,credentials,file_name,model,allowedNodes,allowedRelationship, chunks_to_combine, node_count, rel_count, additional_instructions, embedding_provider, embedding_model):
-  #create vector index and update chunk node with embedding
-  latency_processing_chunk = {}
-  if graph is not None:
-    if graph._driver._closed:
-      graph = create_graph_database_connection(credentials)
-  else:
+def save_processed_batch_progress(graph, graphDb_data_Access, credentials, params, start_time, processed_chunk, token_usage, tokens_per_file, node_count, rel_count, total_chunks=None):
+  """
+  Track the token usage of a processed batch and checkpoint the progress on the Document node.
+
+  Args:
+      graph: Neo4j graph connection.
+      graphDb_data_Access: graphDBdataAccess object for the same connection.
+      credentials: Database credentials.
+      params: SourceScanExtractParams object.
+      start_time (datetime): Time the processing of the file started.
+      processed_chunk (int): Number of chunks processed so far, including chunks skipped on retry
+          and excluding chunks whose extraction failed.
+      token_usage (int): Tokens used by the batch.
+      tokens_per_file (int): Tokens used by the file so far.
+      node_count (int): Node count of the document after the batch.
+      rel_count (int): Relationship count of the document after the batch.
+      total_chunks (int): Chunks created so far when the file is streamed, else None.
+  """
+  start_save_token = time.time()
+  try:
+    if get_value_from_env("TRACK_USER_USAGE", "false", "bool"):
+            track_token_usage(credentials.email,credentials.uri,token_usage, params.model, operation_type="extraction")
+            logging.info("Token usage for extraction: %s for user: %s", token_usage, credentials.email)
+  except LLMGraphBuilderException as e:
+    logging.info(f"Error while tracking token usage: {e}")
+    obj_source_node = sourceNode()
+    obj_source_node.file_name = params.file_name
+    obj_source_node.updated_at = datetime.now()
+    obj_source_node.processing_time = datetime.now() - start_time
+    obj_source_node.processed_chunk = processed_chunk
+    obj_source_node.token_usage = tokens_per_file
+    graphDb_data_Access.update_source_node(obj_source_node)
+    graphDb_data_Access.update_node_relationship_count(params.file_name)
+    raise e
+  end_save_token = time.time()
+  elapsed_save_token = end_save_token - start_save_token
+  logging.info(f'Time taken to save token count: {elapsed_save_token:.2f} seconds')
+
+  end_time = datetime.now()
+  processed_time = end_time - start_time
+  
+  obj_source_node = sourceNode()
+  obj_source_node.file_name = params.file_name
+  obj_source_node.updated_at = end_time
+  obj_source_node.processing_time = processed_time
+  obj_source_node.processed_chunk = processed_chunk
+  obj_source_node.token_usage = tokens_per_file
+  # node_count and rel_count come from the incrementally maintained Document counters
+  obj_source_node.node_count = node_count
+  obj_source_node.relationship_count = rel_count
+  obj_source_node.total_chunks = total_chunks
+  graphDb_data_Access.update_source_node(obj_source_node)
+
+async def processing_chunks_pipelined(chunk_batches, batch_size, graph, graphDb_data_Access, credentials, params, start_time, select_chunks_with_retry, node_count, rel_count, timings, cancellation, count_tracker=None, dedup=None):
+  """
+  Process the chunks of a file as a bounded three stage pipeline so that embedding,
+  LLM extraction and Neo4j writes of consecutive batches overlap:
+
+      embedding -> extraction queue -> LLM extraction -> write queue -> graph write
+
+  Batches are written and checkpointed strictly in order. On cancellation no new
+  batch enters the pipeline and the stages in flight are aborted.
+
+  Args:
+      chunk_batches (ChunkBatches): Chunk id and chunk document dicts to process.
+      batch_size (int): Number of chunks per batch (UPDATE_GRAPH_CHUNKS_PROCESSED).
+      graph: Neo4j graph connection.
+      graphDb_data_Access: graphDBdataAccess object for the same connection.
+      credentials: Database credentials.
+      params: SourceScanExtractParams object.
+      start_time (datetime): Time the processing of the file started.
+      select_chunks_with_retry (int): Number of chunks already processed before a retry.
+      node_count (int): Entity node count before processing.
+      rel_count (int): Entity relationship count before processing.
+      timings (StageTimings): Stage durations of the file.
+      cancellation (CancellationToken): Cancellation token of the file.
+      count_tracker (DocumentCountTracker): Maintains the Document counters between batches.
+      dedup (ChunkDeduplicator): Skips extraction of chunks duplicating extracted ones, when enabled.
+
+  Returns:
+      tuple: (node_count, rel_count, tokens_per_file, failed_chunks, job_status)
+  """
+  queue_size = get_value_from_env("PIPELINE_QUEUE_SIZE", 2, "int")
+  extraction_queue = asyncio.Queue(maxsize=queue_size)
+  write_queue = asyncio.Queue(maxsize=queue_size)
+  max_queue_depth = {"extraction": 0, "write": 0}
+  # items this file added to the process-wide queue depth gauges
+  queued = {"extraction": 0, "write": 0}
+  tokens_per_file = 0
+  failed_chunks = 0
+  job_status = "Completed"
+  if graph is None or graph._driver._closed:
     graph = create_graph_database_connection(credentials)
-    
-  start_update_embedding = time.time()
-  create_chunk_embeddings( graph, chunkId_chunkDoc_list, file_name, embedding_provider, embedding_model)
-  end_update_embedding = time.time()
-  elapsed_update_embedding = end_update_embedding - start_update_embedding
-  logging.info(f'Time taken to update embedding in chunk node: {elapsed_update_embedding:.2f} seconds')
-  latency_processing_chunk["update_embedding"] = f'{elapsed_update_embedding:.2f}'
+  logging.info(f'Pipelined extraction with queue size {queue_size} for file name {params.file_name}')
+
+  async def embedding_stage():
+    nonlocal job_status
+    try:
+      async for i, select_chunks_upto, selected_chunks in chunk_batches.batches(batch_size):
+        if cancellation.is_cancelled():
+          job_status = "Cancelled"
+          logging.info('Exit from running pipeline of processing file')
+          break
+        batch_start_time = time.time()
+        embedding_data = await asyncio.to_thread(get_chunk_embeddings, selected_chunks, params.embedding_provider, params.embedding_model)
+        timings.record("embedding", time.time() - batch_start_time)
+        await extraction_queue.put((i, select_chunks_upto, selected_chunks, embedding_data, batch_start_time))
+        queued["extraction"] += 1
+        EXTRACTION_QUEUE_DEPTH.inc()
+        max_queue_depth["extraction"] = max(max_queue_depth["extraction"], extraction_queue.qsize())
+        logging.info(f'Pipeline queue depth after embedding chunks {i}-{select_chunks_upto}: extraction={extraction_queue.qsize()}, write={write_queue.qsize()}')
+    finally:
+      await extraction_queue.put(None)
+
+  async def extraction_stage():
+    try:
+      while True:
+        item = await extraction_queue.get()
+        if item is None:
+          break
+        queued["extraction"] -= 1
+        EXTRACTION_QUEUE_DEPTH.dec()
+        i, select_chunks_upto, selected_chunks, embedding_data, batch_start_time = item
+        chunks_to_extract = selected_chunks
+        if dedup is not None:
+          start_chunk_dedup = time.time()
+          chunks_to_extract = await asyncio.to_thread(dedup.filter_batch, selected_chunks)
+          timings.record("chunk_dedup", time.time() - start_chunk_dedup)
+        graph_documents, token_usage, failed_chunk_ids = await extract_graph_documents_from_chunks(chunks_to_extract, params.model, params.allowedNodes, params.allowedRelationship, params.chunks_to_combine, params.additional_instructions, timings)
+        await write_queue.put((i, select_chunks_upto, selected_chunks, embedding_data, graph_documents, token_usage, failed_chunk_ids, batch_start_time))
+        queued["write"] += 1
+        WRITE_QUEUE_DEPTH.inc()
+        max_queue_depth["write"] = max(max_queue_depth["write"], write_queue.qsize())
+        logging.info(f'Pipeline queue depth after extracting chunks {i}-{select_chunks_upto}: extraction={extraction_queue.qsize()}, write={write_queue.qsize()}')
+    finally:
+      await write_queue.put(None)
+
+  async def write_stage():
+    nonlocal node_count, rel_count, tokens_per_file, failed_chunks
+    while True:
+      item = await write_queue.get()
+      if item is None:
+        break
+      queued["write"] -= 1
+      WRITE_QUEUE_DEPTH.dec()
+      i, select_chunks_upto, selected_chunks, embedding_data, graph_documents, token_usage, failed_chunk_ids, batch_start_time = item
+      node_count, rel_count = await asyncio.to_thread(save_graph_documents_of_chunks, graph, credentials, params.file_name, selected_chunks, embedding_data, graph_documents, timings, count_tracker, dedup, failed_chunk_ids)
+      logging.info("Token used in processing chunks: %s", token_usage)
+      tokens_per_file += token_usage
+      failed_chunks += len(failed_chunk_ids)
+      logging.info("Total token used per file: %s", tokens_per_file)
+      await asyncio.to_thread(save_processed_batch_progress, graph, graphDb_data_Access, credentials, params, start_time, select_chunks_upto+select_chunks_with_retry-failed_chunks, token_usage, tokens_per_file, node_count, rel_count, chunk_batches.created if chunk_batches.streaming else None)
+      processing_chunks_elapsed_end_time = time.time() - batch_start_time
+      logging.info(f"Time taken {batch_size} chunks processed upto {select_chunks_upto} completed in {processing_chunks_elapsed_end_time:.2f} seconds for file name {params.file_name}")
+      timings.record("batch", processing_chunks_elapsed_end_time)
+
+  tasks = [asyncio.create_task(embedding_stage()), asyncio.create_task(extraction_stage()), asyncio.create_task(write_stage())]
+  try:
+    await cancellation.run(asyncio.gather(*tasks))
+  except BaseException as e:
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if not (isinstance(e, asyncio.CancelledError) and cancellation.is_cancelled()):
+      raise
+    job_status = "Cancelled"
+    logging.info(f'Aborted in-flight pipeline stages of cancelled file {params.file_name}')
+  finally:
+    # batches left in the queues of an aborted pipeline
+    EXTRACTION_QUEUE_DEPTH.dec(queued["extraction"])
+    WRITE_QUEUE_DEPTH.dec(queued["write"])
+    logging.info(f'Pipeline max queue depth for file name {params.file_name}: {max_queue_depth}')
+  return node_count, rel_count, tokens_per_file, failed_chunks, job_status
+
+async def extract_graph_documents_from_chunks(chunkId_chunkDoc_list, model, allowedNodes, allowedRelationship, chunks_to_combine, additional_instructions, timings):
+  if not chunkId_chunkDoc_list:
+    logging.info("No chunks left to extract after chunk dedup")
+    return [], 0, []
   logging.info("Get graph document list from models")
-  
   start_entity_extraction = time.time()
-  graph_documents, token_usage =  await get_graph_from_llm(model, chunkId_chunkDoc_list, allowedNodes, allowedRelationship, chunks_to_combine, additional_instructions)
+  graph_documents, token_usage, failed_chunk_ids =  await get_graph_from_llm(model, chunkId_chunkDoc_list, allowedNodes, allowedRelationship, chunks_to_combine, additional_instructions)
   end_entity_extraction = time.time()
   elapsed_entity_extraction = end_entity_extraction - start_entity_extraction
   logging.info(f'Time taken to extract enitities from LLM Graph Builder: {elapsed_entity_extraction:.2f} seconds')
-  latency_processing_chunk["entity_extraction"] = f'{elapsed_entity_extraction:.2f}'
-  
+  timings.record("llm_extraction", elapsed_entity_extraction)
+  return graph_documents, token_usage, failed_chunk_ids
+
+def save_graph_documents_of_chunks(graph, credentials, file_name, chunkId_chunkDoc_list, embedding_data, graph_documents, timings, count_tracker=None, dedup=None, failed_chunk_ids=()):
+  # an embedded chunk is treated as processed by start_from_last_processed_position, so the
+  # embeddings are written last, once the entities of the batch are stored; a batch whose
+  # graph write fails midway stays unembedded and is extracted and merged again on retry.
+  # Chunks whose extraction failed stay without embedding for the same reason.
+  if failed_chunk_ids:
+    failed_chunk_ids = set(failed_chunk_ids)
+    embedding_data = [row for row in embedding_data if row["chunkId"] not in failed_chunk_ids]
+    chunkId_chunkDoc_list = [item for item in chunkId_chunkDoc_list if item["chunk_id"] not in failed_chunk_ids]
+
   cleaned_graph_documents = handle_backticks_nodes_relationship_id_type(graph_documents)
   
+  chunks_and_graphDocuments_list = get_chunk_and_graphDocument(cleaned_graph_documents, chunkId_chunkDoc_list)
+
+  # entities, their relationships and the HAS_ENTITY links of the batch, in one transaction
+  # unless the batch is oversized or GRAPH_WRITE_PARTITIONS splits it
   start_save_graphDocuments = time.time()
-  save_graphDocuments_in_neo4j(graph, cleaned_graph_documents)
-  end_save_graphDocuments = time.time()
-  elapsed_save_graphDocuments = end_save_graphDocuments - start_save_graphDocuments
+  write_graph_documents(graph, database_key(credentials), cleaned_graph_documents, chunks_and_graphDocuments_list)
+  elapsed_save_graphDocuments = time.time() - start_save_graphDocuments
   logging.info(f'Time taken to save graph document in neo4j: {elapsed_save_graphDocuments:.2f} seconds')
-  latency_processing_chunk["save_graphDocuments"] = f'{elapsed_save_graphDocuments:.2f}'
+  timings.record("graph_write", elapsed_save_graphDocuments)
 
-  chunks_and_graphDocuments_list = get_chunk_and_graphDocument(cleaned_graph_documents, chunkId_chunkDoc_list)
+  if dedup is not None:
+    # duplicates get their entities once the batch is written; the Document counters pick them up on the final recount
+    start_chunk_dedup = time.time()
+    dedup.after_write(chunkId_chunkDoc_list)
+    timings.record("chunk_dedup", time.time() - start_chunk_dedup)
 
-  start_relationship = time.time()
-  merge_relationship_between_chunk_and_entites(graph, chunks_and_graphDocuments_list)
-  end_relationship = time.time()
-  elapsed_relationship = end_relationship - start_relationship
-  logging.info(f'Time taken to create relationship between chunk and entities: {elapsed_relationship:.2f} seconds')
-  latency_processing_chunk["relationship_between_chunk_entity"] = f'{elapsed_relationship:.2f}'
+  start_update_embedding = time.time()
+  save_chunk_embeddings(graph, file_name, embedding_data)
+  elapsed_update_embedding = time.time() - start_update_embedding
+  timings.record("embedding_write", elapsed_update_embedding)
+  logging.info(f'Time taken to update embedding in chunk node: {elapsed_update_embedding:.2f} seconds')
   
-  graphDb_data_Access = graphDBdataAccess(graph)
-  count_response = graphDb_data_Access.update_node_relationship_count(file_name)
+  start_update_count = time.time()
+  if count_tracker is not None:
+    count_response = count_tracker.apply_batch(chunks_and_graphDocuments_list)
+  else:
+    count_response = graphDBdataAccess(graph).update_node_relationship_count(file_name)
+  timings.record("counting", time.time() - start_update_count)
   node_count = count_response[file_name].get('nodeCount',"0")
   rel_count = count_response[file_name].get('relationshipCount',"0")
-  return node_count,rel_count,latency_processing_chunk,token_usage
+  return node_count, rel_count
+
+async def processing_chunks(chunkId_chunkDoc_list,graph,credentials,file_name,model,allowedNodes,allowedRelationship, chunks_to_combine, node_count, rel_count, additional_instructions, embedding_provider, embedding_model, timings, count_tracker=None, dedup=None):
+  #create vector index and update chunk node with embedding
+  if graph is not None:
+    if graph._driver._closed:
+      graph = create_graph_database_connection(credentials)
+  else:
+    graph = create_graph_database_connection(credentials)
+    
+  def timed_chunk_embeddings():
+    start_update_embedding = time.time()
+    embedding_data = get_chunk_embeddings(chunkId_chunkDoc_list, embedding_provider, embedding_model)
+    timings.record("embedding", time.time() - start_update_embedding)
+    return embedding_data
+
+  async def extract_new_chunks():
+    chunks_to_extract = chunkId_chunkDoc_list
+    if dedup is not None:
+      start_chunk_dedup = time.time()
+      chunks_to_extract = await asyncio.to_thread(dedup.filter_batch, chunkId_chunkDoc_list)
+      timings.record("chunk_dedup", time.time() - start_chunk_dedup)
+    return await extract_graph_documents_from_chunks(chunks_to_extract, model, allowedNodes, allowedRelationship, chunks_to_combine, additional_instructions, timings)
+
+  # embeddings run alongside the extraction; the vectors of chunks whose extraction failed
+  # are dropped when the batch is written, so those chunks are picked up again on retry
+  embedding_data, (graph_documents, token_usage, failed_chunk_ids) = await asyncio.gather(
+    asyncio.to_thread(timed_chunk_embeddings),
+    extract_new_chunks()
+  )
+  node_count, rel_count = save_graph_documents_of_chunks(graph, credentials, file_name, chunkId_chunkDoc_list, embedding_data, graph_documents, timings, count_tracker, dedup, failed_chunk_ids)
+  return node_count,rel_count,token_usage,len(failed_chunk_ids)
+
+def strip_bad_chars(text):
+  return str(text).replace('\n', ' ').replace('"', '').replace("'", '')
 
 def get_chunkId_chunkDoc_list(graph, file_name, pages, token_chunk_size, chunk_overlap, retry_condition, email):
   """
@@ -693,48 +907,50 @@ def get_chunkId_chunkDoc_list(graph, file_name, pages, token_chunk_size, chunk_o
   Args:
       graph: Neo4j graph connection.
       file_name (str): Name of the file.
-      pages (list): List of document pages.
+      pages (iterable): Document pages, a lazy iterator for local, S3 and GCS files.
       token_chunk_size (int): Token size for chunking.
       chunk_overlap (int): Overlap size for chunks.
       retry_condition (str): Condition for retrying chunk creation.
       email (str): User email for tracking.
 
   Returns:
-      tuple: (total_chunks, chunkId_chunkDoc_list)
+      tuple: (total_chunks, chunkId_chunkDoc_list). With ENABLE_STREAMING_CHUNKING a fresh file
+      returns (None, iterator of chunk dict batches) that creates the chunks as it is consumed.
   """
   if retry_condition in ["", None] or retry_condition not in [DELETE_ENTITIES_AND_START_FROM_BEGINNING, START_FROM_LAST_PROCESSED_POSITION]:
     logging.info("Break down file into chunks")
-    bad_chars = ['"', "\n", "'"]
-    for i in range(0,len(pages)):
-      text = pages[i].page_content
-      for j in bad_chars:
-        if j == '\n':
-          text = text.replace(j, ' ')
-        else:
-          text = text.replace(j, '')
-      pages[i]=Document(page_content=str(text), metadata=pages[i].metadata)
+    # bad characters are stripped page by page while chunking instead of copying every page up front
     create_chunks_obj = CreateChunksofDocument(pages, graph)
-    chunks = create_chunks_obj.split_file_into_chunks(token_chunk_size, chunk_overlap, email)
+    chunks = create_chunks_obj.iter_chunks(token_chunk_size, chunk_overlap, email, clean_page=strip_bad_chars)
+    if get_value_from_env("ENABLE_STREAMING_CHUNKING", "False", "bool"):
+      # chunks are created lazily as extraction consumes the batches; the total is known at the end
+      logging.info(f"Streaming chunks of {file_name} into extraction")
+      return None, iter_chunk_graph(graph, file_name, chunks, get_value_from_env("UPDATE_GRAPH_CHUNKS_PROCESSED",20,"int"))
     chunkId_chunkDoc_list = create_relation_between_chunks(graph,file_name,chunks)
-    return len(chunks), chunkId_chunkDoc_list
+    return len(chunkId_chunkDoc_list), chunkId_chunkDoc_list
   
   else:  
     chunkId_chunkDoc_list=[]
-    chunks =  execute_graph_query(graph,QUERY_TO_GET_CHUNKS, params={"filename":file_name})
+    chunks =  execute_graph_query(graph,QUERY_TO_GET_CHUNKS, params={"filename":file_name}, query_name="get_chunks")
     
     if chunks[0]['text'] is None or chunks[0]['text']=="" or not chunks :
       raise LLMGraphBuilderException(f"Chunks are not created for {file_name}. Please re-upload file or reprocess the file with option Start From Beginning.")    
     else:
+      embedded_chunk_ids = set()
       for chunk in chunks:
         chunk_doc = Document(page_content=chunk['text'], metadata={'id':chunk['id'], 'position':chunk['position']})
         chunkId_chunkDoc_list.append({'chunk_id': chunk['id'], 'chunk_doc': chunk_doc})
+        if chunk['embedded']:
+          embedded_chunk_ids.add(chunk['id'])
       
       if retry_condition ==  START_FROM_LAST_PROCESSED_POSITION:
         logging.info("Retry : start_from_last_processed_position")
         starting_chunk = execute_graph_query(graph,QUERY_TO_GET_LAST_PROCESSED_CHUNK_POSITION, params={"filename":file_name})
         
         if starting_chunk and starting_chunk[0]["position"] < len(chunkId_chunkDoc_list):
-          return len(chunks), chunkId_chunkDoc_list[starting_chunk[0]["position"] - 1:]
+          # chunks whose extraction failed are left without embedding among processed ones; only they are retried
+          remaining_chunks = [item for item in chunkId_chunkDoc_list[starting_chunk[0]["position"] - 1:] if item['chunk_id'] not in embedded_chunk_ids]
+          return len(chunks), remaining_chunks
         
         elif starting_chunk and starting_chunk[0]["position"] == len(chunkId_chunkDoc_list):
           starting_chunk =  execute_graph_query(graph,QUERY_TO_GET_LAST_PROCESSED_CHUNK_WITHOUT_ENTITY, params={"filename":file_name})
@@ -914,12 +1130,14 @@ def get_labels_and_relationtypes(credentials):
       triples.add(f"{from_label}-{rel_type}->{to_label}")
   return {"triplets": list(triples)}
 
-def manually_cancelled_job(graph, filenames, source_types, merged_dir, uri):
+def manually_cancelled_job(graph, filenames, source_types, merged_dir, uri, database=None):
   
   filename_list= list(map(str.strip, json.loads(filenames)))
   source_types_list= list(map(str.strip, json.loads(source_types)))
   
   for (file_name,source_type) in zip(filename_list, source_types_list):
+      # signal a job running in this process right away, other replicas pick up the Document flag
+      request_cancellation(uri, database, file_name)
       obj_source_node = sourceNode()
       obj_source_node.file_name = file_name.strip() if isinstance(file_name, str) else file_name
       obj_source_node.is_cancelled = True
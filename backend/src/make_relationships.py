@@ -1,53 +1,39 @@
 from langchain_neo4j import Neo4jGraph
 from langchain_core.documents import Document
 from src.shared.common_fn import load_embedding_model,execute_graph_query,get_value_from_env
+from src.shared.embedding_cache import embed_texts_with_cache
 import logging
-from typing import List
+from typing import Iterable, List
 import hashlib
 import time
 from langchain_neo4j import Neo4jVector
 
 logging.basicConfig(format='%(asctime)s - %(message)s',level='INFO')
 
-def merge_relationship_between_chunk_and_entites(graph: Neo4jGraph, graph_documents_chunk_chunk_Id : list):
-    batch_data = []
-    logging.info("Create HAS_ENTITY relationship between chunks and entities")
-    
-    for graph_doc_chunk_id in graph_documents_chunk_chunk_Id:
-        for node in graph_doc_chunk_id['graph_doc'].nodes:
-            query_data={
-                'chunk_id': graph_doc_chunk_id['chunk_id'],
-                'node_type': node.type,
-                'node_id': node.id
-            }
-            batch_data.append(query_data)
-          
-    if batch_data:
-        unwind_query = """
-                    UNWIND $batch_data AS data
-                    MATCH (c:Chunk {id: data.chunk_id})
-                    CALL apoc.merge.node([data.node_type], {id: data.node_id}) YIELD node AS n
-                    MERGE (c)-[:HAS_ENTITY]->(n)
-                """
-        execute_graph_query(graph,unwind_query, params={"batch_data": batch_data})
-
-    
-def create_chunk_embeddings(graph, chunkId_chunkDoc_list, file_name, embedding_provider, embedding_model):
+def get_chunk_embeddings(chunkId_chunkDoc_list, embedding_provider, embedding_model):
+    """
+    Compute embeddings for a list of chunks without writing them to the graph, so the
+    caller can decide when the chunks are persisted (embedding presence is the
+    checkpoint used by start_from_last_processed_position).
+    """
     isEmbedding= get_value_from_env("IS_EMBEDDING", "True" ,"bool")
+    data_for_query = []
+    if not isEmbedding:
+        return data_for_query
     
     embeddings, dimension = load_embedding_model(embedding_provider, embedding_model)
     logging.info(f'embedding model:{embeddings} and dimesion:{dimension}')
-    data_for_query = []
+    texts = [row['chunk_doc'].page_content for row in chunkId_chunkDoc_list]
+    embeddings_list = embed_texts_with_cache(embeddings, texts, embedding_provider, embedding_model)
+    for row, embeddings_arr in zip(chunkId_chunkDoc_list, embeddings_list):
+        data_for_query.append({
+            "chunkId": row['chunk_id'],
+            "embeddings": embeddings_arr
+        })
+    return data_for_query
+
+def save_chunk_embeddings(graph, file_name, data_for_query):
     logging.info("update embedding and vector index for chunks")
-    for row in chunkId_chunkDoc_list:
-        if isEmbedding:
-            embeddings_arr = embeddings.embed_query(row['chunk_doc'].page_content)
-                                    
-            data_for_query.append({
-                "chunkId": row['chunk_id'],
-                "embeddings": embeddings_arr
-            })
-    
     query_to_create_embedding = """
         UNWIND $data AS row
         MATCH (d:Document {fileName: $fileName})
@@ -55,95 +41,129 @@ def create_chunk_embeddings(graph, chunkId_chunkDoc_list, file_name, embedding_p
         SET c.embedding = row.embeddings
         MERGE (c)-[:PART_OF]->(d)
     """       
-    execute_graph_query(graph,query_to_create_embedding, params={"fileName":file_name, "data":data_for_query})
-    
-def create_relation_between_chunks(graph, file_name, chunks: List[Document])->list:
-    logging.info("creating FIRST_CHUNK and NEXT_CHUNK relationships between chunks")
-    current_chunk_id = ""
-    lst_chunks_including_hash = []
-    batch_data = []
-    relationships = []
-    offset=0
-    for i, chunk in enumerate(chunks):
-        page_content_sha1 = hashlib.sha1(chunk.page_content.encode())
-        previous_chunk_id = current_chunk_id
-        current_chunk_id = page_content_sha1.hexdigest()
-        position = i + 1 
-        if i>0:
-            offset += len(chunks[i-1].page_content)
-        if i == 0:
-            firstChunk = True
-        else:
-            firstChunk = False  
-        metadata = {"position": position,"length": len(chunk.page_content), "content_offset":offset}
-        chunk_document = Document(
-            page_content=chunk.page_content, metadata=metadata
-        )
-        
+    execute_graph_query(graph,query_to_create_embedding, params={"fileName":file_name, "data":data_for_query}, query_name="save_chunk_embeddings")
+
+QUERY_TO_CREATE_CHUNK_GRAPH = """
+    MATCH (d:Document {fileName: $f_name})
+    UNWIND $batch_data AS data
+    MERGE (c:Chunk {id: data.id})
+    SET c.text = data.pg_content, c.position = data.position, c.length = data.length, c.fileName = $f_name, c.content_offset = data.content_offset,
+        c.page_number = data.page_number, c.start_time = data.start_time, c.end_time = data.end_time
+    MERGE (c)-[:PART_OF]->(d)
+    FOREACH(r IN CASE WHEN data.position = 1 THEN [1] ELSE [] END |
+            MERGE (d)-[:FIRST_CHUNK]->(c))
+    WITH c, data
+    WHERE data.previous_id <> ""
+    MATCH (pc:Chunk {id: data.previous_id})
+    MERGE (c)<-[:NEXT_CHUNK]-(pc)
+"""
+
+# every MERGE and MATCH of the chunk graph looks chunks up by id
+QUERY_TO_CREATE_CHUNK_ID_INDEX = "CREATE INDEX chunk_id IF NOT EXISTS FOR (c:Chunk) ON (c.id)"
+
+QUERY_TO_GET_LAST_WRITTEN_CHUNK = """
+    MATCH (:Document {fileName: $f_name})<-[:PART_OF]-(c:Chunk)
+    RETURN c.position AS position, c.id AS id
+    ORDER BY c.position DESC LIMIT 1
+"""
+
+QUERY_TO_COUNT_STORED_CHUNKS = """
+    MATCH (d:Document {fileName: $f_name})
+    UNWIND $batch_data AS data
+    MATCH (c:Chunk {id: data.id})-[:PART_OF]->(d)
+    WHERE c.position = data.position
+    RETURN count(c) AS stored
+"""
+
+
+def _chunk_rows(chunks):
+    # consumes chunks lazily; positions and offsets only depend on the chunks before
+    previous_chunk_id = ""
+    offset = 0
+    for position, chunk in enumerate(chunks, start=1):
+        current_chunk_id = hashlib.sha1(chunk.page_content.encode()).hexdigest()
         chunk_data = {
             "id": current_chunk_id,
-            "pg_content": chunk_document.page_content,
+            "pg_content": chunk.page_content,
             "position": position,
-            "length": chunk_document.metadata["length"],
-            "f_name": file_name,
-            "previous_id" : previous_chunk_id,
-            "content_offset" : offset
+            "length": len(chunk.page_content),
+            "previous_id": previous_chunk_id,
+            "content_offset": offset
         }
-        
         if 'page_number' in chunk.metadata:
             chunk_data['page_number'] = chunk.metadata['page_number']
-         
         if 'start_timestamp' in chunk.metadata and 'end_timestamp' in chunk.metadata:
             chunk_data['start_time'] = chunk.metadata['start_timestamp']
-            chunk_data['end_time'] = chunk.metadata['end_timestamp'] 
-               
-        batch_data.append(chunk_data)
-        
-        lst_chunks_including_hash.append({'chunk_id': current_chunk_id, 'chunk_doc': chunk})
-        
-        # create relationships between chunks
-        if firstChunk:
-            relationships.append({"type": "FIRST_CHUNK", "chunk_id": current_chunk_id})
-        else:
-            relationships.append({
-                "type": "NEXT_CHUNK",
-                "previous_chunk_id": previous_chunk_id,  # ID of previous chunk
-                "current_chunk_id": current_chunk_id
-            })
-          
-    query_to_create_chunk_and_PART_OF_relation = """
-        UNWIND $batch_data AS data
-        MERGE (c:Chunk {id: data.id})
-        SET c.text = data.pg_content, c.position = data.position, c.length = data.length, c.fileName=data.f_name, c.content_offset=data.content_offset
-        WITH data, c
-        SET c.page_number = CASE WHEN data.page_number IS NOT NULL THEN data.page_number END,
-            c.start_time = CASE WHEN data.start_time IS NOT NULL THEN data.start_time END,
-            c.end_time = CASE WHEN data.end_time IS NOT NULL THEN data.end_time END
-        WITH data, c
-        MATCH (d:Document {fileName: data.f_name})
-        MERGE (c)-[:PART_OF]->(d)
+            chunk_data['end_time'] = chunk.metadata['end_timestamp']
+        yield chunk_data, chunk
+        previous_chunk_id = current_chunk_id
+        offset += len(chunk.page_content)
+
+
+def _mark_written_prefix(rows, last_written):
     """
-    execute_graph_query(graph,query_to_create_chunk_and_PART_OF_relation, params={"batch_data": batch_data})
-    
-    query_to_create_FIRST_relation = """ 
-        UNWIND $relationships AS relationship
-        MATCH (d:Document {fileName: $f_name})
-        MATCH (c:Chunk {id: relationship.chunk_id})
-        FOREACH(r IN CASE WHEN relationship.type = 'FIRST_CHUNK' THEN [1] ELSE [] END |
-                MERGE (d)-[:FIRST_CHUNK]->(c))
-        """
-    execute_graph_query(graph,query_to_create_FIRST_relation, params={"f_name": file_name, "relationships": relationships})
-    
-    query_to_create_NEXT_CHUNK_relation = """ 
-        UNWIND $relationships AS relationship
-        MATCH (c:Chunk {id: relationship.current_chunk_id})
-        WITH c, relationship
-        MATCH (pc:Chunk {id: relationship.previous_chunk_id})
-        FOREACH(r IN CASE WHEN relationship.type = 'NEXT_CHUNK' THEN [1] ELSE [] END |
-                MERGE (c)<-[:NEXT_CHUNK]-(pc))
-        """  
-    execute_graph_query(graph,query_to_create_NEXT_CHUNK_relation, params={"relationships": relationships})
-    return lst_chunks_including_hash
+    Tag each row with whether it has to be written: False for the rows before the last
+    written position, which an earlier run may have stored already. The rows stream
+    straight through; iter_chunk_graph checks each batch of the prefix against the
+    graph and writes it again when the chunking differs (chunk ids hash the content).
+    """
+    resume_position = last_written[0]["position"] if last_written else None
+    if resume_position is not None:
+        logging.info(f"Resuming chunk graph creation from position {resume_position}")
+    for row in rows:
+        yield resume_position is None or row[0]["position"] >= resume_position, row
+
+
+def iter_chunk_graph(graph, file_name, chunks: Iterable[Document], batch_size=None):
+    """
+    Create the Chunk nodes of a file with their PART_OF, FIRST_CHUNK and NEXT_CHUNK
+    relationships in one fused query per batch, consuming chunks lazily. Batches are
+    bounded by CHUNK_GRAPH_BATCH_SIZE rows and CHUNK_GRAPH_BATCH_MB of text and
+    written in position order, so when a previous run failed midway with the same
+    chunking the write resumes from the last chunk it stored.
+
+    Yields:
+        list: {'chunk_id', 'chunk_doc'} dicts of each batch, once it is in the graph.
+    """
+    logging.info("creating Chunk nodes with PART_OF, FIRST_CHUNK and NEXT_CHUNK relationships")
+    max_rows = batch_size or get_value_from_env("CHUNK_GRAPH_BATCH_SIZE", 1000, "int")
+    max_bytes = get_value_from_env("CHUNK_GRAPH_BATCH_MB", 8, "int") * 1024 * 1024
+    execute_graph_query(graph, QUERY_TO_CREATE_CHUNK_ID_INDEX)
+    last_written = execute_graph_query(graph, QUERY_TO_GET_LAST_WRITTEN_CHUNK, params={"f_name": file_name})
+
+    batch = []
+    batch_bytes = 0
+    batch_to_write = True
+    counts = {True: 0, False: 0}
+
+    def flush():
+        to_write = batch_to_write
+        if not to_write:
+            stored = execute_graph_query(graph, QUERY_TO_COUNT_STORED_CHUNKS, params={"f_name": file_name, "batch_data": [{"id": row["id"], "position": row["position"]} for row, _ in batch]}, query_name="check_chunk_graph")
+            to_write = stored[0]["stored"] != len(batch)
+            if to_write:
+                logging.info(f"Chunking of {file_name} differs from the stored chunk graph at positions {batch[0][0]['position']}-{batch[-1][0]['position']}, writing them again")
+        if to_write:
+            execute_graph_query(graph, QUERY_TO_CREATE_CHUNK_GRAPH, params={"f_name": file_name, "batch_data": [row for row, _ in batch]}, query_name="create_chunk_graph")
+        counts[to_write] += len(batch)
+        return [{'chunk_id': row['id'], 'chunk_doc': chunk} for row, chunk in batch]
+
+    for to_write, (row, chunk) in _mark_written_prefix(_chunk_rows(chunks), last_written):
+        row_bytes = len(row["pg_content"].encode()) if to_write else 0
+        if batch and (to_write != batch_to_write or len(batch) >= max_rows or batch_bytes + row_bytes > max_bytes):
+            yield flush()
+            batch, batch_bytes = [], 0
+        batch_to_write = to_write
+        batch.append((row, chunk))
+        batch_bytes += row_bytes
+    if batch:
+        yield flush()
+    logging.info(f"Created chunk graph of {file_name}: {counts[True]} chunks written, {counts[False]} already present")
+
+
+def create_relation_between_chunks(graph, file_name, chunks: List[Document], batch_size=None)->list:
+    """Create the chunk graph of a file (see iter_chunk_graph) and return all its {'chunk_id', 'chunk_doc'} dicts."""
+    return [item for batch in iter_chunk_graph(graph, file_name, chunks, batch_size) for item in batch]
 
 
 def create_chunk_vector_index(graph, embedding_provider, embedding_model):
@@ -2,6 +2,7 @@ import logging
 from langchain_neo4j import Neo4jGraph
 from src.graph_query import get_graphDB_driver
 from src.shared.common_fn import load_embedding_model,execute_graph_query,get_value_from_env
+from src.shared.embedding_cache import embed_texts_with_cache
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from src.shared.constants import GRAPH_CLEANUP_PROMPT
@@ -137,8 +138,9 @@ def fetch_entities_for_embedding(graph):
 def update_embeddings(rows, graph, embedding_provider, embedding_model):
     embeddings, dimension = load_embedding_model(embedding_provider, embedding_model)
     logging.info("update embedding for entities")
-    for row in rows:
-        row['embedding'] = embeddings.embed_query(row['text'])                        
+    embeddings_list = embed_texts_with_cache(embeddings, [row['text'] for row in rows], embedding_provider, embedding_model)
+    for row, embedding in zip(rows, embeddings_list):
+        row['embedding'] = embedding
     query = """
       UNWIND $rows AS row
       MATCH (e) WHERE elementId(e) = row.elementId
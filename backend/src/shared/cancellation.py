@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import threading
+
+from neo4j import GraphDatabase, RoutingControl
+
+from src.shared.common_fn import get_value_from_env
+
+QUERY_CANCELLED_DOCUMENTS = """
+MATCH (d:Document)
+WHERE d.fileName IN $file_names AND d.is_cancelled = true
+RETURN d.fileName AS fileName
+"""
+
+_tokens = {}
+_watchers = {}
+_lock = threading.Lock()
+
+
+class CancellationToken:
+    """
+    Cancellation state of one running file extraction.
+
+    cancel() flags the token and cancels the asyncio tasks started through run(), so
+    in-flight LLM calls are aborted instead of awaited.
+    """
+
+    def __init__(self, key, credentials):
+        self.key = key
+        self.file_name = key[2]
+        self.credentials = credentials
+        self._event = threading.Event()
+        self._tasks = {}
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason):
+        if self._event.is_set():
+            return
+        self._event.set()
+        logging.info(f"Cancelling extraction of {self.file_name}: {reason}")
+        with _lock:
+            tasks = list(self._tasks.items())
+        for task, loop in tasks:
+            loop.call_soon_threadsafe(task.cancel)
+
+    async def run(self, awaitable):
+        """Await a coroutine as a task that is cancelled as soon as the token is."""
+        task = asyncio.ensure_future(awaitable)
+        if self.is_cancelled():
+            task.cancel()
+        with _lock:
+            self._tasks[task] = asyncio.get_running_loop()
+        try:
+            return await task
+        finally:
+            with _lock:
+                self._tasks.pop(task, None)
+
+
+def cancellation_key(uri, database, file_name):
+    return (uri or "", database or "", file_name.strip() if isinstance(file_name, str) else file_name)
+
+
+def register_cancellation(credentials, file_name):
+    """
+    Register a running extraction and make sure its database is watched for
+    cancellations requested through other replicas.
+    """
+    key = cancellation_key(credentials.uri, credentials.database, file_name)
+    token = CancellationToken(key, credentials)
+    db_key = key[:2]
+    with _lock:
+        _tokens[key] = token
+        if get_value_from_env("CANCELLATION_POLL_SECONDS", 10, "float") <= 0:
+            # single replica: /cancelled_job reaches the token through request_cancellation
+            return token
+        watcher = _watchers.get(db_key)
+        if watcher is None or not watcher.is_alive():
+            watcher = threading.Thread(target=_watch_database, args=(db_key,), name=f"cancellation-watcher-{db_key[0]}", daemon=True)
+            _watchers[db_key] = watcher
+            watcher.start()
+    return token
+
+
+def unregister_cancellation(token):
+    with _lock:
+        if _tokens.get(token.key) is token:
+            del _tokens[token.key]
+
+
+def request_cancellation(uri, database, file_name):
+    """Signal a running extraction in this process; returns False when it is not running here."""
+    with _lock:
+        token = _tokens.get(cancellation_key(uri, database, file_name))
+    if token is None:
+        return False
+    token.cancel("cancelled by user")
+    return True
+
+
+def _watch_database(db_key):
+    # one poll per database for all its running files, replacing the per batch status read;
+    # the watcher owns its driver, as the connections of the extractions close when they finish
+    poll_seconds = get_value_from_env("CANCELLATION_POLL_SECONDS", 10, "float")
+    stop = threading.Event()
+    driver = None
+    try:
+        while not stop.wait(poll_seconds):
+            with _lock:
+                tokens = [token for key, token in _tokens.items() if key[:2] == db_key and not token.is_cancelled()]
+                if not tokens:
+                    _watchers.pop(db_key, None)
+                    return
+            try:
+                if driver is None:
+                    credentials = tokens[0].credentials
+                    username = credentials.userName if credentials.userName is not None else get_value_from_env("NEO4J_USERNAME")
+                    password = credentials.password if credentials.password is not None else get_value_from_env("NEO4J_PASSWORD")
+                    driver = GraphDatabase.driver(db_key[0], auth=(username, password))
+                records, _, _ = driver.execute_query(QUERY_CANCELLED_DOCUMENTS, file_names=[token.file_name for token in tokens], database_=db_key[1] or None, routing_=RoutingControl.READ)
+            except Exception as e:
+                logging.error(f"Cancellation watcher failed to read document status: {e}")
+                if driver is not None:
+                    driver.close()
+                    driver = None
+                continue
+            cancelled = {record["fileName"] for record in records}
+            for token in tokens:
+                if token.file_name in cancelled:
+                    token.cancel("cancellation flag set on Document node")
+    finally:
+        if driver is not None:
+            driver.close()
@@ -0,0 +1,366 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.metrics import Counter
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 8
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_index = None
+_index_lock = threading.Lock()
+
+CHUNK_DEDUP_CHUNKS = Counter("chunk_dedup_chunks_total", "Chunks checked by chunk dedup, by outcome.", ("outcome",))
+DEDUP_CHECKED = CHUNK_DEDUP_CHUNKS.labels("checked")
+DEDUP_EXACT = CHUNK_DEDUP_CHUNKS.labels("exact_duplicate")
+DEDUP_NEAR = CHUNK_DEDUP_CHUNKS.labels("near_duplicate")
+
+EXACT_DUPLICATE_QUERY = """
+UNWIND $chunk_ids AS chunk_id
+MATCH (c:Chunk {id: chunk_id})
+WHERE c.extraction_key = $extraction_key
+  AND EXISTS { (c)-[:HAS_ENTITY]->() }
+  AND EXISTS { (c)-[:PART_OF]->(d:Document) WHERE d.fileName <> $file_name }
+RETURN c.id AS id
+"""
+
+REUSE_SOURCE_QUERY = """
+UNWIND $chunk_ids AS chunk_id
+MATCH (c:Chunk {id: chunk_id})
+WHERE EXISTS { (c)-[:HAS_ENTITY]->() }
+RETURN c.id AS id,
+       c.extraction_key = $extraction_key
+         AND NOT EXISTS { (c)-[:PART_OF]->(:Document {fileName: $file_name}) } AS reusable
+"""
+
+SET_EXTRACTION_KEY_QUERY = """
+UNWIND $chunk_ids AS chunk_id
+MATCH (c:Chunk {id: chunk_id})
+SET c.extraction_key = $extraction_key
+"""
+
+REUSE_HAS_ENTITY_QUERY = """
+UNWIND $pairs AS pair
+MATCH (source:Chunk {id: pair.source_id})-[:HAS_ENTITY]->(e)
+MATCH (c:Chunk {id: pair.chunk_id})
+MERGE (c)-[:HAS_ENTITY]->(e)
+"""
+
+
+def _permutations():
+    # fixed seed, signatures stored in the index must stay comparable across processes
+    seed = hashlib.sha1(b"llm-graph-builder-minhash").digest()
+    params = []
+    counter = 0
+    while len(params) < MINHASH_PERMUTATIONS:
+        digest = hashlib.sha1(seed + counter.to_bytes(4, "big")).digest()
+        a = int.from_bytes(digest[:8], "big") % MERSENNE_PRIME
+        b = int.from_bytes(digest[8:16], "big") % MERSENNE_PRIME
+        counter += 1
+        if a:
+            params.append((a, b))
+    return params
+
+
+_PERMUTATIONS = _permutations()
+
+
+def chunk_shingles(text):
+    """Hashes of the word SHINGLE_WORDS-grams of a chunk, case and punctuation insensitive."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode()) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash_signature(text):
+    """MinHash signature of a chunk, or None when it has no words."""
+    shingles = chunk_shingles(text)
+    if not shingles:
+        return None
+    return [min(((a * shingle + b) % MERSENNE_PRIME) & MAX_HASH for shingle in shingles) for a, b in _PERMUTATIONS]
+
+
+def extraction_key(model, allowed_nodes, allowed_relationships, additional_instructions, chunks_to_combine):
+    """Key of the extraction settings a chunk's entities depend on, stored on the chunks extracted with them."""
+    payload = json.dumps([model, allowed_nodes, allowed_relationships, additional_instructions, chunks_to_combine], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def estimated_similarity(signature, other):
+    return sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+
+def lsh_buckets(signature):
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    buckets = []
+    for band in range(LSH_BANDS):
+        band_bytes = array("Q", signature[band * rows:(band + 1) * rows]).tobytes()
+        buckets.append((band, int.from_bytes(hashlib.blake2b(band_bytes, digest_size=8).digest(), "big", signed=True)))
+    return buckets
+
+
+class ChunkDedupIndex:
+    """
+    MinHash/LSH index of the chunks extracted so far, kept in a local SQLite file and
+    partitioned by database, so near-duplicate chunks of new documents can be matched
+    against chunks already extracted into the same database.
+
+    Signatures are split into LSH_BANDS bands; chunks sharing a band bucket are
+    candidates whose similarity is then estimated from the full signatures.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_signatures ("
+            "db_key TEXT NOT NULL, chunk_id TEXT NOT NULL, file_name TEXT, signature BLOB NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (db_key, chunk_id))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lsh_buckets (db_key TEXT NOT NULL, band INTEGER NOT NULL, bucket INTEGER NOT NULL, chunk_id TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lsh_buckets_lookup ON lsh_buckets(db_key, band, bucket)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lsh_buckets_chunk ON lsh_buckets(db_key, chunk_id)")
+
+    def add(self, db_key, file_name, signatures):
+        """Index a dict of chunk id to signature; chunks already indexed are left unchanged."""
+        if not signatures:
+            return
+        with self._lock:
+            known = self._known_ids(db_key, list(signatures))
+            new = {chunk_id: signature for chunk_id, signature in signatures.items() if chunk_id not in known}
+            if not new:
+                return
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO chunk_signatures (db_key, chunk_id, file_name, signature, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(db_key, chunk_id, file_name, array("Q", signature).tobytes(), now) for chunk_id, signature in new.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO lsh_buckets (db_key, band, bucket, chunk_id) VALUES (?, ?, ?, ?)",
+                    [(db_key, band, bucket, chunk_id) for chunk_id, signature in new.items() for band, bucket in lsh_buckets(signature)]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _known_ids(self, db_key, chunk_ids):
+        # caller holds self._lock
+        known = set()
+        for i in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[i:i+500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(f"SELECT chunk_id FROM chunk_signatures WHERE db_key = ? AND chunk_id IN ({placeholders})", [db_key, *batch])
+            known.update(row[0] for row in rows)
+        return known
+
+    def query(self, db_key, signatures, threshold):
+        """
+        Find the most similar indexed chunk of each signature.
+
+        Args:
+            db_key (str): Database the chunks belong to.
+            signatures (dict): Chunk id to MinHash signature.
+            threshold (float): Minimum estimated Jaccard similarity of a match.
+
+        Returns:
+            dict: Chunk id to (matched chunk id, estimated similarity), for the chunks with a match.
+        """
+        if not signatures:
+            return {}
+        chunk_buckets = {chunk_id: lsh_buckets(signature) for chunk_id, signature in signatures.items()}
+        with self._lock:
+            candidates = {chunk_id: set() for chunk_id in signatures}
+            for band in range(LSH_BANDS):
+                owners = {}
+                for chunk_id, buckets in chunk_buckets.items():
+                    owners.setdefault(buckets[band][1], []).append(chunk_id)
+                bucket_values = list(owners)
+                for i in range(0, len(bucket_values), 500):
+                    batch = bucket_values[i:i+500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT bucket, chunk_id FROM lsh_buckets WHERE db_key = ? AND band = ? AND bucket IN ({placeholders})",
+                        [db_key, band, *batch]
+                    )
+                    for bucket, candidate_id in rows:
+                        for chunk_id in owners[bucket]:
+                            if candidate_id != chunk_id:
+                                candidates[chunk_id].add(candidate_id)
+            candidate_ids = list(set().union(*candidates.values()))
+            candidate_signatures = {}
+            for i in range(0, len(candidate_ids), 500):
+                batch = candidate_ids[i:i+500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT chunk_id, signature FROM chunk_signatures WHERE db_key = ? AND chunk_id IN ({placeholders})", [db_key, *batch])
+                candidate_signatures.update((chunk_id, array("Q", signature).tolist()) for chunk_id, signature in rows)
+
+        matches = {}
+        for chunk_id, candidate_set in candidates.items():
+            best = None
+            for candidate_id in candidate_set:
+                similarity = estimated_similarity(signatures[chunk_id], candidate_signatures[candidate_id])
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (candidate_id, similarity)
+            if best is not None:
+                matches[chunk_id] = best
+        return matches
+
+    def remove(self, db_key, chunk_ids):
+        """Drop chunks that no longer exist or lost their entities in the database."""
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM chunk_signatures WHERE db_key = ? AND chunk_id = ?", [(db_key, chunk_id) for chunk_id in chunk_ids])
+                self._conn.executemany("DELETE FROM lsh_buckets WHERE db_key = ? AND chunk_id = ?", [(db_key, chunk_id) for chunk_id in chunk_ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            entries, databases = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT db_key) FROM chunk_signatures").fetchone()
+        return {"entries": entries, "databases": databases}
+
+
+def get_chunk_dedup_index():
+    """Return the process-wide chunk dedup index, or None when ENABLE_CHUNK_DEDUP is false."""
+    global _index
+    if not get_value_from_env("ENABLE_CHUNK_DEDUP", "False", "bool"):
+        return None
+    with _index_lock:
+        if _index is None:
+            path = get_value_from_env("CHUNK_DEDUP_INDEX_PATH", "./cache/chunk_dedup.sqlite")
+            try:
+                _index = ChunkDedupIndex(path)
+                logging.info(f"Chunk dedup index at {path}")
+            except Exception as e:
+                logging.error(f"Chunk dedup disabled, unable to open {path}: {e}")
+                return None
+        return _index
+
+
+class ChunkDeduplicator:
+    """
+    Skips LLM extraction for the chunks of a file already extracted elsewhere in the
+    same database, and gives them the HAS_ENTITY links of the chunk they duplicate.
+
+    Exact duplicates share the SHA-1 chunk id, so they are the same Chunk node and
+    already carry their entities. Near duplicates are found through the MinHash/LSH
+    index with an estimated Jaccard similarity of at least CHUNK_DEDUP_THRESHOLD.
+
+    Only extractions made for other documents with the same extraction key (model,
+    schema, additional instructions and chunk combining) are reused, so reprocessing a
+    file or changing its settings always extracts again.
+    """
+
+    def __init__(self, graph, index, db_key, file_name, extraction_key):
+        self.graph = graph
+        self.index = index
+        self.db_key = db_key
+        self.file_name = file_name
+        self.extraction_key = extraction_key
+        self.threshold = get_value_from_env("CHUNK_DEDUP_THRESHOLD", 0.9, "float")
+        self._lock = threading.Lock()
+        self._reused = {}
+        self._signatures = {}
+        self.counts = {"chunks_checked": 0, "exact_duplicates": 0, "near_duplicates": 0}
+
+    def filter_batch(self, chunkId_chunkDoc_list):
+        """
+        Split a batch into the chunks to extract and the duplicates to reuse.
+
+        Returns:
+            list: The chunk id and chunk document dicts that still need LLM extraction.
+        """
+        chunk_ids = [item['chunk_id'] for item in chunkId_chunkDoc_list]
+        query_params = {"file_name": self.file_name, "extraction_key": self.extraction_key}
+        exact = {record['id'] for record in self.graph.query(EXACT_DUPLICATE_QUERY, {"chunk_ids": chunk_ids, **query_params})}
+        remaining = [item for item in chunkId_chunkDoc_list if item['chunk_id'] not in exact]
+
+        signatures = {}
+        for item in remaining:
+            signature = minhash_signature(item['chunk_doc'].page_content)
+            if signature is not None:
+                signatures[item['chunk_id']] = signature
+        try:
+            matches = self.index.query(self.db_key, signatures, self.threshold)
+        except Exception as e:
+            logging.error(f"Chunk dedup index lookup failed: {e}")
+            matches = {}
+        if matches:
+            # the index can outlive deleted documents, so sources are checked against the graph
+            source_ids = list({source_id for source_id, _ in matches.values()})
+            sources = {record['id']: record['reusable'] for record in self.graph.query(REUSE_SOURCE_QUERY, {"chunk_ids": source_ids, **query_params})}
+            stale = [source_id for source_id in source_ids if source_id not in sources]
+            if stale:
+                self.index.remove(self.db_key, stale)
+            matches = {chunk_id: match for chunk_id, match in matches.items() if sources.get(match[0])}
+
+        with self._lock:
+            self.counts["chunks_checked"] += len(chunkId_chunkDoc_list)
+            self.counts["exact_duplicates"] += len(exact)
+            self.counts["near_duplicates"] += len(matches)
+            self._reused.update((chunk_id, source_id) for chunk_id, (source_id, _) in matches.items())
+            self._signatures.update(signatures)
+        DEDUP_CHECKED.inc(len(chunkId_chunkDoc_list))
+        DEDUP_EXACT.inc(len(exact))
+        DEDUP_NEAR.inc(len(matches))
+        logging.info(f"Chunk dedup for {self.file_name}: {len(exact)} exact and {len(matches)} near duplicates in a batch of {len(chunkId_chunkDoc_list)} chunks")
+        return [item for item in remaining if item['chunk_id'] not in matches]
+
+    def after_write(self, chunkId_chunkDoc_list):
+        """Link the near duplicates of a written batch to the entities of their sources and index the batch."""
+        chunk_ids = [item['chunk_id'] for item in chunkId_chunkDoc_list]
+        with self._lock:
+            pairs = [{"chunk_id": chunk_id, "source_id": self._reused.pop(chunk_id)} for chunk_id in chunk_ids if chunk_id in self._reused]
+            signatures = {chunk_id: self._signatures.pop(chunk_id) for chunk_id in chunk_ids if chunk_id in self._signatures}
+        if pairs:
+            self.graph.query(REUSE_HAS_ENTITY_QUERY, {"pairs": pairs})
+        self.graph.query(SET_EXTRACTION_KEY_QUERY, {"chunk_ids": chunk_ids, "extraction_key": self.extraction_key})
+        try:
+            self.index.add(self.db_key, self.file_name, signatures)
+        except Exception as e:
+            logging.error(f"Chunk dedup index update failed: {e}")
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self.counts)
+        counts["llm_chunks_skipped"] = counts["exact_duplicates"] + counts["near_duplicates"]
+        checked = counts["chunks_checked"]
+        counts["skipped_ratio"] = round(counts["llm_chunks_skipped"] / checked, 4) if checked else 0.0
+        return counts
+
+
+def get_chunk_deduplicator(graph, credentials, params):
+    """Return a ChunkDeduplicator for the file of the extraction params, or None when chunk dedup is disabled."""
+    index = get_chunk_dedup_index()
+    if index is None:
+        return None
+    db_key = f"{credentials.uri}/{credentials.database or ''}"
+    key = extraction_key(params.model, params.allowedNodes, params.allowedRelationship, params.additional_instructions, params.chunks_to_combine)
+    return ChunkDeduplicator(graph, index, db_key, params.file_name, key)
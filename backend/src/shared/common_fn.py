@@ -7,9 +7,13 @@ from typing import Any
 from src.entities.user_credential import Neo4jCredentials
 from transformers import AutoTokenizer, AutoModel
 from langchain_huggingface import HuggingFaceEmbeddings
-from threading import Lock
+from threading import Lock, Thread
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse,parse_qs
+from src.shared.fake_providers import FakeEmbeddings
 from src.shared.llm_graph_builder_exception import LLMGraphBuilderException
+from src.shared.metrics import NEO4J_QUERY_SECONDS, register_collector, snapshot_families
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_neo4j import Neo4jGraph
@@ -20,13 +24,20 @@ import re
 import time
 from pathlib import Path
 import boto3
+import psutil
 from langchain_community.embeddings import BedrockEmbeddings
 from langchain_core.callbacks import BaseCallbackHandler
 
 
 # --- Embedding Model Helpers ---
-_embedding_instances = {}
-_embedding_locks = {}
+# Process-wide registry of embedding clients keyed by (provider, model), least recently used first;
+# models unused for EMBEDDING_MODEL_IDLE_SECONDS are dropped by a sweeper thread
+_embedding_registry = OrderedDict()
+_embedding_last_used = {}
+_embedding_registry_lock = Lock()
+_embedding_load_locks = {}
+_embedding_metrics = {}
+_embedding_sweeper = None
 
 
 def _canonical_sentence_transformer_model_name(model_name: str) -> str:
@@ -53,19 +64,16 @@ def _ensure_sentence_transformer_model_downloaded(model_name: str, model_path: s
 
 def _get_sentence_transformer_embedding(model_name: str, model_path: str = "./local_model"):
     """
-    Threadsafe singleton for HuggingFaceEmbeddings for any sentence-transformer model.
+    Threadsafe shared HuggingFaceEmbeddings for any sentence-transformer model, held in the
+    embedding registry like the models of load_embedding_model.
     """
-    if model_name not in _embedding_locks:
-        _embedding_locks[model_name] = Lock()
-    if model_name in _embedding_instances:
-        return _embedding_instances[model_name]
-    with _embedding_locks[model_name]:
-        if model_name in _embedding_instances:
-            return _embedding_instances[model_name]
-        _ensure_sentence_transformer_model_downloaded(model_name, model_path)
-        _embedding_instances[model_name] = HuggingFaceEmbeddings(model_name=model_path)
-        logging.info(f"Embedding model {model_name} initialized.")
-        return _embedding_instances[model_name]
+    return _get_registered_embedding(("sentence-transformer", model_name), lambda: _build_sentence_transformer_embedding(model_name, model_path))
+
+def _build_sentence_transformer_embedding(model_name: str, model_path: str):
+    _ensure_sentence_transformer_model_downloaded(model_name, model_path)
+    embeddings = HuggingFaceEmbeddings(model_name=model_path)
+    logging.info(f"Embedding model {model_name} initialized.")
+    return embeddings
 
 def _get_bedrock_embeddings(model_name: str):
     """
@@ -163,7 +171,7 @@ def load_embedding_model(embedding_provider: str, embedding_model_name: str):
     Load the appropriate embedding model and return its instance and dimension.
 
     Args:
-        embedding_provider (str): The provider name (e.g., "openai", "gemini", "titan", "sentence-transformer").
+        embedding_provider (str): The provider name (e.g., "openai", "gemini", "titan", "sentence-transformer", "fake").
         embedding_model_name (str): The specific model name.
 
     Returns:
@@ -191,6 +199,11 @@ def load_embedding_model(embedding_provider: str, embedding_model_name: str):
             "all-MiniLM-L6-v2": 384,
             "sentence-transformers/all-MiniLM-L6-v2": 384,
         },
+        "fake": {
+            "fake-384": 384,
+            "fake-768": 768,
+            "fake-1536": 1536,
+        },
     }
 
     provider = embedding_provider.lower()
@@ -200,38 +213,162 @@ def load_embedding_model(embedding_provider: str, embedding_model_name: str):
         raise ValueError(f"Unsupported provider/model: {provider}/{model}")
 
     dimension = model_dimensions[provider][model]
+    embeddings = _get_registered_embedding((provider, model), lambda: _create_embedding_model(provider, model))
+    logging.info(f"Embedding: Using {provider} - {model}, Dimension: {dimension}")
+    return embeddings, dimension
 
+def _get_registered_embedding(key, create):
+    """Return the registered embedding client of key, creating it with create() if it is not loaded."""
+    with _embedding_registry_lock:
+        embeddings = _use_registered_embedding(key)
+        if embeddings is not None:
+            return embeddings
+        load_lock = _embedding_load_locks.setdefault(key, Lock())
+
+    # one loader per (provider, model); other threads wait here instead of loading a duplicate
+    with load_lock:
+        with _embedding_registry_lock:
+            embeddings = _use_registered_embedding(key)
+            if embeddings is not None:
+                return embeddings
+        rss_before = _get_process_rss()
+        start = time.time()
+        embeddings = create()
+        load_seconds = time.time() - start
+        rss_delta = _get_process_rss() - rss_before
+        with _embedding_registry_lock:
+            _embedding_registry[key] = embeddings
+            _embedding_last_used[key] = time.monotonic()
+            metrics = _embedding_metrics.setdefault(key, {"hits": 0, "loads": 0, "evictions": 0, "load_seconds": 0.0, "rss_delta_bytes": 0})
+            metrics["loads"] += 1
+            metrics["load_seconds"] = round(load_seconds, 3)
+            metrics["rss_delta_bytes"] = rss_delta
+            _start_embedding_sweeper()
+
+    logging.info(f"Embedding: loaded {key[0]} - {key[1]} in {load_seconds:.2f} seconds, RSS change {rss_delta / (1024 * 1024):.1f} MB")
+    return embeddings
+
+def _use_registered_embedding(key):
+    # called with _embedding_registry_lock held
+    embeddings = _embedding_registry.get(key)
+    if embeddings is not None:
+        _embedding_registry.move_to_end(key)
+        _embedding_last_used[key] = time.monotonic()
+        _embedding_metrics[key]["hits"] += 1
+    return embeddings
+
+def evict_idle_embedding_models():
+    """Drop the embedding models not used for EMBEDDING_MODEL_IDLE_SECONDS and return how many were dropped."""
+    cutoff = time.monotonic() - get_value_from_env("EMBEDDING_MODEL_IDLE_SECONDS", 1800, "float")
+    evicted = []
+    with _embedding_registry_lock:
+        # least recently used first, so the scan stops at the first model still in use
+        for key in list(_embedding_registry):
+            if _embedding_last_used[key] > cutoff:
+                break
+            del _embedding_registry[key]
+            del _embedding_last_used[key]
+            _embedding_metrics[key]["evictions"] += 1
+            evicted.append(key)
+    for provider, model in evicted:
+        logging.info(f"Embedding: evicted idle model {provider} - {model} from registry")
+    return len(evicted)
+
+def _start_embedding_sweeper():
+    # called with _embedding_registry_lock held; the sweeper exits once the registry is empty
+    global _embedding_sweeper
+    if _embedding_sweeper is None:
+        _embedding_sweeper = Thread(target=_sweep_idle_embedding_models, name="embedding-model-sweeper", daemon=True)
+        _embedding_sweeper.start()
+
+def _sweep_idle_embedding_models():
+    global _embedding_sweeper
+    while True:
+        time.sleep(max(1.0, get_value_from_env("EMBEDDING_MODEL_IDLE_SECONDS", 1800, "float") / 4))
+        evict_idle_embedding_models()
+        with _embedding_registry_lock:
+            if not _embedding_registry:
+                _embedding_sweeper = None
+                return
+
+def _create_embedding_model(provider: str, model: str):
     if provider == "openai":
-        embeddings = OpenAIEmbeddings(model=model)
+        return OpenAIEmbeddings(model=model)
     elif provider == "gemini":
-        embeddings = GoogleGenerativeAIEmbeddings(model=model, vertexai= True)
+        return GoogleGenerativeAIEmbeddings(model=model, vertexai= True)
     elif provider == "titan":
-        embeddings = _get_bedrock_embeddings(model)
+        return _get_bedrock_embeddings(model)
     elif provider == "sentence-transformer":
         model_path = "./local_model" 
-        embeddings = _get_sentence_transformer_embedding(model, model_path)
-    else:
-        raise ValueError(f"Unknown embedding provider: {provider}")
+        return _build_sentence_transformer_embedding(model, model_path)
+    elif provider == "fake":
+        # hash based vectors for load tests
+        return FakeEmbeddings(int(model.rsplit("-", 1)[1]), get_value_from_env("FAKE_EMBEDDING_LATENCY_MS", 0, "float"))
+    raise ValueError(f"Unknown embedding provider: {provider}")
 
-    logging.info(f"Embedding: Using {provider} - {model}, Dimension: {dimension}")
-    return embeddings, dimension
+def _get_process_rss():
+    try:
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return 0
+
+def get_embedding_model_metrics():
+    """Return load, hit and memory metrics of the embedding model registry."""
+    with _embedding_registry_lock:
+        loaded = set(_embedding_registry)
+        return [
+            {"provider": provider, "model": model, "loaded": (provider, model) in loaded, **metrics}
+            for (provider, model), metrics in _embedding_metrics.items()
+        ]
+
+@register_collector
+def collect_embedding_model_metrics():
+    return snapshot_families(get_embedding_model_metrics(), ("provider", "model"), {
+        "loaded": ("gauge", "1 while the embedding model is held by the registry."),
+        "hits": ("counter", "Embedding model lookups served by the registry."),
+        "loads": ("counter", "Embedding model loads."),
+        "evictions": ("counter", "Embedding models dropped from the registry."),
+        "load_seconds": ("gauge", "Duration of the last load of the embedding model."),
+    }, "embedding_model_")
+
+# Texts per embed_documents call; OpenAI and Gemini take lists in one request, while
+# local sentence-transformers run one forward pass per batch.
+EMBEDDING_BATCH_SIZES = {
+    "openai": 256,
+    "gemini": 100,
+    "titan": 32,
+    "sentence-transformer": 64,
+}
+
+def embed_texts_in_batches(embeddings, texts: List[str], embedding_provider: str):
+    """
+    Embed texts with embed_documents in provider sized batches, keeping a few batches
+    in flight for remote providers.
+
+    Args:
+        embeddings: Embedding instance returned by load_embedding_model.
+        texts (List[str]): Texts to embed.
+        embedding_provider (str): The provider name, used to pick the batch size.
+
+    Returns:
+        List[List[float]]: One vector per text, in input order.
+    """
+    provider = embedding_provider.lower()
+    batch_size = get_value_from_env("EMBEDDING_BATCH_SIZE", EMBEDDING_BATCH_SIZES.get(provider, 64), "int")
+    if provider == "sentence-transformer":
+        # local model is CPU/GPU bound, concurrent batches only contend for the same device
+        concurrency = 1
+    else:
+        concurrency = get_value_from_env("EMBEDDING_BATCH_CONCURRENCY", 4, "int")
+    batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) <= 1 or concurrency <= 1:
+        results = [embeddings.embed_documents(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+            results = list(executor.map(embeddings.embed_documents, batches))
+    logging.info(f"Embedded {len(texts)} texts in {len(batches)} batches of up to {batch_size} with {provider}")
+    return [vector for batch in results for vector in batch]
 
-def save_graphDocuments_in_neo4j(graph: Neo4jGraph, graph_document_list: List[GraphDocument], max_retries=3, delay=1):
-   retries = 0
-   while retries < max_retries:
-       try:
-           graph.add_graph_documents(graph_document_list, baseEntityLabel=True)
-           return
-       except TransientError as e:
-           if "DeadlockDetected" in str(e):
-               retries += 1
-               logging.info(f"Deadlock detected. Retrying {retries}/{max_retries} in {delay} seconds...")
-               time.sleep(delay)  # Wait before retrying
-           else:
-               raise
-   logging.error("Failed to execute query after maximum retries due to persistent deadlocks.")
-   raise RuntimeError("Query execution failed after multiple retries due to deadlock.")
-           
 def handle_backticks_nodes_relationship_id_type(graph_document_list:List[GraphDocument]):
   for graph_document in graph_document_list:
     # Clean node id and types
@@ -267,20 +404,26 @@ def handle_backticks_nodes_relationship_id_type(graph_document_list:List[GraphDo
     graph_document.nodes = cleaned_nodes
   return graph_document_list
 
-def execute_graph_query(graph: Neo4jGraph, query, params=None, max_retries=3, delay=2):
+def execute_graph_query(graph: Neo4jGraph, query, params=None, max_retries=3, delay=2, query_name=None):
+   """Run a query, retrying deadlocks; a query_name records its latency in the neo4j_query_seconds metric."""
    retries = 0
-   while retries < max_retries:
-       try:
-           return graph.query(query, params) 
-       except TransientError as e:
-           if "DeadlockDetected" in str(e):
-               retries += 1
-               logging.info(f"Deadlock detected. Retrying {retries}/{max_retries} in {delay} seconds...")
-               time.sleep(delay)  # Wait before retrying
-           else:
-               raise 
-   logging.error("Failed to execute query after maximum retries due to persistent deadlocks.")
-   raise RuntimeError("Query execution failed after multiple retries due to deadlock.")
+   start = time.perf_counter()
+   try:
+       while retries < max_retries:
+           try:
+               return graph.query(query, params) 
+           except TransientError as e:
+               if "DeadlockDetected" in str(e):
+                   retries += 1
+                   logging.info(f"Deadlock detected. Retrying {retries}/{max_retries} in {delay} seconds...")
+                   time.sleep(delay)  # Wait before retrying
+               else:
+                   raise 
+       logging.error("Failed to execute query after maximum retries due to persistent deadlocks.")
+       raise RuntimeError("Query execution failed after multiple retries due to deadlock.")
+   finally:
+       if query_name is not None:
+           NEO4J_QUERY_SECONDS.labels(query_name).observe(time.perf_counter() - start)
 
 def delete_uploaded_local_file(merged_file_path, file_name):
   file_path = Path(merged_file_path)
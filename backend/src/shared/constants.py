@@ -785,7 +785,7 @@ QUERY_TO_GET_CHUNKS = """
             WHERE d.fileName = $filename
             WITH d
             OPTIONAL MATCH (d)<-[:PART_OF|FIRST_CHUNK]-(c:Chunk)
-            RETURN c.id as id, c.text as text, c.position as position 
+            RETURN c.id as id, c.text as text, c.position as position, c.embedding IS NOT NULL as embedded
             """
             
 QUERY_TO_DELETE_EXISTING_ENTITIES = """
@@ -802,7 +802,7 @@ QUERY_TO_GET_LAST_PROCESSED_CHUNK_POSITION="""
                               MATCH (d:Document)
                               WHERE d.fileName = $filename
                               WITH d
-                              MATCH (c:Chunk) WHERE c.embedding is null 
+                              MATCH (d)<-[:PART_OF]-(c:Chunk) WHERE c.embedding is null 
                               RETURN c.id as id,c.position as position 
                               ORDER BY c.position LIMIT 1
                               """   
@@ -820,6 +820,14 @@ QUERY_TO_GET_NODES_AND_RELATIONS_OF_A_DOCUMENT = """
                               RETURN count(DISTINCT e) as nodes, count(DISTINCT rel) as rels
                               """                              
 
+QUERY_TO_GET_STORED_ENTITIES_OF_BATCH = """
+UNWIND $entities AS entity
+MATCH (e:__Entity__ {id: entity.id})
+WHERE entity.label IN labels(e)
+  AND EXISTS { (e)<-[:HAS_ENTITY]-(c:Chunk)-[:PART_OF]->(:Document {fileName: $filename}) WHERE NOT c.id IN $chunk_ids }
+RETURN entity.label AS label, entity.id AS id
+"""
+
 START_FROM_BEGINNING  = "start_from_beginning"     
 DELETE_ENTITIES_AND_START_FROM_BEGINNING = "delete_entities_and_start_from_beginning"
 START_FROM_LAST_PROCESSED_POSITION = "start_from_last_processed_position"                                                    
@@ -0,0 +1,118 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+EVICTION_CHECK_INTERVAL = 100
+EVICTION_TARGET_RATIO = 0.9
+
+
+class SqliteCache:
+    """
+    Size-bounded key/value store in a local SQLite file, evicting the least recently
+    used entries once the stored values exceed max_bytes. Entries older than
+    ttl_seconds, when given, are treated as missing and removed on eviction.
+
+    One connection is shared by the threads of a process; WAL mode lets several
+    worker processes use the same file.
+    """
+
+    def __init__(self, path, max_bytes, table="cache", ttl_seconds=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL, created_at REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+        if "created_at" not in columns:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table}(last_access)")
+
+    def get_many(self, keys):
+        """Return a dict of the keys found in the cache, refreshing their access time."""
+        found = {}
+        if not keys:
+            return found
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i+500]
+                placeholders = ",".join("?" * len(batch))
+                query = f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})"
+                params = list(batch)
+                if self.ttl_seconds:
+                    query += " AND created_at >= ?"
+                    params.append(time.time() - self.ttl_seconds)
+                rows = self._conn.execute(query, params).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        """Store a dict of key to bytes values."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, value, len(value), now, now) for key, value in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._writes_since_check += len(rows)
+            if self._writes_since_check >= EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict()
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def _evict(self):
+        # caller holds self._lock
+        if self.ttl_seconds:
+            expired = self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+            if expired:
+                logging.info(f"Removed {expired} expired entries from cache {self.path}:{self.table}")
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * EVICTION_TARGET_RATIO)
+        to_free = total - target
+        rows = self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall()
+        evicted = []
+        freed = 0
+        for key, size in rows:
+            if freed >= to_free:
+                break
+            evicted.append((key,))
+            freed += size
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+        logging.info(f"Evicted {len(evicted)} entries ({freed} bytes) from cache {self.path}:{self.table}")
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
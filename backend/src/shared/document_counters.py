@@ -0,0 +1,120 @@
+import logging
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.constants import QUERY_TO_GET_STORED_ENTITIES_OF_BATCH
+
+
+def normalize_relationship_type(rel_type):
+    # same transformation Neo4jGraph.add_graph_documents applies before writing
+    return rel_type.replace(" ", "_").upper().replace("`", "")
+
+
+class DocumentCountTracker:
+    """
+    Keeps the counters of one Document node current while its chunks are processed,
+    without recounting the graph.
+
+    seed() starts from the counters already stored on the Document. Each written batch
+    then adds deltas computed from its GraphDocuments: new entities, identified by
+    (label, id), new entity-entity relationships between entities of the document, and
+    new HAS_ENTITY links. When the Document already had entities, e.g. on a resume from
+    the last processed position, one aggregate query per batch tells which of its new
+    entities an earlier run already linked, so they are not counted twice. The full
+    recount (update_node_relationship_count) runs only when the file finishes, if
+    COUNT_RECONCILE_ON_FINISH is set or chunk dedup linked entities the deltas do not see.
+    """
+
+    def __init__(self, graphDb_data_Access, file_name):
+        self.graphDb_data_Access = graphDb_data_Access
+        self.file_name = file_name
+        self.entities = set()
+        self.relationships = set()
+        self.has_entity_links = set()
+        self.stored_chunks = 0
+        self.stored_entities = 0
+        self.chunks = 0
+
+    def seed(self):
+        """Start from the chunk and entity counters the Document node already has."""
+        stored = self.graphDb_data_Access.get_node_relationship_count(self.file_name).get(self.file_name, {})
+        self.stored_chunks = int(stored.get("chunkNodeCount") or 0)
+        self.stored_entities = int(stored.get("entityNodeCount") or 0)
+        logging.info(f"Seeded counters of {self.file_name} with {self.stored_chunks} stored chunks and {self.stored_entities} stored entities")
+
+    def apply_batch(self, chunks_and_graphDocuments_list):
+        """
+        Add the counts of a written batch to the Document node.
+
+        Args:
+            chunks_and_graphDocuments_list (list): {'chunk_id', 'graph_doc'} dicts of the batch,
+                as built by get_chunk_and_graphDocument.
+
+        Returns:
+            dict: Counters of the Document node keyed by file name.
+        """
+        has_entity_links = set()
+        batch_entities = set()
+        batch_relationships = set()
+        for item in chunks_and_graphDocuments_list:
+            graph_document = item['graph_doc']
+            for node in graph_document.nodes:
+                has_entity_links.add((item['chunk_id'], node.type, node.id))
+                batch_entities.add((node.type, node.id))
+            for rel in graph_document.relationships:
+                batch_relationships.add(((rel.source.type, rel.source.id), normalize_relationship_type(rel.type), (rel.target.type, rel.target.id)))
+
+        new_has_entity_links = has_entity_links - self.has_entity_links
+        self.has_entity_links |= new_has_entity_links
+        new_entities = batch_entities - self.entities
+        if new_entities and self.stored_entities:
+            chunk_ids = list({item['chunk_id'] for item in chunks_and_graphDocuments_list})
+            stored = self._stored_entities_of_batch(new_entities, chunk_ids)
+            self.entities |= stored
+            new_entities -= stored
+        self.entities |= new_entities
+        # the recount only counts relationships whose both ends are entities of the document
+        new_relationships = {
+            rel for rel in batch_relationships - self.relationships
+            if rel[0] in self.entities and rel[2] in self.entities
+        }
+        self.relationships |= new_relationships
+
+        deltas = {
+            "chunkRelCount": len(new_has_entity_links),
+            "entityNodeCount": len(new_entities),
+            "entityEntityRelCount": len(new_relationships),
+        }
+        logging.info(f"Incrementing counters of {self.file_name} by {deltas}")
+        return self.graphDb_data_Access.increment_node_relationship_count(self.file_name, deltas)
+
+    def _stored_entities_of_batch(self, entities, chunk_ids):
+        # entities linked to the document through chunks outside this batch were counted by an earlier run
+        rows = [{"label": label, "id": entity_id} for label, entity_id in entities]
+        result = self.graphDb_data_Access.execute_query(QUERY_TO_GET_STORED_ENTITIES_OF_BATCH, {"filename": self.file_name, "entities": rows, "chunk_ids": chunk_ids}, query_name="stored_entities_of_batch")
+        return {(row["label"], row["id"]) for row in result}
+
+    def add_chunks(self, chunk_items):
+        """Count Chunk nodes created while the file is streamed, with their PART_OF and NEXT_CHUNK relationships."""
+        return self.chunks_created(self.chunks + len(chunk_items))
+
+    def chunks_created(self, total):
+        """Count the Chunk nodes of the file up to total that the stored counters do not include yet."""
+        # chunks stored by an earlier run are the prefix of the file and already counted
+        first_new = max(self.chunks, self.stored_chunks)
+        self.chunks = max(self.chunks, total)
+        new_chunks = self.chunks - first_new
+        if new_chunks <= 0:
+            return None
+        next_chunk_rels = new_chunks - (1 if first_new == 0 else 0)
+        deltas = {"chunkNodeCount": new_chunks, "chunkRelCount": new_chunks + next_chunk_rels}
+        return self.graphDb_data_Access.increment_node_relationship_count(self.file_name, deltas)
+
+    def reconcile(self, required=False):
+        """
+        Recount the Document from the graph when COUNT_RECONCILE_ON_FINISH is set, or when
+        required because links were written outside apply_batch; None otherwise.
+        """
+        if not required and not get_value_from_env("COUNT_RECONCILE_ON_FINISH", "False", "bool"):
+            return None
+        logging.info(f"Reconciling counters of {self.file_name}")
+        return self.graphDb_data_Access.update_node_relationship_count(self.file_name)
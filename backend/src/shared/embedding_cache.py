@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import threading
+from array import array
+
+from src.shared.common_fn import embed_texts_in_batches, get_value_from_env
+from src.shared.disk_cache import SqliteCache
+from src.shared.metrics import register_collector, snapshot_families
+
+# vectors are stored as float64, the precision the embedding clients return, so a cached
+# vector is identical to a freshly computed one
+VECTOR_TYPECODE = "d"
+
+_cache = None
+_cache_open_failed = False
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def get_embedding_cache():
+    """
+    Return the process-wide embedding cache, or None when EMBEDDING_CACHE_ENABLED is false
+    or the cache file could not be opened.
+    """
+    global _cache, _cache_open_failed
+    if not get_value_from_env("EMBEDDING_CACHE_ENABLED", "False", "bool"):
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_open_failed:
+            path = get_value_from_env("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite")
+            max_mb = get_value_from_env("EMBEDDING_CACHE_MAX_MB", 512, "int")
+            try:
+                _cache = SqliteCache(path, max_mb * 1024 * 1024, table="embeddings")
+                logging.info(f"Embedding cache at {path} limited to {max_mb} MB")
+            except Exception as e:
+                # not retried, so a broken path costs one error instead of one per embedding call
+                _cache_open_failed = True
+                logging.error(f"Embedding cache disabled for this process, unable to open {path}: {e}")
+        return _cache
+
+
+def embedding_cache_key(text, embedding_provider, embedding_model):
+    # same SHA-1 content hash as the chunk ids, qualified by the embedding model and the
+    # storage typecode, so entries written as float32 by earlier versions are never misread
+    text_hash = hashlib.sha1(text.encode()).hexdigest()
+    return f"{VECTOR_TYPECODE}:{embedding_provider.lower()}:{embedding_model}:{text_hash}"
+
+
+def embed_texts_with_cache(embeddings, texts, embedding_provider, embedding_model):
+    """
+    Embed texts through the persistent embedding cache; only texts not seen before with
+    this provider and model are sent to embed_texts_in_batches.
+
+    Args:
+        embeddings: Embedding instance returned by load_embedding_model.
+        texts (list): Texts to embed.
+        embedding_provider (str): The provider name.
+        embedding_model (str): The model name.
+
+    Returns:
+        list: One vector per text, in input order.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_texts_in_batches(embeddings, texts, embedding_provider)
+
+    keys = [embedding_cache_key(text, embedding_provider, embedding_model) for text in texts]
+    try:
+        cached = cache.get_many(keys)
+    except Exception as e:
+        logging.error(f"Embedding cache lookup failed: {e}")
+        cached = {}
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    if missing:
+        vectors = embed_texts_in_batches(embeddings, list(missing.values()), embedding_provider)
+        new_entries = {key: array(VECTOR_TYPECODE, vector).tobytes() for key, vector in zip(missing, vectors)}
+        try:
+            cache.set_many(new_entries)
+        except Exception as e:
+            logging.error(f"Embedding cache write failed: {e}")
+        cached.update(new_entries)
+
+    hits = len(texts) - len(missing)
+    with _cache_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += len(missing)
+        total_hits, total_misses = _stats["hits"], _stats["misses"]
+    total = total_hits + total_misses
+    logging.info(f"Embedding cache: {hits}/{len(texts)} hits for this call, overall hit rate {total_hits/total if total else 0:.2%} ({total_hits} hits, {total_misses} misses)")
+    return [array(VECTOR_TYPECODE, cached[key]).tolist() for key in keys]
+
+
+def get_embedding_cache_stats():
+    with _cache_lock:
+        stats = dict(_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+    cache = _cache
+    if cache is not None:
+        stats.update(cache.stats())
+    return stats
+
+
+@register_collector
+def collect_embedding_cache_metrics():
+    return snapshot_families([get_embedding_cache_stats()], (), {
+        "hits": ("counter", "Embedding cache hits."),
+        "misses": ("counter", "Embedding cache misses."),
+        "entries": ("gauge", "Entries in the embedding cache."),
+        "bytes": ("gauge", "Size of the embedding cache in bytes."),
+    }, "embedding_cache_")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import threading
+import zlib
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.disk_cache import SqliteCache
+from src.shared.metrics import register_collector, snapshot_families
+
+_cache = None
+_cache_open_failed = False
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def get_extraction_cache():
+    """
+    Return the process-wide extraction cache, or None when EXTRACTION_CACHE_ENABLED is false
+    or the cache file could not be opened.
+    """
+    global _cache, _cache_open_failed
+    if not get_value_from_env("EXTRACTION_CACHE_ENABLED", "False", "bool"):
+        return None
+    with _cache_lock:
+        if _cache is None and not _cache_open_failed:
+            path = get_value_from_env("EXTRACTION_CACHE_PATH", "./cache/extraction.sqlite")
+            max_mb = get_value_from_env("EXTRACTION_CACHE_MAX_MB", 1024, "int")
+            ttl_hours = get_value_from_env("EXTRACTION_CACHE_TTL_HOURS", 168, "int")
+            try:
+                _cache = SqliteCache(path, max_mb * 1024 * 1024, table="graph_documents", ttl_seconds=ttl_hours * 3600 if ttl_hours > 0 else None)
+                logging.info(f"Extraction cache at {path} limited to {max_mb} MB with TTL {ttl_hours} hours")
+            except Exception as e:
+                # not retried, so a broken path costs one error instead of one per chunk
+                _cache_open_failed = True
+                logging.error(f"Extraction cache disabled for this process, unable to open {path}: {e}")
+        return _cache
+
+
+def extraction_cache_key(text, model, model_name, allowed_nodes, allowed_relationships, additional_instructions):
+    payload = json.dumps(
+        [text, model, model_name, sorted(allowed_nodes), sorted(list(rel) for rel in allowed_relationships), additional_instructions or ""],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def serialize_graph_document(graph_document):
+    data = {
+        "nodes": [[node.id, node.type, node.properties] for node in graph_document.nodes],
+        "relationships": [
+            [rel.source.id, rel.source.type, rel.target.id, rel.target.type, rel.type, rel.properties]
+            for rel in graph_document.relationships
+        ],
+    }
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode())
+
+
+def deserialize_graph_document(value, source):
+    """Rebuild a cached GraphDocument around the current source document and its chunk ids."""
+    data = json.loads(zlib.decompress(value))
+    nodes = [Node(id=node_id, type=node_type, properties=properties) for node_id, node_type, properties in data["nodes"]]
+    relationships = [
+        Relationship(
+            source=Node(id=source_id, type=source_type),
+            target=Node(id=target_id, type=target_type),
+            type=rel_type,
+            properties=properties,
+        )
+        for source_id, source_type, target_id, target_type, rel_type, properties in data["relationships"]
+    ]
+    return GraphDocument(nodes=nodes, relationships=relationships, source=source)
+
+
+def get_cached_graph_documents(documents, keys):
+    """Return {index: GraphDocument} for the documents whose extraction is cached."""
+    cache = get_extraction_cache()
+    if cache is None:
+        return {}
+    try:
+        cached = cache.get_many(keys)
+    except Exception as e:
+        logging.error(f"Extraction cache lookup failed: {e}")
+        return {}
+    graph_documents = {}
+    for index, (document, key) in enumerate(zip(documents, keys)):
+        if key in cached:
+            try:
+                graph_documents[index] = deserialize_graph_document(cached[key], document)
+            except Exception as e:
+                logging.error(f"Ignoring unreadable extraction cache entry {key}: {e}")
+    with _cache_lock:
+        _stats["hits"] += len(graph_documents)
+        _stats["misses"] += len(documents) - len(graph_documents)
+    logging.info(f"Extraction cache: {len(graph_documents)}/{len(documents)} hits")
+    return graph_documents
+
+
+def save_graph_documents_to_cache(graph_documents_by_key):
+    cache = get_extraction_cache()
+    if cache is None or not graph_documents_by_key:
+        return
+    try:
+        cache.set_many({key: serialize_graph_document(graph_document) for key, graph_document in graph_documents_by_key.items()})
+    except Exception as e:
+        logging.error(f"Extraction cache write failed: {e}")
+
+
+def get_extraction_cache_stats():
+    with _cache_lock:
+        stats = dict(_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+    cache = _cache
+    if cache is not None:
+        stats.update(cache.stats())
+    return stats
+
+
+@register_collector
+def collect_extraction_cache_metrics():
+    return snapshot_families([get_extraction_cache_stats()], (), {
+        "hits": ("counter", "Extraction cache hits."),
+        "misses": ("counter", "Extraction cache misses."),
+        "entries": ("gauge", "Entries in the extraction cache."),
+        "bytes": ("gauge", "Size of the extraction cache in bytes."),
+    }, "extraction_cache_")
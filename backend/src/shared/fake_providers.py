@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, List, Optional
+
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+DEFAULT_ENTITY_TYPES = ("Person", "Organization", "Location", "Concept")
+DEFAULT_RELATIONSHIP_TYPE = "RELATED_TO"
+LEADING_STOPWORDS = {
+    "a", "an", "and", "as", "at", "but", "by", "for", "from", "he", "her", "his", "i", "if", "in", "it",
+    "its", "of", "on", "or", "our", "she", "that", "the", "their", "these", "they", "this", "those",
+    "to", "we", "when", "while", "with", "you",
+}
+PHRASE_PATTERN = re.compile(r"\b[A-Z][\w\-]*(?:\s+[A-Z][\w\-]*)*")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+class FakeProviderError(Exception):
+    """Synthetic provider error, shaped like the HTTP errors of real clients."""
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"Fake provider returned HTTP {status_code}")
+
+
+def estimate_tokens(text):
+    # about four characters per token, enough for load tests
+    return max(1, len(text) // 4)
+
+
+def _stable_index(value, size):
+    return zlib.crc32(value.encode()) % size
+
+
+def extract_capitalised_phrases(text):
+    """Capitalised noun phrases of a text in order of appearance, leading stopwords removed."""
+    phrases = []
+    for match in PHRASE_PATTERN.finditer(text):
+        words = match.group(0).split()
+        while words and words[0].lower() in LEADING_STOPWORDS:
+            words = words[1:]
+        if words and (len(words) > 1 or len(words[0]) > 2):
+            phrases.append(" ".join(words))
+    return phrases
+
+
+def fake_graph_document(document, allowed_nodes=None, allowed_relationships=None, max_entities=25):
+    """
+    Deterministic GraphDocument of a text: capitalised noun phrases become entities with
+    a type picked by hash, and entities following each other in a sentence are related.
+    Allowed node types and (source, type, target) relationships are respected.
+    """
+    node_types = list(allowed_nodes) if allowed_nodes else list(DEFAULT_ENTITY_TYPES)
+    nodes = {}
+    relationships = {}
+    for sentence in SENTENCE_PATTERN.split(document.page_content):
+        previous = None
+        for phrase in extract_capitalised_phrases(sentence):
+            if phrase not in nodes:
+                if len(nodes) >= max_entities:
+                    continue
+                nodes[phrase] = Node(id=phrase, type=node_types[_stable_index(phrase, len(node_types))])
+            node = nodes[phrase]
+            if previous is not None and previous.id != node.id:
+                rel_type = DEFAULT_RELATIONSHIP_TYPE
+                if allowed_relationships:
+                    matching = [rel for rel in allowed_relationships if rel[0] == previous.type and rel[2] == node.type]
+                    rel_type = matching[0][1] if matching else None
+                if rel_type is not None:
+                    relationships[(previous.id, rel_type, node.id)] = Relationship(source=previous, target=node, type=rel_type)
+            previous = node
+    return GraphDocument(nodes=list(nodes.values()), relationships=list(relationships.values()), source=document)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model for load tests, configured through LLM_MODEL_CONFIG_FAKE_*. Answers are
+    derived from the prompt without any network call, after a lognormal latency with the
+    given median and p99, and fail with HTTP 429 or 503 at error_rate.
+    """
+
+    model_name: str = "fake"
+    median_latency_ms: float = 200.0
+    p99_latency_ms: float = 1000.0
+    error_rate: float = 0.0
+    output_tokens: int = 200
+    max_entities: int = 25
+    seed: Optional[int] = None
+    _rng: Any = PrivateAttr(default=None)
+    _rng_lock: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        super().model_post_init(__context)
+        self._rng = random.Random(self.seed)
+        self._rng_lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return "fake-graph-builder"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def _sample(self):
+        """Latency in seconds and the error to raise, if any, for one call."""
+        with self._rng_lock:
+            median = max(self.median_latency_ms, 0.001) / 1000
+            # 2.326 standard deviations put p99_latency_ms at the 99th percentile
+            sigma = max(math.log(max(self.p99_latency_ms, self.median_latency_ms, 0.001) / 1000 / median), 0) / 2.326
+            latency = median * math.exp(self._rng.gauss(0, sigma)) if self.median_latency_ms > 0 else 0.0
+            error = None
+            if self._rng.random() < self.error_rate:
+                error = FakeProviderError(self._rng.choice((429, 503)))
+        return latency, error
+
+    def _result(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        # the last message holds the text to answer about: the chunk, question or community
+        phrases = list(dict.fromkeys(extract_capitalised_phrases(str(messages[-1].content)) if messages else []))
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        content = f"Fake answer {digest} about {', '.join(phrases[:5]) or 'the given text'}."
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": self.output_tokens,
+            "total_tokens": estimate_tokens(prompt) + self.output_tokens,
+        }
+        message = AIMessage(
+            content=content,
+            response_metadata={"token_usage": usage, "model_name": self.model_name},
+            usage_metadata={"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"], "total_tokens": usage["total_tokens"]},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": usage, "model_name": self.model_name})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, error = self._sample()
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        latency, error = self._sample()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return self._result(messages)
+
+
+def create_fake_chat_model(env_value):
+    """
+    Build a FakeChatModel from an LLM_MODEL_CONFIG_FAKE_* value:
+    "model_name,median_ms=200,p99_ms=1000,error_rate=0.01,output_tokens=200,max_entities=25,seed=7",
+    every option being optional.
+    """
+    model_name, *options = [part.strip() for part in env_value.split(",")]
+    settings = dict(option.split("=", 1) for option in options if "=" in option)
+    kwargs = {
+        "median_latency_ms": float(settings.get("median_ms", 200)),
+        "p99_latency_ms": float(settings.get("p99_ms", 1000)),
+        "error_rate": float(settings.get("error_rate", 0)),
+        "output_tokens": int(settings.get("output_tokens", 200)),
+        "max_entities": int(settings.get("max_entities", 25)),
+    }
+    if "seed" in settings:
+        kwargs["seed"] = int(settings["seed"])
+    return FakeChatModel(model_name=model_name or "fake", **kwargs), model_name or "fake"
+
+
+class FakeGraphTransformer:
+    """
+    Graph transformer of FakeChatModel. Each document still goes through one call of the
+    model, so latency, errors, rate limits and token usage behave like a real provider,
+    while the GraphDocument comes from fake_graph_document.
+    """
+
+    def __init__(self, llm, allowed_nodes=None, allowed_relationships=None):
+        self.llm = llm
+        self.allowed_nodes = allowed_nodes or []
+        self.allowed_relationships = allowed_relationships or []
+
+    def process_response(self, document, config=None):
+        self.llm.invoke(document.page_content, config=config)
+        return fake_graph_document(document, self.allowed_nodes, self.allowed_relationships, self.llm.max_entities)
+
+    async def aprocess_response(self, document, config=None):
+        await self.llm.ainvoke(document.page_content, config=config)
+        return fake_graph_document(document, self.allowed_nodes, self.allowed_relationships, self.llm.max_entities)
+
+    def convert_to_graph_documents(self, documents, config=None):
+        return [self.process_response(document, config) for document in documents]
+
+    async def aconvert_to_graph_documents(self, documents, config=None):
+        return list(await asyncio.gather(*(self.aprocess_response(document, config) for document in documents)))
+
+
+class FakeEmbeddings(Embeddings):
+    """Reproducible unit vectors derived from a hash of the text, optionally after a fixed delay per call."""
+
+    def __init__(self, dimension, latency_ms=0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def _vector(self, text):
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.blake2b(f"{counter}:{text}".encode(), digest_size=64).digest()
+            values.extend(int.from_bytes(digest[i:i+2], "big") / 32767.5 - 1 for i in range(0, len(digest), 2))
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(value * value for value in values)) or 1.0
+        return [value / norm for value in values]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
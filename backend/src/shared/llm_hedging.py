@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.metrics import register_collector, snapshot_families
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class LatencyHedger:
+    """
+    Recent call latencies of one model and its hedging budget.
+
+    A call still running after the LLM_HEDGE_PERCENTILE latency of the last
+    LLM_HEDGE_WINDOW calls gets a duplicate request, as long as hedges stay under
+    LLM_HEDGE_MAX_PERCENT of the calls in the window. No hedge is sent before
+    LLM_HEDGE_MIN_SAMPLES latencies are known.
+    """
+
+    def __init__(self, model, percentile=95.0, window=200, min_samples=20, max_percent=10.0):
+        self.model = model
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_percent = max_percent
+        self._latencies = deque(maxlen=window)
+        self._hedged = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.metrics = {"calls": 0, "hedges": 0, "hedge_wins": 0, "hedges_over_budget": 0, "hedge_extra_tokens": 0}
+
+    def hedge_delay(self):
+        """Seconds after which a call is hedged, or None while too few latencies are known."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return latencies[index]
+
+    def try_hedge(self):
+        """Take a hedge from the budget; False when hedges would exceed max_percent of recent calls."""
+        with self._lock:
+            calls = max(1, len(self._hedged))
+            if (sum(self._hedged) + 1) * 100 > self.max_percent * calls:
+                self.metrics["hedges_over_budget"] += 1
+                return False
+            self.metrics["hedges"] += 1
+            return True
+
+    def record(self, latency, hedged, hedge_won=False, extra_tokens=0):
+        with self._lock:
+            self._latencies.append(latency)
+            self._hedged.append(1 if hedged else 0)
+            self.metrics["calls"] += 1
+            if hedge_won:
+                self.metrics["hedge_wins"] += 1
+            self.metrics["hedge_extra_tokens"] += extra_tokens
+
+    def snapshot(self):
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "model": self.model,
+                "percentile": self.percentile,
+                "hedge_after_seconds": round(delay, 3) if delay is not None else None,
+                "samples": len(self._latencies),
+                **self.metrics,
+            }
+
+
+def is_hedging_enabled():
+    return get_value_from_env("ENABLE_LLM_HEDGING", "False", "bool")
+
+
+def get_hedger(model):
+    """Return the process-wide LatencyHedger of a model key, e.g. OPENAI_GPT_5_4_MINI."""
+    model = model.upper().replace('.', '_').strip()
+    with _hedgers_lock:
+        hedger = _hedgers.get(model)
+        if hedger is None:
+            hedger = LatencyHedger(
+                model,
+                percentile=get_value_from_env("LLM_HEDGE_PERCENTILE", 95, "float"),
+                window=get_value_from_env("LLM_HEDGE_WINDOW", 200, "int"),
+                min_samples=get_value_from_env("LLM_HEDGE_MIN_SAMPLES", 20, "int"),
+                max_percent=get_value_from_env("LLM_HEDGE_MAX_PERCENT", 10, "float"),
+            )
+            _hedgers[model] = hedger
+        return hedger
+
+
+def get_hedging_metrics():
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return [hedger.snapshot() for hedger in hedgers]
+
+
+@register_collector
+def collect_hedging_metrics():
+    return snapshot_families(get_hedging_metrics(), ("model",), {
+        "hedge_after_seconds": ("gauge", "Latency after which a call is hedged."),
+        "hedges": ("counter", "Duplicate calls sent."),
+        "hedge_wins": ("counter", "Calls answered first by the duplicate."),
+        "hedges_over_budget": ("counter", "Hedges skipped because of the hedging budget."),
+        "hedge_extra_tokens": ("counter", "Estimated tokens spent on duplicate calls."),
+    }, "llm_hedging_")
+
+
+async def hedged_call(call, model, hedge_tokens=0, on_hedge_cost=None):
+    """
+    Await call(), sending a duplicate call() when the first one is slower than the
+    model's hedge delay. The first successful answer wins and the other call is cancelled.
+
+    Args:
+        call (callable): Returns a new awaitable for each attempt.
+        model (str): Model key the latencies are tracked under.
+        hedge_tokens (int): Estimated tokens a duplicate call costs, recorded per hedge.
+        on_hedge_cost (callable): Called with hedge_tokens whenever a hedge is sent.
+    """
+    if not is_hedging_enabled():
+        return await call()
+    hedger = get_hedger(model)
+    delay = hedger.hedge_delay()
+    start = time.monotonic()
+    primary = asyncio.ensure_future(call())
+    if delay is None:
+        result = await primary
+        hedger.record(time.monotonic() - start, hedged=False)
+        return result
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not hedger.try_hedge():
+            result = await primary
+            hedger.record(time.monotonic() - start, hedged=False)
+            return result
+    except BaseException:
+        primary.cancel()
+        raise
+
+    logging.info(f"Hedging {model} call still running after {delay:.2f} seconds")
+    if on_hedge_cost is not None:
+        on_hedge_cost(hedge_tokens)
+    hedge = asyncio.ensure_future(call())
+    pending = {primary, hedge}
+    first_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    hedger.record(time.monotonic() - start, hedged=True, hedge_won=task is hedge, extra_tokens=hedge_tokens)
+                    return task.result()
+                first_error = first_error or task.exception()
+        hedger.record(time.monotonic() - start, hedged=True, extra_tokens=hedge_tokens)
+        raise first_error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_value_from_env("LLM_HEDGE_THREADS", 8, "int"), thread_name_prefix="llm-hedge")
+        return _executor
+
+
+def hedged_invoke(call, model, hedge_tokens=0, on_hedge_cost=None):
+    """
+    Blocking counterpart of hedged_call for synchronous chains such as chat. A losing
+    call cannot be interrupted in its thread; its answer is discarded when it arrives.
+    """
+    if not is_hedging_enabled():
+        return call()
+    hedger = get_hedger(model)
+    delay = hedger.hedge_delay()
+    start = time.monotonic()
+    if delay is None:
+        result = call()
+        hedger.record(time.monotonic() - start, hedged=False)
+        return result
+    executor = _get_executor()
+    primary = executor.submit(call)
+    done, _ = wait({primary}, timeout=delay)
+    if done or not hedger.try_hedge():
+        result = primary.result()
+        hedger.record(time.monotonic() - start, hedged=False)
+        return result
+
+    logging.info(f"Hedging {model} call still running after {delay:.2f} seconds")
+    if on_hedge_cost is not None:
+        on_hedge_cost(hedge_tokens)
+    hedge = executor.submit(call)
+    pending = {primary, hedge}
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                hedger.record(time.monotonic() - start, hedged=True, hedge_won=future is hedge, extra_tokens=hedge_tokens)
+                return future.result()
+            first_error = first_error or future.exception()
+    hedger.record(time.monotonic() - start, hedged=True, extra_tokens=hedge_tokens)
+    raise first_error
@@ -0,0 +1,275 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.metrics import register_collector, snapshot_families
+from src.shared.rate_limiter import is_rate_limit_error
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERROR_MARKERS = ("timeout", "timed out", "connection", "unavailable", "internalserver", "overloaded", "temporarily", "try again")
+# same order as create_llm, so a model key maps to the client it is built with
+PROVIDERS = ("FAKE", "GEMINI", "OPENAI", "AZURE", "ANTHROPIC", "FIREWORKS", "GROQ", "BEDROCK", "OLLAMA", "DIFFBOT")
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class PartialExtractionError(Exception):
+    """
+    Raised when some combined chunks of a batch still failed after retries and failover.
+    Carries the graph documents of the combined chunks that succeeded and the combined
+    chunk documents that failed; token_usage is set by get_graph_document_list.
+    """
+
+    def __init__(self, graph_documents, errors, total, failed_documents=()):
+        self.graph_documents = graph_documents
+        self.errors = errors
+        self.total = total
+        self.failed_documents = list(failed_documents)
+        self.token_usage = 0
+        super().__init__(f"{len(errors)} of {total} combined chunks failed extraction, first error: {errors[0]}")
+
+
+def get_provider(model):
+    model = model.upper()
+    for provider in PROVIDERS:
+        if provider in model:
+            return provider
+    return model
+
+
+def get_status_code(error):
+    for candidate in (error, getattr(error, "response", None)):
+        status = getattr(candidate, "status_code", None)
+        if isinstance(status, int):
+            return status
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable_error(error):
+    """Return True for throttling, timeouts, connection failures and 5xx provider errors."""
+    if isinstance(error, (CircuitOpenError, asyncio.CancelledError)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    if is_rate_limit_error(error):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RETRYABLE_ERROR_MARKERS)
+
+
+def get_retry_after(error):
+    """Seconds to wait from a Retry-After (or retry-after-ms) response header of a provider error, else None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        try:
+            retry_after_ms = headers.get("retry-after-ms")
+            if retry_after_ms:
+                return float(retry_after_ms) / 1000
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    retry_at = email.utils.parsedate_to_datetime(retry_after)
+                    return max(0.0, retry_at.timestamp() - time.time())
+        except Exception as e:
+            logging.debug(f"Unable to read Retry-After of {type(error).__name__}: {e}")
+    retry_after = getattr(error, "retry_after", None)
+    return float(retry_after) if isinstance(retry_after, (int, float)) else None
+
+
+class CircuitBreaker:
+    """
+    Per provider circuit breaker. After failure_threshold consecutive retryable failures
+    the circuit opens and calls are refused for open_seconds; then one probe call is let
+    through (half open), and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, provider, failure_threshold=5, open_seconds=30.0):
+        self.provider = provider
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.metrics = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self):
+        """Return 0 when a call may go ahead, else the seconds until the circuit half opens."""
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining <= 0 and not self._probe_in_flight:
+                self.state = "half_open"
+                self._probe_in_flight = True
+                return 0
+            self.metrics["rejected"] += 1
+            return max(remaining, 1.0)
+
+    def record_success(self):
+        with self._lock:
+            self.metrics["successes"] += 1
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != "closed":
+                logging.info(f"Circuit breaker for {self.provider} closed")
+                self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.metrics["failures"] += 1
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive_failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.metrics["opened"] += 1
+                logging.warning(f"Circuit breaker for {self.provider} opened for {self.open_seconds:.0f} seconds after {self._consecutive_failures} consecutive failures")
+
+    def release_probe(self):
+        # a half open probe that ended without a provider verdict, e.g. cancelled or a bad request
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {"provider": self.provider, "state": self.state, "consecutive_failures": self._consecutive_failures, **self.metrics}
+
+
+def get_circuit_breaker(provider):
+    """Return the process-wide circuit breaker of a provider, configured by LLM_CIRCUIT_FAILURE_THRESHOLD and LLM_CIRCUIT_OPEN_SECONDS."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                get_value_from_env("LLM_CIRCUIT_FAILURE_THRESHOLD", 5, "int"),
+                get_value_from_env("LLM_CIRCUIT_OPEN_SECONDS", 30, "float"),
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def get_circuit_breaker_metrics():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+
+@register_collector
+def collect_circuit_breaker_metrics():
+    snapshots = [{**snapshot, "state": CIRCUIT_STATES[snapshot["state"]]} for snapshot in get_circuit_breaker_metrics()]
+    return snapshot_families(snapshots, ("provider",), {
+        "state": ("gauge", "Circuit breaker state: 0 closed, 1 half open, 2 open."),
+        "failures": ("counter", "Retryable LLM call failures."),
+        "rejected": ("counter", "LLM calls refused while the circuit was open."),
+        "opened": ("counter", "Times the circuit opened."),
+    }, "llm_circuit_")
+
+
+async def call_with_retries(call, model, fail_fast=False):
+    """
+    Await call() with retries of retryable errors, using full jitter exponential backoff
+    (LLM_RETRY_BASE_SECONDS doubling up to LLM_RETRY_MAX_SECONDS) or the provider's
+    Retry-After when given, for at most LLM_RETRY_MAX_ATTEMPTS attempts.
+
+    Calls go through the circuit breaker of the model's provider. With fail_fast an open
+    circuit raises CircuitOpenError at once, so the caller can fail over; otherwise the
+    call waits for the circuit to half open.
+    """
+    max_attempts = max(1, get_value_from_env("LLM_RETRY_MAX_ATTEMPTS", 4, "int"))
+    base_seconds = get_value_from_env("LLM_RETRY_BASE_SECONDS", 1, "float")
+    max_seconds = get_value_from_env("LLM_RETRY_MAX_SECONDS", 60, "float")
+    breaker = get_circuit_breaker(get_provider(model))
+    attempt = 0
+    while True:
+        wait = breaker.allow()
+        if wait:
+            if fail_fast:
+                raise CircuitOpenError(f"Circuit breaker for {breaker.provider} is open")
+            logging.info(f"Circuit breaker for {breaker.provider} is open, waiting {wait:.1f} seconds")
+            await asyncio.sleep(wait)
+            continue
+        attempt += 1
+        try:
+            result = await call()
+        except Exception as e:
+            if not is_retryable_error(e):
+                breaker.release_probe()
+                raise
+            breaker.record_failure()
+            retry_after = get_retry_after(e)
+            if attempt >= max_attempts or (retry_after is not None and retry_after > max_seconds):
+                raise
+            delay = retry_after if retry_after is not None else random.uniform(0, min(max_seconds, base_seconds * 2 ** (attempt - 1)))
+            logging.warning(f"Retrying {model} call in {delay:.2f} seconds after attempt {attempt} of {max_attempts} failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+def get_failover_model(model):
+    """The LLM_FAILOVER_MODEL_<MODEL> or LLM_FAILOVER_MODEL model to use when model keeps failing, else None."""
+    model_key = model.upper().replace('.', '_').strip()
+    failover_model = get_value_from_env(f"LLM_FAILOVER_MODEL_{model_key}") or get_value_from_env("LLM_FAILOVER_MODEL", "")
+    if not failover_model or failover_model.upper().replace('.', '_').strip() == model_key:
+        return None
+    return failover_model
+
+
+async def extract_with_failover(documents, extract, model, failover_model=None, failover_extract=None):
+    """
+    Extract each document on its own with call_with_retries, so a failure only affects
+    its own combined chunk. Documents still failing on model are extracted with
+    failover_extract on failover_model when given, and tagged with
+    metadata['failover_model'].
+
+    Returns:
+        list: Graph documents in document order.
+
+    Raises:
+        PartialExtractionError: If some documents failed, carrying the successful ones.
+    """
+    fail_fast = failover_model is not None
+
+    async def extract_document(document):
+        try:
+            return await call_with_retries(lambda: extract(document), model, fail_fast=fail_fast)
+        except Exception as e:
+            if failover_model is None:
+                raise
+            logging.warning(f"Failing over to {failover_model} for combined chunks {document.metadata.get('combined_chunk_ids')} after {type(e).__name__}: {e}")
+            document.metadata["failover_model"] = failover_model
+            return await call_with_retries(lambda: failover_extract(document), failover_model)
+
+    results = await asyncio.gather(*(extract_document(document) for document in documents), return_exceptions=True)
+    for result in results:
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+    errors = [result for result in results if isinstance(result, BaseException)]
+    graph_documents = [result for result in results if not isinstance(result, BaseException)]
+    if errors:
+        failed_documents = [document for document, result in zip(documents, results) if isinstance(result, BaseException)]
+        raise PartialExtractionError(graph_documents, errors, len(documents), failed_documents)
+    return graph_documents
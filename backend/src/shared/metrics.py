@@ -0,0 +1,285 @@
+import bisect
+import logging
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+METRIC_PREFIX = "llm_graph_builder_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper_bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, upper_bounds):
+        self._lock = threading.Lock()
+        self._upper_bounds = upper_bounds
+        # the last slot counts values above the largest bound (+Inf)
+        self.bucket_counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Metric:
+    """
+    A metric family with fixed label names. labels() returns the child of one set of
+    label values, created on first use and kept for the life of the process, so hot
+    paths bind their children once and only pay for a lock and an addition per update.
+    """
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            values = tuple(str(value) for value in values)
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _items(self):
+        with self._lock:
+            return [(tuple(zip(self.labelnames, values)), child) for values, child in self._children.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, child in self._items():
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+    def _render_child(self, labels, child):
+        with child._lock:
+            value = child.value
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, labels, child):
+        with child._lock:
+            bucket_counts = list(child.bucket_counts)
+            total, count = child.sum, child.count
+        lines = []
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(float(upper_bound))),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def register_collector(collector):
+    """
+    Register a function called on every scrape that returns metric families read from
+    existing state, as (name, type, documentation, [(labels dict, value), ...]) tuples.
+    Used for stats the components already keep, so they cost nothing between scrapes.
+    """
+    with _registry_lock:
+        _collectors.append(collector)
+    return collector
+
+
+def snapshot_families(snapshots, label_keys, values, name_prefix):
+    """
+    Families of a collector from a list of snapshot dicts, e.g. get_rate_limiter_metrics().
+
+    Args:
+        snapshots (list): Dicts holding the label keys and the values.
+        label_keys (tuple): Keys used as labels.
+        values (dict): Snapshot key -> (type, documentation) of each exported value.
+        name_prefix (str): Prefix of the exported names, e.g. "llm_rate_limiter_".
+    """
+    families = []
+    for key, (metric_type, documentation) in values.items():
+        name = f"{name_prefix}{key}_total" if metric_type == "counter" else f"{name_prefix}{key}"
+        samples = [
+            ({label: snapshot.get(label) for label in label_keys}, snapshot[key])
+            for snapshot in snapshots if isinstance(snapshot.get(key), (int, float))
+        ]
+        families.append((name, metric_type, documentation, samples))
+    return families
+
+
+def render_metrics():
+    """The Prometheus text exposition (version 0.0.4) of every metric and collector."""
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for collector in collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            logging.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+            continue
+        for name, metric_type, documentation, samples in families:
+            name = METRIC_PREFIX + name
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+PIPELINE_STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Duration of extraction pipeline stages, per batch of chunks for the chunk stages.", ("stage",))
+LLM_CALL_SECONDS = Histogram("llm_call_seconds", "Latency of LLM calls.", ("provider", "model", "outcome"))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by LLM providers.", ("provider", "model", "type"))
+NEO4J_QUERY_SECONDS = Histogram("neo4j_query_seconds", "Latency of named Neo4j queries and transactions.", ("query",))
+QUEUE_DEPTH = Gauge("queue_depth", "Items waiting in in-process queues.", ("queue",))
+EXTRACTIONS_IN_FLIGHT = Gauge("extractions_in_flight", "Files being extracted by this process.")
+
+
+class StageTimings:
+    """
+    Stage durations of one file extraction. record() observes a duration in
+    PIPELINE_STAGE_SECONDS and adds it to the totals of the file, which summary()
+    returns as seconds per stage for the /extract response.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seconds = {}
+
+    def record(self, stage, seconds):
+        PIPELINE_STAGE_SECONDS.labels(stage).observe(seconds)
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+
+    def summary(self):
+        with self._lock:
+            return {stage: round(seconds, 3) for stage, seconds in self._seconds.items()}
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Callback of one LLM copy from get_llm, recording call latency and tokens under its provider and model."""
+
+    run_inline = True
+
+    def __init__(self, provider, model):
+        self._start_times = {}
+        self._succeeded = LLM_CALL_SECONDS.labels(provider, model, "success")
+        self._failed = LLM_CALL_SECONDS.labels(provider, model, "error")
+        self._prompt_tokens = LLM_TOKENS.labels(provider, model, "prompt")
+        self._completion_tokens = LLM_TOKENS.labels(provider, model, "completion")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start_times[run_id] = time.monotonic()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start_times[run_id] = time.monotonic()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._start_times.pop(run_id, None)
+        if start is not None:
+            self._succeeded.observe(time.monotonic() - start)
+        usage = response.llm_output.get("token_usage") if response.llm_output else None
+        if usage:
+            self._prompt_tokens.inc(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+            self._completion_tokens.inc(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+            return
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    self._prompt_tokens.inc(metadata.get("input_tokens", 0))
+                    self._completion_tokens.inc(metadata.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._start_times.pop(run_id, None)
+        if start is not None:
+            self._failed.observe(time.monotonic() - start)
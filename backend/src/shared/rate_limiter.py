@@ -0,0 +1,345 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from src.shared.common_fn import get_value_from_env
+from src.shared.metrics import register_collector, snapshot_families
+
+RATE_LIMIT_ERROR_MARKERS = ("429", "rate limit", "ratelimit", "too many requests", "throttl", "overloaded", "resource_exhausted", "quota")
+LATENCY_SPIKE_FACTOR = 3.0
+LATENCY_MIN_SAMPLES = 5
+LATENCY_EWMA_ALPHA = 0.2
+MIN_WAIT_SECONDS = 0.05
+MAX_WAIT_SECONDS = 1.0
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+# (handler, run_id) of LLM runs started in this context that have not taken a limiter slot yet
+_pending_runs = contextvars.ContextVar("rate_limiter_pending_runs", default=None)
+
+
+def is_rate_limit_error(error):
+    """Return True when an LLM provider error signals throttling (HTTP 429 or equivalent)."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_ERROR_MARKERS)
+
+
+class ModelRateLimiter(BaseRateLimiter):
+    """
+    Process-wide limiter shared by every LLM instance of one LLM_MODEL_CONFIG_* model.
+
+    - Requests per minute: token bucket charged once per request on acquire.
+    - Tokens per minute: charged after each call with the reported usage, so a call
+      that overshoots the budget delays the next ones instead of being rejected.
+    - Concurrency: additive increase after healthy calls, halved on throttling errors
+      or on latency spikes, between 1 and max_concurrency.
+
+    LangChain only calls acquire/aacquire, so in-flight calls are released by
+    RateLimitFeedbackHandler when the call ends or fails. A slot is only counted in
+    flight for a run the handler registered, so it is released exactly once; calls
+    made without the handler are only charged against the per minute budgets.
+    """
+
+    def __init__(self, model, requests_per_minute=0, tokens_per_minute=0, max_concurrency=8):
+        self.model = model
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency_limit = self.max_concurrency
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._request_tokens = float(requests_per_minute)
+        self._llm_tokens = float(tokens_per_minute)
+        self._last_refill = now
+        self._healthy_calls = 0
+        self._latency_ewma = None
+        self._latency_samples = 0
+        self.metrics = {
+            "requests": 0,
+            "successes": 0,
+            "errors": 0,
+            "rate_limit_errors": 0,
+            "latency_spikes": 0,
+            "backoffs": 0,
+            "ramp_ups": 0,
+            "tokens": 0,
+            "wait_seconds": 0.0,
+            "max_in_flight": 0,
+            "abandoned": 0,
+        }
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_tokens = min(float(self.requests_per_minute), self._request_tokens + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._llm_tokens = min(float(self.tokens_per_minute), self._llm_tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def _take_pending_run(self):
+        """The oldest run of this limiter started in the current context without a slot, if any."""
+        pending = _pending_runs.get()
+        for index, (handler, run_id) in enumerate(pending or ()):
+            if handler.limiter is self:
+                del pending[index]
+                return handler, run_id
+        return None
+
+    def _try_acquire(self, run=None):
+        """Take a request slot if possible; otherwise return the seconds to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            waits = []
+            if run is not None and self.in_flight >= self.concurrency_limit:
+                waits.append(MIN_WAIT_SECONDS)
+            if self.requests_per_minute and self._request_tokens < 1:
+                waits.append((1 - self._request_tokens) * 60.0 / self.requests_per_minute)
+            if self.tokens_per_minute and self._llm_tokens <= 0:
+                waits.append(-self._llm_tokens * 60.0 / self.tokens_per_minute + MIN_WAIT_SECONDS)
+            if waits:
+                return min(max(max(waits), MIN_WAIT_SECONDS), MAX_WAIT_SECONDS)
+            if self.requests_per_minute:
+                self._request_tokens -= 1
+            self.metrics["requests"] += 1
+            if run is not None:
+                self.in_flight += 1
+                self.metrics["max_in_flight"] = max(self.metrics["max_in_flight"], self.in_flight)
+                # recorded under the same lock, so a cancellation cannot fall between taking and recording the slot
+                run[0].slot_acquired(run[1])
+            return 0
+
+    def acquire(self, *, blocking=True):
+        start = time.monotonic()
+        run = self._take_pending_run()
+        while True:
+            wait = self._try_acquire(run)
+            if not wait:
+                break
+            if not blocking:
+                return False
+            time.sleep(wait)
+        self._record_wait(time.monotonic() - start)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        start = time.monotonic()
+        run = self._take_pending_run()
+        while True:
+            wait = self._try_acquire(run)
+            if not wait:
+                break
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+        self._record_wait(time.monotonic() - start)
+        return True
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.metrics["wait_seconds"] += waited
+        if waited >= 1:
+            logging.info(f"Rate limiter for {self.model} delayed a call by {waited:.2f} seconds")
+
+    def release(self, latency=None, tokens=0, error=None, abandoned=False, slot=True):
+        """Report the outcome of a call that passed acquire and adapt the concurrency limit; slot=False keeps in_flight."""
+        with self._lock:
+            if slot:
+                self.in_flight = max(0, self.in_flight - 1)
+            if abandoned:
+                self.metrics["abandoned"] += 1
+                return
+            if tokens:
+                self.metrics["tokens"] += tokens
+                if self.tokens_per_minute:
+                    self._refill(time.monotonic())
+                    self._llm_tokens -= tokens
+            if error is not None:
+                self.metrics["errors"] += 1
+                if is_rate_limit_error(error):
+                    self.metrics["rate_limit_errors"] += 1
+                    self._backoff("rate limit error")
+                return
+            self.metrics["successes"] += 1
+            if latency is not None:
+                if self._latency_samples >= LATENCY_MIN_SAMPLES and latency > LATENCY_SPIKE_FACTOR * self._latency_ewma:
+                    self.metrics["latency_spikes"] += 1
+                    self._backoff(f"latency spike {latency:.2f}s against average {self._latency_ewma:.2f}s")
+                    return
+                if self._latency_ewma is None:
+                    self._latency_ewma = latency
+                else:
+                    self._latency_ewma = LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self._latency_ewma
+                self._latency_samples += 1
+            self._healthy_calls += 1
+            if self.concurrency_limit < self.max_concurrency and self._healthy_calls >= self.concurrency_limit:
+                self._healthy_calls = 0
+                self.concurrency_limit += 1
+                self.metrics["ramp_ups"] += 1
+
+    def _backoff(self, reason):
+        # caller holds self._lock
+        self._healthy_calls = 0
+        new_limit = max(1, self.concurrency_limit // 2)
+        if new_limit != self.concurrency_limit:
+            self.metrics["backoffs"] += 1
+            logging.warning(f"Rate limiter for {self.model} reduced concurrency from {self.concurrency_limit} to {new_limit} after {reason}")
+            self.concurrency_limit = new_limit
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "max_concurrency": self.max_concurrency,
+                "concurrency_limit": self.concurrency_limit,
+                "in_flight": self.in_flight,
+                "average_latency": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+                **self.metrics,
+                "wait_seconds": round(self.metrics["wait_seconds"], 3),
+            }
+
+
+class RateLimitFeedbackHandler(BaseCallbackHandler):
+    """
+    Callback that releases limiter slots and reports latency, token usage and errors.
+
+    A run is registered in the context when it starts and marked as holding a slot only
+    once the limiter let it through, so a call cancelled while waiting for a slot is
+    never released, and each slot is released once: by the end or error of its run,
+    or by release_abandoned for runs cancelled mid-flight.
+    """
+
+    run_inline = True
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self._start_times = {}
+        self._pending = {}
+        self._slots = set()
+        self._lock = threading.Lock()
+
+    def _start(self, run_id):
+        self._start_times[run_id] = time.monotonic()
+        pending = _pending_runs.get()
+        if pending is None:
+            pending = []
+            _pending_runs.set(pending)
+        pending.append((self, run_id))
+        self._pending[run_id] = pending
+
+    def _finish(self, run_id):
+        """Forget a run; returns whether it still held a limiter slot."""
+        pending = self._pending.pop(run_id, None)
+        if pending is not None and (self, run_id) in pending:
+            pending.remove((self, run_id))
+        with self._lock:
+            if run_id in self._slots:
+                self._slots.discard(run_id)
+                return True
+        return False
+
+    def slot_acquired(self, run_id):
+        with self._lock:
+            self._slots.add(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._start_times.pop(run_id, None)
+        latency = time.monotonic() - start if start is not None else None
+        self.limiter.release(latency=latency, tokens=get_response_token_count(response), slot=self._finish(run_id))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._start_times.pop(run_id, None)
+        self.limiter.release(error=error, slot=self._finish(run_id))
+
+    def release_abandoned(self):
+        # calls cancelled mid-flight (hedge losers, cancelled files) never report an end or error
+        with self._lock:
+            abandoned = list(self._slots)
+            self._slots.clear()
+        for run_id in abandoned:
+            self._start_times.pop(run_id, None)
+            self.limiter.release(abandoned=True)
+        return len(abandoned)
+
+
+def release_abandoned_calls(llm):
+    """Release the limiter slots of calls of an LLM copy from get_llm that were cancelled before they ended."""
+    handlers = getattr(getattr(llm, "callbacks", None), "handlers", None) or []
+    released = sum(handler.release_abandoned() for handler in handlers if isinstance(handler, RateLimitFeedbackHandler))
+    if released:
+        logging.info(f"Released {released} rate limiter slots of cancelled calls")
+    return released
+
+
+def get_response_token_count(response):
+    usage = response.llm_output.get("token_usage") if response.llm_output else None
+    if usage:
+        return usage.get("total_tokens") or (usage.get("prompt_tokens") or usage.get("input_tokens") or 0) + (usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+    total = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                total += metadata.get("total_tokens") or metadata.get("input_tokens", 0) + metadata.get("output_tokens", 0)
+    return total
+
+
+def get_rate_limiter(model):
+    """
+    Return the shared limiter for a model key (e.g. OPENAI_GPT_5_4_MINI).
+
+    Budgets come from LLM_RATE_LIMIT_<MODEL> or LLM_RATE_LIMIT_DEFAULT as
+    "requests_per_minute,tokens_per_minute,max_concurrency"; 0 disables a budget.
+    Returns None unless ENABLE_LLM_RATE_LIMITER is true, so LLM calls stay unlimited by default.
+    """
+    if not get_value_from_env("ENABLE_LLM_RATE_LIMITER", "False", "bool"):
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            config = get_value_from_env(f"LLM_RATE_LIMIT_{model}") or get_value_from_env("LLM_RATE_LIMIT_DEFAULT", "0,0,8")
+            try:
+                requests_per_minute, tokens_per_minute, max_concurrency = [int(value.strip() or 0) for value in config.split(",")]
+            except ValueError:
+                logging.error(f"Invalid rate limit config '{config}' for model {model}, expected 'rpm,tpm,max_concurrency'")
+                requests_per_minute, tokens_per_minute, max_concurrency = 0, 0, 8
+            limiter = ModelRateLimiter(model, requests_per_minute, tokens_per_minute, max_concurrency or 8)
+            _limiters[model] = limiter
+            logging.info(f"Rate limiter for {model}: rpm={requests_per_minute}, tpm={tokens_per_minute}, max_concurrency={limiter.max_concurrency}")
+        return limiter
+
+
+def get_rate_limiter_metrics():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.snapshot() for limiter in limiters]
+
+
+@register_collector
+def collect_rate_limiter_metrics():
+    return snapshot_families(get_rate_limiter_metrics(), ("model",), {
+        "concurrency_limit": ("gauge", "Current adaptive concurrency limit of the model."),
+        "in_flight": ("gauge", "LLM calls holding a rate limiter slot."),
+        "requests": ("counter", "LLM calls let through by the rate limiter."),
+        "errors": ("counter", "LLM calls that failed."),
+        "rate_limit_errors": ("counter", "LLM calls rejected by the provider for throttling."),
+        "backoffs": ("counter", "Times the concurrency limit was halved."),
+        "abandoned": ("counter", "LLM calls cancelled before they ended."),
+        "wait_seconds": ("counter", "Seconds calls waited for a rate limiter slot."),
+    }, "llm_rate_limiter_")
@@ -0,0 +1,82 @@
+"""
+Benchmark of YouTube chunk timestamp alignment on a synthetic 3-hour transcript:
+the offset index of align_chunks_to_transcript against the per-segment fuzzy matching
+it replaced, which is timed on a sample of chunks and extrapolated.
+
+    python youtube_alignment_benchmark.py --hours 3 --fuzzy-sample 20
+"""
+import argparse
+import random
+import re
+import time
+from datetime import timedelta
+
+from langchain_core.documents import Document
+from langchain_text_splitters import TokenTextSplitter
+
+from src.document_sources.youtube import _fuzzy_chunk_times, align_chunks_to_transcript
+
+WORDS = ("graph database node relationship property label index query cypher vector "
+         "embedding chunk entity community model transcript lecture student example "
+         "it's we'll \"quoted\" theorem proof algorithm").split()
+
+
+def make_transcript(hours, seconds_per_segment, seed):
+    """Segments shaped like youtube_transcript_api raw data: text, start and duration."""
+    rng = random.Random(seed)
+    segments = []
+    start = 0.0
+    while start < hours * 3600:
+        duration = round(rng.uniform(0.6, 1.4) * seconds_per_segment, 2)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 12)))
+        if rng.random() < 0.2:
+            text += "\n" + " ".join(rng.choice(WORDS) for _ in range(3))
+        segments.append({"text": text, "start": round(start, 2), "duration": duration})
+        start += duration
+    return segments
+
+
+def make_chunks(transcript, chunk_size, chunk_overlap):
+    # the path of get_chunkId_chunkDoc_list: combined transcript, bad characters stripped, token split, whitespace normalised
+    text = " ".join(segment["text"] for segment in transcript)
+    text = text.replace("\n", " ").replace('"', "").replace("'", "")
+    chunks = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents([Document(page_content=text)])
+    for chunk in chunks:
+        chunk.page_content = re.sub(r"\s+", " ", chunk.page_content).strip()
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--seconds-per-segment", type=float, default=3)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--fuzzy-sample", type=int, default=20, help="chunks timed with fuzzy matching")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    transcript = make_transcript(args.hours, args.seconds_per_segment, args.seed)
+    chunks = make_chunks(transcript, args.chunk_size, args.chunk_overlap)
+    print(f"{len(transcript)} transcript segments, {len(chunks)} chunks")
+
+    start = time.perf_counter()
+    align_chunks_to_transcript(chunks, transcript)
+    indexed = time.perf_counter() - start
+    print(f"offset index alignment : {indexed:.3f}s for all chunks")
+
+    sample = chunks[:args.fuzzy_sample]
+    start = time.perf_counter()
+    fuzzy_times = [_fuzzy_chunk_times(chunk, transcript) for chunk in sample]
+    fuzzy = (time.perf_counter() - start) / max(1, len(sample))
+    print(f"fuzzy matching         : {fuzzy:.3f}s per chunk, ~{fuzzy * len(chunks):.0f}s extrapolated for all chunks")
+
+    agreeing = sum(
+        1 for chunk, (fuzzy_start, _) in zip(sample, fuzzy_times)
+        if chunk.metadata["start_timestamp"] == str(timedelta(seconds=fuzzy_start)).split(".")[0]
+    )
+    print(f"start timestamps agreeing with fuzzy matching on the sample: {agreeing}/{len(sample)}")
+
+
+if __name__ == "__main__":
+    main()